@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Process Scan Benchmark
+Compares the psutil process-table scan (name + exe for every process) with the
+Linux /proc fast path in process_manager.scan_antigravity_processes
+
+A synthetic procfs tree is generated for each size so the comparison does not
+depend on the host: psutil is pointed at it through psutil.PROCFS_PATH and the
+fast path through its proc_root argument. Each tree contains a handful of
+Antigravity processes (main process, helpers and a language server) among
+ordinary ones.
+
+Usage (Linux only):
+    python benchmarks/process_scan.py [--sizes 1000 5000 20000] [--repeat 5]
+"""
+import argparse
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "gui"))
+
+import psutil
+
+from process_manager import _matches_antigravity, scan_antigravity_processes
+
+ANTIGRAVITY_PROCESSES = [
+    ("antigravity", "/usr/share/antigravity/antigravity"),
+    ("antigravity", "/usr/share/antigravity/antigravity"),
+    ("antigravity", "/usr/share/antigravity/antigravity"),
+    ("language_serve", "/usr/share/antigravity/resources/app/extensions/bin/language_server_linux_x64"),
+]
+OTHER_PROCESSES = [
+    ("bash", "/usr/bin/bash"),
+    ("python3", "/usr/bin/python3"),
+    ("sshd", "/usr/sbin/sshd"),
+    ("node", "/usr/local/bin/node"),
+    ("kworker/0:1", ""),
+]
+FIRST_PID = 1000
+
+
+def build_procfs(root: str, count: int):
+    """Create a procfs-like tree with `count` processes"""
+    with open(os.path.join(root, "stat"), "w") as f:
+        f.write(f"cpu  0 0 0 0 0 0 0 0 0 0\nbtime {int(time.time()) - 3600}\n")
+    for i in range(count):
+        pid = FIRST_PID + i
+        if i < len(ANTIGRAVITY_PROCESSES):
+            comm, exe = ANTIGRAVITY_PROCESSES[i]
+        else:
+            comm, exe = OTHER_PROCESSES[i % len(OTHER_PROCESSES)]
+        base = os.path.join(root, str(pid))
+        os.mkdir(base)
+        with open(os.path.join(base, "comm"), "w") as f:
+            f.write(comm + "\n")
+        with open(os.path.join(base, "cmdline"), "wb") as f:
+            f.write((exe + "\0--flag\0").encode() if exe else b"")
+        with open(os.path.join(base, "stat"), "w") as f:
+            # Fields after the name: state ppid ... starttime is field 22
+            fields = ["S", "1"] + ["0"] * 17 + [str(1000 + i)] + ["0"] * 30
+            f.write(f"{pid} ({comm}) " + " ".join(fields) + "\n")
+        if exe:
+            os.symlink(exe, os.path.join(base, "exe"))
+
+
+def psutil_scan():
+    """The previous implementation: resolve name and exe of every process"""
+    found = []
+    for proc in psutil.process_iter(['name', 'exe']):
+        try:
+            if _matches_antigravity(proc.info['name'], proc.info.get('exe'), "Linux"):
+                found.append(proc.pid)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    return found
+
+
+def timed(func, repeat: int):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Antigravity process scanning")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if platform.system() != "Linux":
+        print("The /proc fast path is Linux only")
+        return 1
+
+    print(f"{'processes':>10} {'psutil (ms)':>12} {'/proc (ms)':>11} {'speedup':>8} {'found':>6}")
+    for size in args.sizes:
+        root = tempfile.mkdtemp(prefix="procfs-bench-")
+        try:
+            build_procfs(root, size)
+            psutil.PROCFS_PATH = root
+            legacy_ms, legacy = timed(psutil_scan, args.repeat)
+            fast_ms, fast = timed(lambda: scan_antigravity_processes(proc_root=root), args.repeat)
+            if sorted(legacy) != sorted(fast):
+                print(f"  mismatch at {size}: psutil {sorted(legacy)} vs /proc {sorted(fast)}")
+            print(f"{size:>10} {legacy_ms:>12.1f} {fast_ms:>11.1f} {legacy_ms / fast_ms:>7.1f}x {len(fast):>6}")
+        finally:
+            psutil.PROCFS_PATH = "/proc"
+            shutil.rmtree(root, ignore_errors=True)
+
+    host_ms, _ = timed(psutil_scan, args.repeat)
+    fast_ms, _ = timed(scan_antigravity_processes, args.repeat)
+    print(f"{'host':>10} {host_ms:>12.1f} {fast_ms:>11.1f} {host_ms / fast_ms:>7.1f}x"
+          f"   ({len(psutil.pids())} processes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
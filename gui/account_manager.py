@@ -1,23 +1,59 @@
 # -*- coding: utf-8 -*-
+import contextlib
 import json
 import os
 import time
 import uuid
+import heapq
+import itertools
+import shutil
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
 # Use relative imports
-from utils import info, error, warning, get_accounts_file_path, get_app_data_dir
-from db_manager import backup_account, restore_account, get_current_account_info
-from process_manager import close_antigravity, start_antigravity
+from utils import (
+    info, error, warning, log_context, get_accounts_file_path, get_app_data_dir, get_antigravity_db_paths,
+    get_instances_dir
+)
+from db_manager import (
+    backup_account, restore_account, seed_database, refresh_database, swap_database,
+    get_current_account_info, delete_backup_file
+)
+from backup_generations import list_generations
+from process_manager import (
+    close_antigravity, start_antigravity, get_process_watcher, launch_instance, list_instances,
+    instance_db_path
+)
 from config_manager import get_config
+from search_index import TrigramIndex
+from maintenance_scheduler import user_operation
 
 # Thread lock for file operations
 _accounts_lock = threading.Lock()
 
-def load_accounts():
-    """加载账号列表 (线程安全)"""
+# 并行启动独立实例时串行化 last_used 的读-改-写
+_instance_accounts_lock = threading.Lock()
+
+# 本进程内账号列表的写入次数，配合文件签名判断缓存是否过期
+_registry_version = 0
+
+def _registry_signature():
+    """账号列表的签名 (写入次数, mtime, size)，用于判断缓存是否过期"""
+    try:
+        st = get_accounts_file_path().stat()
+        return (_registry_version, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return (_registry_version, None, None)
+
+def load_accounts(strict=False):
+    """加载账号列表 (线程安全)
+
+    Args:
+        strict: 为 True 时读取或解析失败直接抛出异常 (不备份损坏的文件)，
+                供不能把读取失败当作"没有账号"的调用方使用 (例如清理孤立备份)
+    """
     with _accounts_lock:
         file_path = get_accounts_file_path()
         if not file_path.exists():
@@ -25,8 +61,13 @@ def load_accounts():
         
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                accounts = json.load(f)
+            if strict and not isinstance(accounts, dict):
+                raise ValueError("账号列表格式错误")
+            return accounts
         except json.JSONDecodeError as e:
+            if strict:
+                raise
             error(f"账号列表文件损坏: {e}")
             # Backup corrupted file
             backup_path = file_path.with_suffix('.json.corrupted')
@@ -37,11 +78,14 @@ def load_accounts():
                 pass
             return {}
         except Exception as e:
+            if strict:
+                raise
             error(f"Failed to Load Account List: {e}")
             return {}
 
 def save_accounts(accounts):
     """保存账号列表 (线程安全，原子写入)"""
+    global _registry_version
     with _accounts_lock:
         file_path = get_accounts_file_path()
         temp_path = file_path.with_suffix('.json.tmp')
@@ -53,7 +97,8 @@ def save_accounts(accounts):
             
             # Atomic rename
             temp_path.replace(file_path)
-            return True
+            _registry_version += 1
+            signature = _registry_signature()
         except Exception as e:
             error(f"Failed to Save Account List: {e}")
             # Clean up temp file
@@ -64,8 +109,17 @@ def save_accounts(accounts):
                     pass
             return False
 
+    # 在释放文件锁之后增量更新内存索引 (避免与 get_account_index 交叉加锁)
+    _refresh_account_index(accounts, signature)
+    return True
+
 def add_account_snapshot(name=None, email=None):
     """添加当前状态为新账号，如果邮箱已存在则覆盖"""
+    # 进行期间后台维护暂停
+    with user_operation():
+        return _add_account_snapshot(name, email)
+
+def _add_account_snapshot(name, email):
     # 0. 自动获取信息
     if not email:
         info("Attempting to Read Account Information from Database ...")
@@ -118,7 +172,8 @@ def add_account_snapshot(name=None, email=None):
     
     # 2. 执行备份
     info(f"正在备份当前状态为账号: {name}")
-    if not backup_account(email, str(backup_path)):
+    max_generations = get_config().get("max_backups_per_account", 5)
+    if not backup_account(email, str(backup_path), generations=max_generations):
         error("备份失败，取消添加账号")
         return False
     
@@ -133,6 +188,8 @@ def add_account_snapshot(name=None, email=None):
     }
     
     if save_accounts(accounts):
+        # 备份的就是 state.vscdb，它现在属于这个账号
+        _write_current_profile(account_id)
         if existing_account:
             info(f"账号 {name} ({email}) 备份已更新")
         else:
@@ -154,11 +211,25 @@ def delete_account(account_id):
     # 删除备份文件
     if backup_file and os.path.exists(backup_file):
         try:
-            os.remove(backup_file)
+            delete_backup_file(backup_file)
             info(f"备份文件已删除: {backup_file}")
         except Exception as e:
             warning(f"删除备份文件失败: {e}")
     
+    # 删除 swap 切换方式预先准备的数据库
+    shutil.rmtree(get_profiles_dir() / account_id, ignore_errors=True)
+    if _read_current_profile() == account_id:
+        with contextlib.suppress(OSError):
+            _current_profile_file().unlink()
+    
+    # 删除独立实例目录 (实例仍在运行时保留)
+    instance_dir = get_instance_dir(account_id)
+    if instance_dir.exists():
+        if str(instance_dir) in list_instances():
+            warning(f"账号的独立实例仍在运行，保留实例目录: {instance_dir}")
+        else:
+            shutil.rmtree(instance_dir, ignore_errors=True)
+    
     # 从列表中移除
     del accounts[account_id]
     if save_accounts(accounts):
@@ -166,9 +237,61 @@ def delete_account(account_id):
         return True
     return False
 
-def switch_account(account_id):
-    """切换到指定账号"""
+def set_rotation_options(account_id, weight=None, excluded=None):
+    """设置账号的轮换参数
+
+    Args:
+        account_id: 账号 ID
+        weight: 轮换权重 (>0)，权重越大冷却越短，越常被选中
+        excluded: 是否将账号排除在自动轮换之外
+    """
+    accounts = load_accounts()
+    if account_id not in accounts:
+        error("账号不存在")
+        return False
+
+    if weight is not None:
+        if weight <= 0:
+            error(f"无效的轮换权重: {weight}")
+            return False
+        accounts[account_id]["rotation_weight"] = float(weight)
+    if excluded is not None:
+        accounts[account_id]["rotation_excluded"] = bool(excluded)
+
+    return save_accounts(accounts)
+
+def switch_account(account_id, generation=0, wait_ready=None, strategy=None):
+    """切换到指定账号
+
+    Args:
+        account_id: 账号 ID
+        generation: 要恢复的备份版本 (0 = 最新，1 = 上一个版本 ...)
+        wait_ready: 是否等待 Antigravity 启动就绪后再返回 (None = 使用配置 wait_for_ready)；
+                    等待时返回值表示是否在 ready_timeout 内就绪
+        strategy: 切换方式 (None = 使用配置 switch_strategy)
+                  "restore": 把备份中的账号字段写入 state.vscdb
+                  "swap": 用重命名换入该账号预先准备好的 state.vscdb (见 prepare_account_profile)
+                  "instance": 启动或切到该账号的独立实例 (见 launch_account_instance)
+    """
+    # 切换期间后台维护暂停，避免与切换争抢磁盘
+    watcher = get_process_watcher()
+    watcher.publish("switching", account_id=account_id, generation=generation)
+    start = time.perf_counter()
+    ok = False
+    try:
+        # 切换期间的所有日志事件 (数据库、进程) 都带上 account_id
+        with user_operation(), log_context(account_id=account_id):
+            ok = _switch_account(account_id, generation, wait_ready, strategy)
+        return ok
+    finally:
+        elapsed = time.perf_counter() - start
+        info(f"切换账号耗时 {elapsed * 1000:.0f} ms", event="switch", account_id=account_id,
+             duration=elapsed, ok=ok, strategy=strategy or get_config().get("switch_strategy", "restore"))
+        watcher.publish("switched", account_id=account_id, generation=generation, ok=ok, seconds=elapsed)
+
+def _switch_account(account_id, generation, wait_ready=None, strategy=None):
     config = get_config()
+    strategy = strategy or config.get("switch_strategy", "restore")
     accounts = load_accounts()
     
     if account_id not in accounts:
@@ -183,8 +306,20 @@ def switch_account(account_id):
         error(f"备份文件丢失: {backup_file}")
         return False
     
+    if strategy == "instance":
+        # 独立实例模式: 不关闭其他账号，启动或切到该账号自己的实例
+        return _launch_account_instance(account_id, accounts, generation=generation, wait_ready=wait_ready)
+    
     info(f"准备切换到账号: {name}")
     
+    target_time = None
+    if generation:
+        generations = list_generations(backup_file)
+        if generation >= len(generations):
+            error(f"备份不存在第 {generation} 个历史版本")
+            return False
+        target_time = generations[generation]["backup_time"]
+    
     # Auto-backup current account before switching (if enabled)
     if config.get("auto_backup_on_switch", True):
         info("自动备份当前账号...")
@@ -193,30 +328,695 @@ def switch_account(account_id):
         except Exception as e:
             warning(f"自动备份失败: {e}")
     
+    # 自动备份可能为同一账号新增了历史版本 (并清理掉最旧的版本)，按备份时间重新定位目标版本
+    if target_time is not None:
+        for item in list_generations(backup_file):
+            if item["backup_time"] == target_time:
+                generation = item["generation"]
+                break
+        else:
+            error(f"自动备份后目标历史版本 ({target_time}) 已被清理，已取消切换")
+            return False
+    
+    # swap: 在关闭 Antigravity 之前准备好目标数据库，关闭期间只做重命名
+    profile_db = None
+    if strategy == "swap":
+        if generation:
+            info("指定了历史版本，使用 restore 方式切换")
+        else:
+            profile_db = _prepare_swap_profile(account_id, account)
+    
     # 1. 关闭进程
     close_timeout = config.get("process_close_timeout", 10)
     if not close_antigravity(timeout=close_timeout):
         # 尝试继续，但给出警告
         warning("无法关闭 Antigravity，尝试强制恢复...")
+        if profile_db is not None:
+            warning("Antigravity 未关闭，不交换数据库，改用 restore 方式")
+            profile_db = None
     
     # 2. 恢复数据
-    if restore_account(backup_file):
-        # 更新最后使用时间
+    restored = profile_db is not None and _swap_to_profile(account_id, accounts, profile_db)
+    if not restored:
+        restored = restore_account(backup_file, generation=generation)
+    if restored:
+        # 更新最后使用时间，记录 state.vscdb 当前属于哪个账号
         accounts[account_id]["last_used"] = datetime.now().isoformat()
         save_accounts(accounts)
+        _write_current_profile(account_id)
         
         # 3. 启动进程
-        start_antigravity()
+        if wait_ready is None:
+            wait_ready = config.get("wait_for_ready", False)
+        if not start_antigravity(wait_ready=wait_ready, ready_timeout=config.get("ready_timeout", 30)):
+            if wait_ready:
+                error(f"已恢复账号 {name}，但 Antigravity 未能在超时内就绪")
+                return False
+            warning("Antigravity 启动命令发送失败，请手动启动")
         info(f"切换到账号 {name} 成功")
         return True
     else:
         error("恢复数据失败")
         return False
 
-def list_accounts_data():
-    """获取账号列表数据 (用于显示)"""
+def get_profiles_dir():
+    """swap 切换方式下各账号预先准备的 state.vscdb 所在目录"""
+    return get_app_data_dir() / "profiles"
+
+def get_profile_db(account_id):
+    """账号预先准备的 state.vscdb"""
+    return get_profiles_dir() / account_id / "state.vscdb"
+
+def _current_profile_file():
+    return get_profiles_dir() / "current.json"
+
+def _read_current_profile():
+    """当前 state.vscdb 属于的账号 ID (未知时返回 None)"""
+    try:
+        with open(_current_profile_file(), 'r', encoding='utf-8') as f:
+            return json.load(f).get("account_id")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _write_current_profile(account_id):
+    path = _current_profile_file()
+    temp_path = path.with_suffix('.json.tmp')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"account_id": account_id, "time": datetime.now().isoformat()}, f)
+        temp_path.replace(path)
+    except OSError as e:
+        warning(f"无法记录当前账号: {e}")
+
+def _live_db_owner(accounts):
+    """state.vscdb 中实际登录的账号
+
+    记录的账号 (current.json) 邮箱一致时优先；否则按邮箱查找 (用户可能手动登录了
+    其他账号)。
+
+    Returns:
+        tuple: (账号 ID, 邮箱)；邮箱不属于任何账号时账号 ID 为 None，读不出邮箱时均为 None
+    """
+    current_info = get_current_account_info()
+    email = current_info.get("email") if current_info else None
+    if not email:
+        return None, None
+    current = _read_current_profile()
+    if current in accounts and accounts[current].get("email") == email:
+        return current, email
+    return next((acc_id for acc_id, acc in accounts.items() if acc.get("email") == email), None), email
+
+def sync_current_profile(accounts=None):
+    """按 state.vscdb 中实际登录的账号更新 current.json，无法对应到账号时删除记录"""
+    if accounts is None:
+        accounts = load_accounts()
+    owner, _ = _live_db_owner(accounts)
+    if owner:
+        if owner != _read_current_profile():
+            _write_current_profile(owner)
+    else:
+        with contextlib.suppress(OSError):
+            _current_profile_file().unlink()
+
+def _live_db_path():
+    """swap 交换的 state.vscdb (第一个存在的候选路径)"""
+    db_paths = get_antigravity_db_paths()
+    for db_path in db_paths:
+        if db_path.exists():
+            return db_path
+    return db_paths[0] if db_paths else None
+
+def prepare_account_profile(account_id, refresh=False):
+    """为 swap 切换方式生成账号的 state.vscdb
+
+    以当前的 state.vscdb 为模板 (保留界面、扩展等非账号状态)，写入账号备份中的
+    字段。已存在的数据库只在 refresh=True 或备份比它新时更新账号字段。
+
+    Returns:
+        数据库路径；失败时返回 None
+    """
     accounts = load_accounts()
-    data = list(accounts.values())
-    # 按最后使用时间倒序排序
-    data.sort(key=lambda x: x.get("last_used", ""), reverse=True)
-    return data
+    account = accounts.get(account_id)
+    if not account:
+        error("账号不存在")
+        return None
+    return _prepare_swap_profile(account_id, account, refresh)
+
+def _prepare_swap_profile(account_id, account, refresh=False):
+    backup_file = account.get("backup_file")
+    profile_db = get_profile_db(account_id)
+    if profile_db.exists():
+        try:
+            stale = refresh or os.path.getmtime(backup_file) > os.path.getmtime(profile_db)
+        except OSError:
+            stale = False
+        if stale and _read_current_profile() != account_id:
+            info(f"备份比已准备的数据库新，更新账号字段: {profile_db}")
+            if not refresh_database(profile_db, backup_file):
+                return None
+        return profile_db
+    if _read_current_profile() == account_id and _live_db_owner({account_id: account})[0] == account_id:
+        # state.vscdb 本身就是该账号的数据库 (已按邮箱确认)，无需准备
+        return profile_db
+    if not seed_database(profile_db, backup_file, template_db=_live_db_path()):
+        return None
+    return profile_db
+
+def prepare_account_profiles(account_ids=None):
+    """为多个账号 (默认全部) 生成 swap 切换用的数据库
+
+    Returns:
+        {account_id: 是否成功}
+    """
+    accounts = load_accounts()
+    if account_ids is None:
+        account_ids = list(accounts)
+    results = {}
+    with user_operation():
+        for account_id in account_ids:
+            account = accounts.get(account_id)
+            results[account_id] = bool(account) and _prepare_swap_profile(account_id, account) is not None
+    return results
+
+def _swap_to_profile(account_id, accounts, profile_db):
+    """用重命名把账号的数据库换成 state.vscdb，原数据库保存为其所属账号的数据库"""
+    db_path = _live_db_path()
+    if db_path is None:
+        error("未找到 Antigravity 数据库路径")
+        return False
+    
+    # 按数据库中实际登录的邮箱决定换出的数据库归谁，识别不出则单独保存
+    current, email = _live_db_owner(accounts)
+    recorded = _read_current_profile()
+    if recorded in accounts and recorded != current:
+        warning(f"当前数据库登录的是 {email or '未知账号'}，不是记录的账号 "
+                f"{accounts[recorded].get('name')}，按实际账号保存")
+    if current == account_id:
+        # state.vscdb 已经是该账号的数据库
+        info("当前数据库已属于该账号，无需交换")
+        return True
+    outgoing_db = get_profile_db(current or "_unassigned")
+    
+    try:
+        swap_database(db_path, profile_db, outgoing_db)
+        return True
+    except OSError as e:
+        # 例如数据目录与 Antigravity 配置目录不在同一文件系统 (EXDEV)
+        warning(f"交换数据库失败: {e}，改用 restore 方式")
+        return False
+
+def get_instance_dir(account_id):
+    """账号独立实例的 --user-data-dir"""
+    return get_instances_dir() / account_id
+
+def launch_account_instance(account_id, generation=0, wait_ready=None, reseed=False):
+    """以独立实例启动账号，实例已在运行时切到前台
+
+    实例目录首次启动时用账号备份创建 state.vscdb，之后沿用实例自己的数据库
+    (Antigravity 在实例中刷新的登录状态不会被旧备份覆盖)。与普通切换不同，
+    不需要关闭 Antigravity，也不会改动默认实例的数据库。
+
+    Args:
+        account_id: 账号 ID
+        generation: 创建实例数据库时使用的备份版本 (0 = 最新)；非 0 时总是重新创建
+                    实例数据库，实例正在运行时返回 False
+        wait_ready: 是否等待实例打开数据库后再返回 (None = 使用配置 wait_for_ready)
+        reseed: 实例未运行时，丢弃实例数据库并用备份重新创建
+    """
+    watcher = get_process_watcher()
+    watcher.publish("switching", account_id=account_id, generation=generation, instance=True)
+    start = time.perf_counter()
+    ok = False
+    try:
+        with user_operation(), log_context(account_id=account_id):
+            ok = _launch_account_instance(account_id, load_accounts(), generation, wait_ready, reseed)
+        return ok
+    finally:
+        elapsed = time.perf_counter() - start
+        info(f"启动实例耗时 {elapsed * 1000:.0f} ms", event="instance_launch", account_id=account_id,
+             duration=elapsed, ok=ok)
+        watcher.publish("switched", account_id=account_id, generation=generation, instance=True, ok=ok,
+                        seconds=elapsed)
+
+def _launch_account_instance(account_id, accounts, generation=0, wait_ready=None, reseed=False):
+    config = get_config()
+    account = accounts.get(account_id)
+    if not account:
+        error("账号不存在")
+        return False
+    name = account.get("name", "Unknown")
+    
+    instance_dir = get_instance_dir(account_id)
+    db_path = instance_db_path(instance_dir)
+    running = str(instance_dir) in list_instances()
+    if generation:
+        # 指定历史版本时总是用该版本重新创建实例数据库，不能沿用已有的数据库
+        if running:
+            error(f"账号 {name} 的实例正在运行，无法恢复第 {generation} 个历史版本，请先关闭实例")
+            return False
+        reseed = True
+    if reseed and running:
+        warning(f"账号 {name} 的实例正在运行，不重新创建数据库")
+    elif reseed or not db_path.exists():
+        backup_file = account.get("backup_file")
+        if not backup_file or not os.path.exists(backup_file):
+            error(f"备份文件丢失: {backup_file}")
+            return False
+        if not seed_database(db_path, backup_file, generation=generation):
+            error(f"无法创建账号 {name} 的实例数据库")
+            return False
+    
+    if wait_ready is None:
+        wait_ready = config.get("wait_for_ready", False)
+    result = launch_instance(instance_dir, executable=config.get("antigravity_executable") or None,
+                             wait_ready=wait_ready, ready_timeout=config.get("ready_timeout", 30))
+    if not result["ok"]:
+        return False
+    if wait_ready and not result["ready"]:
+        error(f"账号 {name} 的实例未能在超时内就绪")
+        return False
+    
+    # 更新最后使用时间 (重新读取，避免覆盖并行启动的其他账号的更新)
+    with _instance_accounts_lock:
+        accounts = load_accounts()
+        if account_id in accounts:
+            accounts[account_id]["last_used"] = datetime.now().isoformat()
+            save_accounts(accounts)
+    info(f"账号 {name} 的实例已{'切到前台' if result['running'] else '启动'}")
+    return True
+
+def launch_account_instances(account_ids, wait_ready=None, reseed=False):
+    """并行启动多个账号的独立实例 (创建数据库、启动与等待就绪同时进行)
+
+    Returns:
+        {account_id: 是否成功}
+    """
+    account_ids = list(dict.fromkeys(account_ids))
+    if not account_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(8, len(account_ids))) as pool:
+        futures = {account_id: pool.submit(launch_account_instance, account_id, 0, wait_ready, reseed)
+                   for account_id in account_ids}
+    return {account_id: future.result() for account_id, future in futures.items()}
+
+def close_account_instance(account_id):
+    """关闭账号的独立实例"""
+    config = get_config()
+    return close_antigravity(timeout=config.get("process_close_timeout", 10),
+                             user_data_dir=str(get_instance_dir(account_id)))
+
+def list_account_instances():
+    """所有账号的独立实例状态
+
+    Returns:
+        List[Dict]: id, name, email, user_data_dir, seeded (实例数据库是否已创建), pids (运行中的进程)
+    """
+    running = list_instances()
+    result = []
+    for account_id, account in load_accounts().items():
+        instance_dir = get_instance_dir(account_id)
+        seeded = instance_db_path(instance_dir).exists()
+        pids = running.get(str(instance_dir), [])
+        if not seeded and not pids:
+            continue
+        result.append({
+            "id": account_id,
+            "name": account.get("name"),
+            "email": account.get("email"),
+            "user_data_dir": str(instance_dir),
+            "seeded": seeded,
+            "pids": pids,
+        })
+    return result
+
+def list_account_generations(account_id):
+    """获取账号备份的全部版本 (0 = 当前版本)，账号不存在时返回空列表"""
+    accounts = load_accounts()
+    account = accounts.get(account_id)
+    if not account or not account.get("backup_file"):
+        return []
+    return list_generations(account["backup_file"])
+
+def switch_to_next_account(exclude=None, wait_ready=None, strategy=None):
+    """按轮换策略切换到下一个账号"""
+    account = next_rotation_account(exclude=exclude)
+    if not account:
+        error("没有可轮换的账号 (全部被排除或处于冷却期)")
+        return False
+    info(f"轮换选中账号: {account.get('name')} ({account.get('email')})")
+    return switch_account(account["id"], wait_ready=wait_ready, strategy=strategy)
+
+def list_accounts_data(query=None, offset=0, limit=None, sort="last_used", fuzzy=True):
+    """获取账号列表数据 (用于显示)
+
+    Args:
+        query: 搜索关键字 (匹配名称或邮箱，不区分大小写)
+        offset: 分页起始位置
+        limit: 每页数量，None 表示返回全部
+        sort: 排序方式，见 ACCOUNT_SORT_KEYS
+        fuzzy: 是否追加容错的模糊匹配结果
+
+    Returns:
+        AccountPage: 当前页的账号列表，total 属性为匹配的总数
+    """
+    return get_account_index().query(query=query, offset=offset, limit=limit, sort=sort, fuzzy=fuzzy)
+
+# -------------------------------------------------------------------------
+# 账号轮换调度
+# -------------------------------------------------------------------------
+
+def _to_timestamp(iso_str):
+    """将 ISO 时间字符串转换为时间戳，无法解析时视为从未使用"""
+    if not iso_str:
+        return 0.0
+    try:
+        return datetime.fromisoformat(iso_str).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RotationScheduler:
+    """账号轮换调度器 (LRU 优先队列)
+
+    按 last_used 维护一个最小堆，堆顶即最久未使用的账号。
+    每个账号的就绪时间为 last_used + cooldown / weight，
+    被排除 (rotation_excluded) 的账号不进入队列。
+    本进程写入账号列表时由 _refresh_account_index 调用 update()/remove()
+    原地更新 (惰性删除)，选取和更新均为 O(log n)。
+    """
+
+    def __init__(self, cooldown_seconds=0):
+        self.cooldown_seconds = max(0, cooldown_seconds)
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, accounts):
+        """从账号字典重建队列 (O(n))"""
+        self._heap = []
+        self._entries = {}
+        for acc_id, acc_data in accounts.items():
+            entry = self._make_entry(acc_id, acc_data)
+            if entry:
+                self._entries[acc_id] = entry
+                self._heap.append(entry)
+        heapq.heapify(self._heap)
+
+    def _make_entry(self, account_id, acc_data):
+        if acc_data.get("rotation_excluded"):
+            return None
+        try:
+            weight = float(acc_data.get("rotation_weight", 1.0))
+        except (TypeError, ValueError):
+            weight = 1.0
+        if weight <= 0:
+            weight = 1.0
+        last_used = _to_timestamp(acc_data.get("last_used"))
+        ready_at = last_used + self.cooldown_seconds / weight
+        # [就绪时间, 最后使用时间, 序号, 账号 ID, 是否有效]
+        return [ready_at, last_used, next(self._counter), account_id, True]
+
+    def update(self, account_id, acc_data):
+        """账号使用后更新其在队列中的位置"""
+        self.remove(account_id)
+        entry = self._make_entry(account_id, acc_data)
+        if entry:
+            self._entries[account_id] = entry
+            heapq.heappush(self._heap, entry)
+
+    def remove(self, account_id):
+        entry = self._entries.pop(account_id, None)
+        if entry:
+            entry[-1] = False
+
+    def _pop_stale(self):
+        while self._heap and not self._heap[0][-1]:
+            heapq.heappop(self._heap)
+
+    def peek(self, now=None, exclude=None):
+        """返回下一个可用账号 ID (不改变队列)，没有则返回 None
+
+        Args:
+            now: 当前时间戳，默认 time.time()
+            exclude: 本次额外排除的账号 ID 集合
+        """
+        if now is None:
+            now = time.time()
+        exclude = exclude or ()
+        skipped = []
+        result = None
+
+        self._pop_stale()
+        while self._heap:
+            entry = self._heap[0]
+            if entry[0] > now:
+                # 堆顶仍在冷却期，其余账号更晚就绪
+                break
+            if entry[3] in exclude:
+                skipped.append(heapq.heappop(self._heap))
+                self._pop_stale()
+                continue
+            result = entry[3]
+            break
+
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return result
+
+
+_rotation_scheduler = None
+_rotation_signature = None
+
+
+def get_rotation_scheduler():
+    """获取轮换调度器
+
+    本进程的写入由 _refresh_account_index 原地更新；只有首次使用、冷却时间
+    变化或账号列表被其他进程修改时才整体重建。
+    """
+    global _rotation_scheduler, _rotation_signature
+    cooldown = get_config().get("rotation_cooldown_minutes", 0) * 60
+    index = get_account_index()
+    with _account_index_lock:
+        if (_rotation_scheduler is None
+                or _rotation_signature != _account_index_signature
+                or _rotation_scheduler.cooldown_seconds != cooldown):
+            scheduler = RotationScheduler(cooldown_seconds=cooldown)
+            scheduler.load(index.accounts)
+            _rotation_scheduler = scheduler
+            _rotation_signature = _account_index_signature
+        return _rotation_scheduler
+
+
+def _current_account_id(index):
+    """当前使用的账号：优先读取切换时记录的账号，未记录时按数据库中的邮箱识别"""
+    account_id = _read_current_profile()
+    if account_id in index.accounts:
+        return account_id
+    current = get_current_account_info()
+    if current and current.get("email"):
+        return index.find_by_email(current["email"])
+    return None
+
+
+def next_rotation_account(exclude=None):
+    """获取轮换队列中的下一个账号 (最久未使用且不在冷却期)
+
+    当前正在使用的账号会被自动跳过。
+    """
+    index = get_account_index()
+    exclude = set(exclude or ())
+    current_id = _current_account_id(index)
+    if current_id:
+        exclude.add(current_id)
+
+    account_id = get_rotation_scheduler().peek(exclude=exclude)
+    accounts = index.accounts
+    if account_id is None or account_id not in accounts:
+        return None
+    return dict(accounts[account_id])
+
+
+# -------------------------------------------------------------------------
+# 账号列表索引 (排序 + 搜索)
+# -------------------------------------------------------------------------
+
+# 排序方式: (字段, 是否倒序)
+ACCOUNT_SORT_KEYS = {
+    "last_used": ("last_used", True),
+    "created_at": ("created_at", True),
+    "name": ("name", False),
+    "email": ("email", False),
+}
+
+
+class AccountPage(list):
+    """一页账号数据，total 为匹配的账号总数"""
+
+    def __init__(self, items=(), total=0, offset=0):
+        super().__init__(items)
+        self.total = total
+        self.offset = offset
+
+
+class AccountIndex:
+    """账号列表的内存索引
+
+    每种排序方式的有序 ID 列表按需构建并缓存；搜索先按子串精确匹配，
+    再用三元组 (trigram) 索引补充容错的模糊匹配。三元组索引在加载账号列表时
+    构建，子串匹配也先用它缩小候选范围。本进程写入账号列表时通过 apply()
+    增量更新，外部修改文件时由 get_account_index() 整体重建。
+    """
+
+    def __init__(self, accounts):
+        self.accounts = {}
+        self._sorted = {}
+        self._positions = {}
+        self._search_text = {}
+        self._by_email = {}
+        self._trigrams = TrigramIndex()
+        for acc_id, acc in accounts.items():
+            self._index(acc_id, acc)
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def _index(self, account_id, acc):
+        text = f"{acc.get('name', '')}\n{acc.get('email', '')}".lower()
+        old_email = self.accounts.get(account_id, {}).get("email")
+        if old_email != acc.get("email") and self._by_email.get(old_email) == account_id:
+            del self._by_email[old_email]
+        if acc.get("email"):
+            self._by_email[acc["email"]] = account_id
+        self.accounts[account_id] = dict(acc)
+        if self._search_text.get(account_id) != text:
+            self._search_text[account_id] = text
+            self._trigrams.add(account_id, text)
+
+    def _unindex(self, account_id):
+        email = self.accounts.pop(account_id, {}).get("email")
+        if self._by_email.get(email) == account_id:
+            del self._by_email[email]
+        self._search_text.pop(account_id, None)
+        self._trigrams.remove(account_id)
+
+    def find_by_email(self, email):
+        """按邮箱查找账号 ID，没有时返回 None"""
+        return self._by_email.get(email)
+
+    def apply(self, accounts):
+        """将新的账号列表增量应用到索引，只重新索引有变化的账号
+
+        Returns:
+            tuple: (有变化或新增的账号 ID 列表, 被删除的账号 ID 列表)
+        """
+        removed = [acc_id for acc_id in self.accounts if acc_id not in accounts]
+        for acc_id in removed:
+            self._unindex(acc_id)
+        changed = [acc_id for acc_id, acc in accounts.items() if self.accounts.get(acc_id) != acc]
+        for acc_id in changed:
+            self._index(acc_id, accounts[acc_id])
+        if changed or removed:
+            self._sorted = {}
+            self._positions = {}
+        return changed, removed
+
+    def sorted_ids(self, sort="last_used"):
+        if sort not in ACCOUNT_SORT_KEYS:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        ids = self._sorted.get(sort)
+        if ids is None:
+            field, reverse = ACCOUNT_SORT_KEYS[sort]
+            ids = sorted(
+                self.accounts,
+                key=lambda acc_id: str(self.accounts[acc_id].get(field) or "").lower(),
+                reverse=reverse,
+            )
+            self._sorted[sort] = ids
+        return ids
+
+    def _sort_positions(self, sort):
+        positions = self._positions.get(sort)
+        if positions is None:
+            positions = {acc_id: pos for pos, acc_id in enumerate(self.sorted_ids(sort))}
+            self._positions[sort] = positions
+        return positions
+
+    def search(self, query, sort="last_used", fuzzy=True):
+        """返回匹配关键字的账号 ID
+
+        子串匹配的结果按排序方式排在前面，其后是按相似度排序的模糊匹配
+        (可容忍拼写错误，关键字至少 3 个字符时启用)。
+        """
+        query = query.lower().strip()
+        candidates = self._trigrams.containing(query)
+        if candidates is None:
+            exact = [acc_id for acc_id in self.sorted_ids(sort) if query in self._search_text[acc_id]]
+            exact_set = set(exact)
+        else:
+            exact_set = {acc_id for acc_id in candidates if query in self._search_text[acc_id]}
+            # 命中较多时按已排好序的列表过滤，比对命中结果单独排序更快
+            if len(exact_set) * 8 > len(self.accounts):
+                exact = [acc_id for acc_id in self.sorted_ids(sort) if acc_id in exact_set]
+            else:
+                exact = sorted(exact_set, key=self._sort_positions(sort).__getitem__)
+        if not fuzzy or len(query) < 3:
+            return exact
+
+        positions = self._sort_positions(sort)
+        fuzzy_matches = [(score, acc_id) for acc_id, score in self._trigrams.search(query, exclude=exact_set).items()]
+        fuzzy_matches.sort(key=lambda item: (-item[0], positions[item[1]]))
+        return exact + [acc_id for _, acc_id in fuzzy_matches]
+
+    def query(self, query=None, offset=0, limit=None, sort="last_used", fuzzy=True):
+        if query and query.strip():
+            ids = self.search(query, sort, fuzzy=fuzzy)
+        else:
+            ids = self.sorted_ids(sort)
+
+        offset = max(0, offset)
+        end = None if limit is None else offset + max(0, limit)
+        page = [dict(self.accounts[acc_id]) for acc_id in ids[offset:end]]
+        return AccountPage(page, total=len(ids), offset=offset)
+
+
+_account_index = None
+_account_index_signature = None
+_account_index_lock = threading.Lock()
+
+
+def get_account_index():
+    """获取账号列表索引 (账号列表未变化时不重新读取文件)"""
+    global _account_index, _account_index_signature
+    with _account_index_lock:
+        signature = _registry_signature()
+        if _account_index is None or signature != _account_index_signature:
+            _account_index = AccountIndex(load_accounts())
+            _account_index_signature = signature
+        return _account_index
+
+
+def _refresh_account_index(accounts, signature):
+    """本进程写入账号列表后增量更新索引与轮换队列
+
+    索引记录的是本次写入时的签名；若其间又有其他写入，签名不一致，
+    下次 get_account_index() 会整体重建。轮换队列与索引同步时只更新
+    变化的账号 (例如切换后的 last_used)，否则留给 get_rotation_scheduler() 重建。
+    """
+    global _account_index_signature, _rotation_signature
+    with _account_index_lock:
+        if _account_index is None:
+            return
+        in_sync = _rotation_scheduler is not None and _rotation_signature == _account_index_signature
+        changed, removed = _account_index.apply(accounts)
+        _account_index_signature = signature
+        if in_sync:
+            for acc_id in removed:
+                _rotation_scheduler.remove(acc_id)
+            for acc_id in changed:
+                _rotation_scheduler.update(acc_id, accounts[acc_id])
+            _rotation_signature = signature
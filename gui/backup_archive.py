@@ -0,0 +1,525 @@
+# -*- coding: utf-8 -*-
+"""
+Account Archives
+Bulk export of many accounts into one tar.gz or zip archive, and bulk import
+from such an archive or a directory of backup files
+
+Layout:
+    backups/<account id>.agbk   self-contained v2 backup (values as compressed sections)
+    accounts.json               registry metadata of the exported accounts
+    SHA256SUMS                  "<sha256>  <member>" for every member above (sha256sum -c format)
+
+Backups are encoded in memory one at a time (a few are prepared ahead by worker
+threads) and streamed straight into the archive, so nothing is staged on disk and
+the archive can be written to a pipe.
+
+Import validates every backup in a thread pool, keeps only the newest backup per
+email (by backup_time), skips content already stored for that email, and writes all
+registry changes with a single save_accounts().
+"""
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils import info, error, warning, debug, get_app_data_dir
+
+ARCHIVE_FORMAT = "antigravity-accounts"
+ARCHIVE_VERSION = 1
+ACCOUNTS_MEMBER = "accounts.json"
+CHECKSUMS_MEMBER = "SHA256SUMS"
+BACKUPS_PREFIX = "backups/"
+BACKUP_SUFFIX = ".agbk"
+
+# Registry fields that only make sense on this machine
+_LOCAL_FIELDS = ("backup_file",)
+
+# Registry fields taken from an archive's accounts.json on import, with their types;
+# id, email and backup_file are always set by the importer
+_IMPORTED_FIELDS = {
+    "name": str,
+    "created_at": str,
+    "last_used": str,
+    "rotation_weight": (int, float),
+    "rotation_excluded": bool,
+}
+
+# Backup files picked up when importing a directory
+IMPORT_SUFFIXES = (".json", BACKUP_SUFFIX)
+
+
+class _TarWriter:
+    def __init__(self, fileobj):
+        # "w|gz" writes a pure stream: no seeking, so pipes work
+        self._tar = tarfile.open(fileobj=fileobj, mode="w|gz")
+
+    def add(self, name: str, data: bytes):
+        member = tarfile.TarInfo(name)
+        member.size = len(data)
+        member.mtime = int(time.time())
+        member.mode = 0o600
+        self._tar.addfile(member, io.BytesIO(data))
+
+    def close(self):
+        self._tar.close()
+
+
+class _ZipWriter:
+    def __init__(self, fileobj):
+        self._zip = zipfile.ZipFile(fileobj, mode="w", compression=zipfile.ZIP_DEFLATED)
+
+    def add(self, name: str, data: bytes):
+        # Backups are already compressed section by section
+        compress_type = zipfile.ZIP_STORED if name.endswith(BACKUP_SUFFIX) else zipfile.ZIP_DEFLATED
+        self._zip.writestr(zipfile.ZipInfo(name, time.localtime()[:6]), data, compress_type=compress_type)
+
+    def close(self):
+        self._zip.close()
+
+
+def archive_format_for(path: str) -> str:
+    """Guess the archive format ("zip" or "tar") from a file name"""
+    return "zip" if str(path).lower().endswith(".zip") else "tar"
+
+
+def _encode_account(account: Dict) -> bytes:
+    from db_manager import encode_backup_data, load_backup_data
+
+    payload, _ = encode_backup_data(load_backup_data(account["backup_file"]))
+    return payload
+
+
+def export_accounts(output, account_ids: Optional[Iterable[str]] = None, fmt: Optional[str] = None,
+                    workers: int = 4, job=None) -> Dict:
+    """
+    Export accounts and their backups into one archive
+
+    Args:
+        output: Destination path, "-" for stdout, or a writable binary file object
+        account_ids: Accounts to export (None = all)
+        fmt: "tar" (tar.gz) or "zip"; default from the output file name (tar for streams)
+        workers: Backups encoded ahead of the archive writer
+        job: Optional Job (jobs) for progress and cancellation; a cancelled export
+            removes its partial output file
+
+    Returns:
+        Dict with exported, failed (account ids), bytes (uncompressed member bytes),
+        elapsed_seconds and path (None for streams)
+    """
+    from account_manager import load_accounts
+
+    start = time.perf_counter()
+    accounts = load_accounts()
+    if account_ids is None:
+        account_ids = list(accounts)
+    selected = []
+    for account_id in account_ids:
+        if account_id not in accounts:
+            warning(f"账号不存在，跳过: {account_id}")
+        elif accounts[account_id].get("backup_file"):
+            selected.append(dict(accounts[account_id], id=account_id))
+
+    to_stdout = output == "-"
+    path = None if to_stdout or hasattr(output, "write") else str(output)
+    fmt = fmt or (archive_format_for(path) if path else "tar")
+    if fmt not in ("tar", "zip"):
+        raise ValueError(f"Unsupported archive format: {fmt}")
+
+    report = {"exported": 0, "failed": [], "bytes": 0, "elapsed_seconds": 0.0, "path": path}
+    if job is not None:
+        job.set_total(len(selected))
+    temp_path = f"{path}.tmp" if path else None
+
+    with contextlib.ExitStack() as stack:
+        if to_stdout:
+            fileobj = sys.stdout.buffer
+            # Log lines must not end up inside the archive stream
+            stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+        elif path:
+            fileobj = stack.enter_context(open(temp_path, 'wb'))
+        else:
+            fileobj = output
+
+        writer = _ZipWriter(fileobj) if fmt == "zip" else _TarWriter(fileobj)
+        checksums = []
+        exported = []
+
+        def add_member(name: str, data: bytes):
+            writer.add(name, data)
+            checksums.append((hashlib.sha256(data).hexdigest(), name))
+            report["bytes"] += len(data)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                # Bounded read-ahead: at most `workers` encoded backups held in memory
+                pending = deque()
+                queue = iter(selected)
+                for account in queue:
+                    pending.append((account, pool.submit(_encode_account, account)))
+                    if len(pending) >= workers:
+                        break
+                while pending:
+                    if job is not None:
+                        job.check()
+                    account, future = pending.popleft()
+                    next_account = next(queue, None)
+                    if next_account is not None:
+                        pending.append((next_account, pool.submit(_encode_account, next_account)))
+                    try:
+                        payload = future.result()
+                    except Exception as e:
+                        error(f"导出账号失败 {account.get('name', account['id'])}: {e}")
+                        report["failed"].append(account["id"])
+                        if job is not None:
+                            job.advance(1)
+                        continue
+                    member = f"{BACKUPS_PREFIX}{account['id']}{BACKUP_SUFFIX}"
+                    add_member(member, payload)
+                    entry = {k: v for k, v in account.items() if k not in _LOCAL_FIELDS}
+                    entry["backup"] = member
+                    exported.append(entry)
+                    debug(f"已导出: {account.get('name', account['id'])}")
+                    if job is not None:
+                        job.advance(1, len(payload))
+
+            registry = {
+                "format": ARCHIVE_FORMAT,
+                "version": ARCHIVE_VERSION,
+                "exported_at": datetime.now().isoformat(),
+                "accounts": exported,
+            }
+            add_member(ACCOUNTS_MEMBER, json.dumps(registry, ensure_ascii=False, indent=2).encode('utf-8'))
+            writer.add(CHECKSUMS_MEMBER, "".join(f"{digest}  {name}\n" for digest, name in checksums).encode('utf-8'))
+            writer.close()
+            if to_stdout:
+                fileobj.flush()
+        except BaseException:
+            # Finish the writer before its file is closed (the output is discarded anyway)
+            with contextlib.suppress(Exception):
+                writer.close()
+            if temp_path:
+                stack.close()
+                with contextlib.suppress(OSError):
+                    os.remove(temp_path)
+            raise
+
+        report["exported"] = len(exported)
+
+    if temp_path:
+        os.replace(temp_path, path)
+
+    report["elapsed_seconds"] = time.perf_counter() - start
+    target = path or ("stdout" if to_stdout else "stream")
+    with contextlib.redirect_stdout(sys.stderr) if to_stdout else contextlib.nullcontext():
+        info(f"已导出 {report['exported']} 个账号至 {target} "
+             f"({report['bytes'] / 1024 / 1024:.2f} MB, {report['elapsed_seconds'] * 1000:.0f} ms)"
+             + (f", {len(report['failed'])} 个失败" if report["failed"] else ""))
+    return report
+
+
+# -------------------------------------------------------------------------
+# Import
+# -------------------------------------------------------------------------
+
+def _backup_timestamp(value) -> float:
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _content_key(data: Dict) -> Tuple[str, ...]:
+    """Digests of the backed-up values, order-independent (same as the blob refs of a v2 backup)"""
+    from db_manager import KEYS_TO_BACKUP, encode_backup_value
+    from blob_store import compute_digest
+
+    return tuple(sorted(
+        compute_digest(encode_backup_value(data[key])) for key in KEYS_TO_BACKUP if key in data
+    ))
+
+
+def _load_candidate(source: str, raw: Optional[bytes] = None) -> Dict:
+    """Validate and decode one backup (runs in the worker pool)"""
+    from db_manager import load_verified_backup_bytes
+
+    if raw is None:
+        with open(source, 'rb') as f:
+            raw = f.read()
+    candidate = {"source": source, "sha256": hashlib.sha256(raw).hexdigest()}
+    data, error_msg = load_verified_backup_bytes(raw)
+    if data is None:
+        candidate["error"] = error_msg
+        return candidate
+    candidate.update({
+        "data": data,
+        "email": data.get("account_email", "Unknown"),
+        "backup_time": _backup_timestamp(data.get("backup_time")),
+        "content": _content_key(data),
+    })
+    return candidate
+
+
+def _open_archive(source) -> Iterator[Tuple[str, bytes]]:
+    """Yield (member name, content) for every regular file in a tar/zip archive"""
+    if source == "-":
+        with tarfile.open(fileobj=sys.stdin.buffer, mode="r|*") as tar:
+            for member in tar:
+                if member.isfile():
+                    yield member.name, tar.extractfile(member).read()
+        return
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for item in archive.infolist():
+                if not item.is_dir():
+                    yield item.filename, archive.read(item)
+        return
+    with tarfile.open(source, mode="r|*") as tar:
+        for member in tar:
+            if member.isfile():
+                yield member.name, tar.extractfile(member).read()
+
+
+def _collect_candidates(source, pool, job=None) -> Tuple[List[Dict], List[str]]:
+    """
+    Read a directory or archive and validate its backups in the pool
+
+    With a job, progress counts validated backups; the total is known once the
+    directory or archive has been read.
+
+    Returns:
+        Tuple of (candidates, failed source names)
+    """
+    futures = []
+    failed = []
+    checksums = None
+    registry_entries = {}
+    if source != "-" and os.path.isdir(source):
+        with os.scandir(source) as it:
+            for entry in sorted(it, key=lambda e: e.name):
+                if entry.is_file() and entry.name.endswith(IMPORT_SUFFIXES):
+                    futures.append(pool.submit(_load_candidate, entry.path))
+    else:
+        registry = None
+        for name, content in _open_archive(source):
+            if name.startswith(BACKUPS_PREFIX) and name.endswith(BACKUP_SUFFIX):
+                futures.append(pool.submit(_load_candidate, name, content))
+            elif name == ACCOUNTS_MEMBER:
+                registry = content
+            elif name == CHECKSUMS_MEMBER:
+                checksums = {}
+                for line in content.decode('utf-8').splitlines():
+                    digest, _, member = line.partition("  ")
+                    checksums[member] = digest
+
+        if registry is not None:
+            if checksums is not None and checksums.get(ACCOUNTS_MEMBER) != hashlib.sha256(registry).hexdigest():
+                warning("accounts.json 校验失败，将忽略归档中的账号信息")
+            else:
+                try:
+                    parsed = json.loads(registry)
+                    if parsed.get("format") != ARCHIVE_FORMAT:
+                        raise ValueError(f"unknown format {parsed.get('format')}")
+                    registry_entries = {entry["backup"]: entry for entry in parsed.get("accounts", [])}
+                except Exception as e:
+                    warning(f"无法读取归档中的账号信息: {e}")
+
+    if job is not None:
+        job.set_total(len(futures))
+    candidates = []
+    for future in futures:
+        if job is not None:
+            if job.cancelled:
+                for remaining in futures:
+                    remaining.cancel()
+            job.check()
+        try:
+            candidate = future.result()
+        except Exception as e:
+            error(f"读取备份失败: {e}")
+            failed.append(str(e))
+            continue
+        finally:
+            if job is not None:
+                job.advance(1)
+        source_name = candidate["source"]
+        if checksums is not None and checksums.get(source_name) != candidate["sha256"]:
+            candidate["error"] = "校验和不匹配"
+        if "error" in candidate:
+            warning(f"✗ {source_name}: {candidate['error']}")
+            failed.append(source_name)
+            continue
+        candidate["meta"] = registry_entries.get(source_name)
+        candidates.append(candidate)
+    return candidates, failed
+
+
+def _archive_account_id(meta: Dict) -> Optional[str]:
+    """The account id from an archive, if it is a UUID (it names the backup file)"""
+    try:
+        return str(uuid.UUID(str(meta.get("id"))))
+    except ValueError:
+        return None
+
+
+def _imported_fields(meta: Dict) -> Dict:
+    """Whitelisted registry fields of an archive entry (wrong types are dropped)"""
+    fields = {}
+    for key, types in _IMPORTED_FIELDS.items():
+        value = meta.get(key)
+        if isinstance(value, types) and not (types is not bool and isinstance(value, bool)):
+            fields[key] = value
+    if fields.get("rotation_weight", 1) <= 0:
+        del fields["rotation_weight"]
+    return fields
+
+
+def import_accounts(source, workers: Optional[int] = None, job=None) -> Dict:
+    """
+    Import accounts from an archive (see export_accounts) or a directory of backup files
+
+    For each email only the newest backup (by backup_time) is considered. It is
+        - imported as a new account if no account has this email,
+        - written over the existing account's backup if it is newer and differs,
+        - skipped otherwise (older, or identical content already stored).
+    Backups are validated in parallel, and the registry is saved once at the end.
+
+    Args:
+        source: Archive path, directory path, or "-" for a tar stream on stdin
+        workers: Worker thread count (default: based on CPU count)
+        job: Optional Job (jobs) for validation progress; cancellation is honoured
+            until the first backup is written, so an import is never half-committed
+
+    Returns:
+        Dict with imported, updated, skipped, failed (counts), account_ids
+        (imported or updated) and elapsed_seconds
+    """
+    from account_manager import load_accounts, save_accounts, sync_current_profile
+    from backup_index import get_backup_index
+    from backup_verify import default_workers
+    from config_manager import get_config
+    from db_manager import read_backup_refs, update_backup, write_backup
+
+    start = time.perf_counter()
+    report = {"imported": 0, "updated": 0, "skipped": 0, "failed": 0, "account_ids": [], "elapsed_seconds": 0.0}
+
+    with ThreadPoolExecutor(max_workers=workers or default_workers()) as pool:
+        candidates, failed = _collect_candidates(source, pool, job)
+        report["failed"] = len(failed)
+
+        # Newest backup per email wins; the rest of the batch is skipped
+        newest: Dict[str, Dict] = {}
+        for candidate in candidates:
+            current = newest.get(candidate["email"])
+            if current is None or candidate["backup_time"] > current["backup_time"]:
+                newest[candidate["email"]] = candidate
+        report["skipped"] += len(candidates) - len(newest)
+
+        if job is not None:
+            job.check()
+        accounts = load_accounts()
+        by_email = {}
+        for acc_id, acc in accounts.items():
+            by_email.setdefault(acc.get("email"), acc_id)
+        index_entries = get_backup_index().entries()
+
+        backup_dir = get_app_data_dir() / "backups"
+        backup_dir.mkdir(exist_ok=True)
+        max_generations = get_config().get("max_backups_per_account", 5)
+
+        writes = []
+        new_accounts = {}
+        for email, candidate in newest.items():
+            existing_id = by_email.get(email)
+            if existing_id is not None:
+                existing = accounts[existing_id]
+                backup_file = existing.get("backup_file")
+                entry = index_entries.get(Path(backup_file).name, {}) if backup_file else {}
+                refs = entry.get("blobs")
+                if refs is None:
+                    refs = read_backup_refs(backup_file) if backup_file else []
+                if tuple(sorted(refs)) == candidate["content"]:
+                    debug(f"内容相同，跳过: {email}")
+                    report["skipped"] += 1
+                    continue
+                if backup_file and os.path.exists(backup_file) and \
+                        _backup_timestamp(entry.get("backup_time")) >= candidate["backup_time"]:
+                    debug(f"已有更新的备份，跳过: {email}")
+                    report["skipped"] += 1
+                    continue
+                if not backup_file:
+                    backup_file = str(backup_dir / f"{existing_id}.json")
+                    new_accounts[existing_id] = dict(existing, backup_file=backup_file)
+                writes.append(("updated", existing_id, backup_file,
+                               pool.submit(update_backup, candidate["data"], backup_file, max_generations)))
+                continue
+
+            meta = candidate["meta"] if isinstance(candidate["meta"], dict) else {}
+            account_id = _archive_account_id(meta)
+            if not account_id or account_id in accounts or account_id in new_accounts:
+                account_id = str(uuid.uuid4())
+            backup_file = str(backup_dir / f"{account_id}.json")
+            now = datetime.now().isoformat()
+            fields = _imported_fields(meta)
+            account = dict(fields)
+            account.update({
+                "id": account_id,
+                "name": fields.get("name") or f"Imported_{email.split('@')[0]}",
+                "email": email,
+                "backup_file": backup_file,
+                "created_at": fields.get("created_at") or now,
+                "last_used": fields.get("last_used") or candidate["data"].get("backup_time") or now,
+            })
+            new_accounts[account_id] = account
+            writes.append(("imported", account_id, backup_file,
+                           pool.submit(write_backup, candidate["data"], backup_file)))
+
+        written = []
+        for kind, account_id, backup_file, future in writes:
+            try:
+                ok = future.result()
+            except Exception as e:
+                error(f"写入备份失败 {backup_file}: {e}")
+                ok = False
+            if not ok:
+                report["failed"] += 1
+                new_accounts.pop(account_id, None)
+                continue
+            written.append((kind, account_id, backup_file))
+
+    # Single registry commit (re-read so concurrent changes to other accounts are kept)
+    if new_accounts:
+        accounts = load_accounts()
+        accounts.update(new_accounts)
+        if not save_accounts(accounts):
+            from db_manager import delete_backup_file
+            for kind, account_id, backup_file in written:
+                if kind == "imported":
+                    try:
+                        delete_backup_file(backup_file)
+                    except Exception:
+                        pass
+                    report["failed"] += 1
+            written = [w for w in written if w[0] != "imported"]
+        else:
+            # Imported accounts may share the email of the one logged in to state.vscdb
+            sync_current_profile(accounts)
+
+    for kind, account_id, _ in written:
+        report[kind] += 1
+        report["account_ids"].append(account_id)
+
+    report["elapsed_seconds"] = time.perf_counter() - start
+    info(f"导入完成: 新增 {report['imported']}, 更新 {report['updated']}, 跳过 {report['skipped']}, "
+         f"失败 {report['failed']} ({report['elapsed_seconds'] * 1000:.0f} ms)")
+    return report
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Backup File Format v2
+Binary container with a small uncompressed header and compressed payload sections
+
+Layout:
+    MAGIC (6 bytes) | header length (uint32, big-endian) | header (UTF-8 JSON) | payload sections
+
+The header holds the account email, backup time and one entry per backed-up key:
+    {"sha256": ..., "size": ..., "codec": "zlib", "offset": ..., "length": ...}  inline section
+    {"sha256": ..., "size": ..., "blob": true}                                   value in the blob store
+    {"sha256": ..., "size": ..., "same": true}                                   equal to the base value
+    {"sha256": ..., "size": ..., "delta": [prefix, suffix], "codec": ..., ...}   delta against the base
+Section offsets are relative to the first byte after the header, so metadata can be
+read without touching (or decompressing) any payload.
+
+"same" and "delta" entries are only used by backup generations, which are encoded
+against the values of the next newer generation (see backup_generations).
+
+Version 1.x backups (plain JSON, values inline or as blob references) are still
+readable through the same functions.
+"""
+import json
+import struct
+import zlib
+from typing import Dict, Optional, Tuple
+
+MAGIC = b"AGBK\x02\n"
+FORMAT_VERSION = "2.0"
+MAX_HEADER_SIZE = 1024 * 1024
+
+_LENGTH = struct.Struct(">I")
+
+
+class BackupFormatError(ValueError):
+    """Raised when a backup file cannot be parsed"""
+
+
+def is_v2_file(path) -> bool:
+    """Check whether a file is a v2 backup (by magic bytes, not extension)"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _common_prefix_length(a: bytes, b: bytes) -> int:
+    """Length of the common prefix of two byte strings (binary search on slices)"""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def encode_delta(value: bytes, base: bytes) -> Tuple[int, int, bytes]:
+    """
+    Encode value as the bytes that differ from base
+
+    Returns:
+        Tuple of (prefix, suffix, middle) such that
+        value == base[:prefix] + middle + base[len(base) - suffix:]
+    """
+    prefix = _common_prefix_length(value, base)
+    limit = min(len(value), len(base)) - prefix
+    suffix = _common_prefix_length(value[::-1][:limit], base[::-1][:limit])
+    return prefix, suffix, value[prefix:len(value) - suffix]
+
+
+def apply_delta(base: bytes, prefix: int, suffix: int, middle: bytes) -> bytes:
+    """Rebuild a value from its base and delta"""
+    return base[:prefix] + middle + base[len(base) - suffix:]
+
+
+def encode_backup(meta: Dict, values: Dict[str, bytes], store=None, level: int = 6,
+                  base_values: Optional[Dict[str, bytes]] = None) -> Tuple[bytes, Dict]:
+    """
+    Serialize a backup to v2 bytes
+
+    Args:
+        meta: Metadata (account_email, backup_time, ...)
+        values: Key -> raw value bytes
+        store: BlobStore to put values into; if None, values are written inline as
+               compressed sections so the file is self-contained
+        level: zlib compression level for inline sections
+        base_values: If given, values are encoded against these (as "same" or
+                     "delta" entries) and store is ignored
+
+    Returns:
+        Tuple of (file bytes, header dict)
+    """
+    from blob_store import compute_digest
+
+    entries = {}
+    sections = []
+    offset = 0
+    for key, raw in values.items():
+        entry = {"sha256": compute_digest(raw), "size": len(raw)}
+        base = base_values.get(key) if base_values is not None else None
+        if base is not None and base == raw:
+            entry["same"] = True
+            entries[key] = entry
+            continue
+        if base is not None:
+            prefix, suffix, raw = encode_delta(raw, base)
+            entry["delta"] = [prefix, suffix]
+        elif store is not None:
+            store.put(raw)
+            entry["blob"] = True
+            entries[key] = entry
+            continue
+        packed = zlib.compress(raw, level)
+        entry.update({"codec": "zlib", "offset": offset, "length": len(packed)})
+        entries[key] = entry
+        sections.append(packed)
+        offset += len(packed)
+
+    header = dict(meta)
+    header["backup_version"] = FORMAT_VERSION
+    header["entries"] = entries
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+    return MAGIC + _LENGTH.pack(len(header_bytes)) + header_bytes + b"".join(sections), header
+
+
+def decode_header(data: bytes) -> Tuple[Dict, int]:
+    """
+    Parse the header from the start of v2 bytes
+
+    Returns:
+        Tuple of (header dict, offset of the payload region)
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise BackupFormatError("Not a v2 backup file")
+    start = len(MAGIC) + _LENGTH.size
+    if len(data) < start:
+        raise BackupFormatError("Truncated header")
+    (length,) = _LENGTH.unpack(data[len(MAGIC):start])
+    if length > MAX_HEADER_SIZE or len(data) < start + length:
+        raise BackupFormatError("Truncated or oversized header")
+    try:
+        header = json.loads(data[start:start + length].decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise BackupFormatError(f"Corrupted header: {e}")
+    if not isinstance(header, dict) or not isinstance(header.get("entries"), dict):
+        raise BackupFormatError("Invalid header structure")
+    return header, start + length
+
+
+def read_header(path) -> Tuple[Dict, int]:
+    """
+    Read only the header of a v2 backup file
+
+    Returns:
+        Tuple of (header dict, offset of the payload region)
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(len(MAGIC) + _LENGTH.size)
+        if prefix[:len(MAGIC)] != MAGIC:
+            raise BackupFormatError("Not a v2 backup file")
+        if len(prefix) < len(MAGIC) + _LENGTH.size:
+            raise BackupFormatError("Truncated header")
+        (length,) = _LENGTH.unpack(prefix[len(MAGIC):])
+        if length > MAX_HEADER_SIZE:
+            raise BackupFormatError("Oversized header")
+        return decode_header(prefix + f.read(length))
+
+
+def read_section(path, payload_offset: int, entry: Dict) -> bytes:
+    """Read and decompress one inline section of a v2 file"""
+    with open(path, 'rb') as f:
+        f.seek(payload_offset + entry["offset"])
+        packed = f.read(entry["length"])
+    if len(packed) != entry["length"]:
+        raise BackupFormatError("Truncated payload section")
+    return zlib.decompress(packed)
+
+
+def decode_values(data: bytes, header: Dict, payload_offset: int, store=None,
+                  base_values: Optional[Dict[str, bytes]] = None) -> Dict[str, bytes]:
+    """
+    Get all raw values from v2 bytes already in memory
+
+    Args:
+        store: BlobStore for "blob" entries
+        base_values: Values the "same"/"delta" entries were encoded against
+    """
+    values = {}
+    for key, entry in header["entries"].items():
+        if entry.get("blob"):
+            if store is None:
+                raise BackupFormatError(f"Value {key} is in the blob store")
+            values[key] = store.get(entry["sha256"])
+            continue
+        if entry.get("same") or entry.get("delta"):
+            if base_values is None or key not in base_values:
+                raise BackupFormatError(f"Missing base value for {key}")
+            if entry.get("same"):
+                values[key] = base_values[key]
+                continue
+        start = payload_offset + entry["offset"]
+        packed = data[start:start + entry["length"]]
+        if len(packed) != entry["length"]:
+            raise BackupFormatError("Truncated payload section")
+        raw = zlib.decompress(packed)
+        if entry.get("delta"):
+            prefix, suffix = entry["delta"]
+            raw = apply_delta(base_values[key], prefix, suffix, raw)
+        values[key] = raw
+    return values
+
+
+def read_metadata(path, keys=()) -> Optional[Dict]:
+    """
+    Read backup metadata, touching only the header for v2 files
+
+    For v1.x JSON files the whole file has to be parsed; inline values listed in
+    keys are reported as entries without offsets.
+
+    Returns:
+        Header dict with account_email, backup_time, backup_version and entries
+    """
+    if is_v2_file(path):
+        header, _ = read_header(path)
+        return header
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return metadata_from_v1(data, keys)
+
+
+def metadata_from_v1(data, keys=()) -> Dict:
+    """Build a v2-style header dict from parsed v1.x backup JSON"""
+    if not isinstance(data, dict):
+        raise BackupFormatError("Backup is not a JSON object")
+    header = {k: data[k] for k in ("account_email", "backup_time", "backup_version") if k in data}
+    header.setdefault("backup_version", "1.0")
+    header["entries"] = {}
+    for key in keys:
+        if key in data:
+            header["entries"][key] = {"inline_v1": True}
+    for key, digest in (data.get("blobs") or {}).items():
+        header["entries"][key] = {"sha256": digest, "blob": True}
+    return header
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Backup Generations
+Keeps a ring of older snapshots per account next to its current backup
+
+The current backup (<uuid>.json) is generation 0 and always stored in full. Older
+generations live in <uuid>.gen/<seq>.agbk, each encoded as a delta against the next
+newer generation (reverse deltas), so unchanged values cost a few header bytes and
+nothing ever depends on the oldest generation. Pushing a generation and pruning the
+oldest one therefore touch a bounded number of files, whatever the history length.
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils import error, warning, debug
+from backup_format import decode_header, decode_values, encode_backup
+
+INDEX_FILE = "index.json"
+
+
+def get_generations_dir(backup_file) -> Path:
+    """Get the directory holding the older generations of a backup"""
+    path = Path(backup_file)
+    return path.with_name(f"{path.stem}.gen")
+
+
+def _load_index(gen_dir: Path) -> Dict:
+    try:
+        with open(gen_dir / INDEX_FILE, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if isinstance(index, dict) and isinstance(index.get("generations"), list):
+            return index
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        warning(f"历史版本索引损坏，已重置: {e}")
+    return {"next_seq": 1, "generations": []}
+
+
+def _save_index(gen_dir: Path, index: Dict):
+    temp_file = gen_dir / (INDEX_FILE + ".tmp")
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    temp_file.replace(gen_dir / INDEX_FILE)
+
+
+def _split(data: Dict):
+    """Split backup data into (meta, raw values)"""
+    from db_manager import KEYS_TO_BACKUP, encode_backup_value
+
+    meta = {
+        "account_email": data.get("account_email", "Unknown"),
+        "backup_time": data.get("backup_time"),
+    }
+    values = {key: encode_backup_value(data[key]) for key in KEYS_TO_BACKUP if key in data}
+    return meta, values
+
+
+def push_generation(backup_file, previous_data: Dict, current_data: Dict) -> Optional[int]:
+    """
+    Record the contents of a backup as its newest older generation
+
+    Called before backup_file is replaced, so the previous snapshot is on disk
+    before anything overwrites it; call prune_generations() once the new backup is
+    written, or drop_generation() if writing it failed.
+
+    Args:
+        backup_file: Path of the current (generation 0) backup
+        previous_data: Backup data about to be replaced
+        current_data: Backup data that is about to be stored in backup_file
+
+    Returns:
+        Sequence number of the recorded generation, or None if the content is unchanged
+
+    Raises:
+        OSError: If the generation could not be written
+    """
+    meta, values = _split(previous_data)
+    _, base_values = _split(current_data)
+    if values == base_values:
+        # Content unchanged, nothing worth keeping
+        return None
+
+    gen_dir = get_generations_dir(backup_file)
+    gen_dir.mkdir(exist_ok=True)
+    index = _load_index(gen_dir)
+    seq = index["next_seq"]
+    payload, _ = encode_backup(meta, values, base_values=base_values)
+
+    temp_file = gen_dir / f"{seq}.agbk.tmp"
+    with open(temp_file, 'wb') as f:
+        f.write(payload)
+    temp_file.replace(gen_dir / f"{seq}.agbk")
+
+    # generations: newest first
+    index["generations"].insert(0, seq)
+    index["next_seq"] = seq + 1
+    _save_index(gen_dir, index)
+    return seq
+
+
+def drop_generation(backup_file, seq: int):
+    """Undo push_generation() after the new backup could not be written"""
+    gen_dir = get_generations_dir(backup_file)
+    try:
+        index = _load_index(gen_dir)
+        if seq in index["generations"]:
+            index["generations"].remove(seq)
+            _save_index(gen_dir, index)
+        (gen_dir / f"{seq}.agbk").unlink()
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        warning(f"撤销历史版本失败 {backup_file} #{seq}: {e}")
+
+
+def prune_generations(backup_file, max_generations: int):
+    """Drop the oldest generations beyond max_generations (including the current backup)"""
+    gen_dir = get_generations_dir(backup_file)
+    if not gen_dir.exists():
+        return
+    if max_generations <= 1:
+        delete_generations(backup_file)
+        return
+
+    try:
+        index = _load_index(gen_dir)
+        # only the oldest fall off the end
+        pruned = index["generations"][max_generations - 1:]
+        if not pruned:
+            return
+        index["generations"] = index["generations"][:max_generations - 1]
+        _save_index(gen_dir, index)
+    except Exception as e:
+        error(f"清理历史版本失败: {e}")
+        return
+
+    for old_seq in pruned:
+        try:
+            (gen_dir / f"{old_seq}.agbk").unlink()
+            debug(f"已清理过旧的历史版本: {backup_file} #{old_seq}")
+        except FileNotFoundError:
+            pass
+
+
+def expire_generations(backup_file, cutoff: float, dry_run: bool = False) -> Tuple[int, int]:
+    """
+    Drop older generations recorded before cutoff (the current backup is never touched)
+
+    Generations are ordered newest first and each is a delta against the next newer
+    one, so only a tail of the list is dropped and the rest stays decodable.
+
+    Args:
+        backup_file: Path of the current backup
+        cutoff: Timestamp; generations whose file is older are dropped
+        dry_run: If True, only count what would be dropped
+
+    Returns:
+        Tuple of (generations dropped, bytes freed)
+    """
+    gen_dir = get_generations_dir(backup_file)
+    if not gen_dir.exists():
+        return 0, 0
+    index = _load_index(gen_dir)
+    seqs = index["generations"]
+    keep = len(seqs)
+    freed = 0
+    while keep > 0:
+        try:
+            st = (gen_dir / f"{seqs[keep - 1]}.agbk").stat()
+        except FileNotFoundError:
+            keep -= 1
+            continue
+        if st.st_mtime >= cutoff:
+            break
+        freed += st.st_size
+        keep -= 1
+    expired = seqs[keep:]
+    if not expired or dry_run:
+        return len(expired), freed
+
+    try:
+        index["generations"] = seqs[:keep]
+        _save_index(gen_dir, index)
+    except Exception as e:
+        error(f"清理历史版本失败: {e}")
+        return 0, 0
+    for seq in expired:
+        try:
+            (gen_dir / f"{seq}.agbk").unlink()
+            debug(f"已清理过期的历史版本: {backup_file} #{seq}")
+        except FileNotFoundError:
+            pass
+    return len(expired), freed
+
+
+def list_generations(backup_file) -> List[Dict]:
+    """
+    List the generations of a backup, newest first
+
+    Returns:
+        List of dicts with generation (0 = current), backup_time and size
+    """
+    from backup_format import read_metadata
+
+    result = []
+    try:
+        header = read_metadata(backup_file)
+        result.append({
+            "generation": 0,
+            "backup_time": header.get("backup_time"),
+            "size": os.path.getsize(backup_file),
+        })
+    except Exception as e:
+        debug(f"无法读取备份文件 {backup_file}: {e}")
+        return result
+
+    gen_dir = get_generations_dir(backup_file)
+    for number, seq in enumerate(_load_index(gen_dir)["generations"], 1):
+        path = gen_dir / f"{seq}.agbk"
+        try:
+            with open(path, 'rb') as f:
+                header, _ = decode_header(f.read())
+            result.append({
+                "generation": number,
+                "backup_time": header.get("backup_time"),
+                "size": path.stat().st_size,
+            })
+        except Exception as e:
+            warning(f"历史版本损坏 {path}: {e}")
+            break
+    return result
+
+
+def load_generation(backup_file, generation: int, current_data: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Rebuild the data of an older generation
+
+    Deltas are applied from the current backup backwards, and every rebuilt value is
+    checked against the digest stored in its generation header.
+
+    Args:
+        backup_file: Path of the current backup
+        generation: 0 = current, 1 = previous, ...
+        current_data: Already loaded data of the current backup (read from backup_file if None)
+
+    Returns:
+        Backup data dict (like load_backup_data), or None if it does not exist
+
+    Raises:
+        ValueError: If a generation is corrupted
+    """
+    from db_manager import load_backup_data
+    from blob_store import compute_digest
+
+    data = current_data if current_data is not None else load_backup_data(str(backup_file))
+    if generation == 0:
+        return data
+
+    seqs = _load_index(get_generations_dir(backup_file))["generations"]
+    if generation < 0 or generation > len(seqs):
+        return None
+
+    _, values = _split(data)
+    gen_dir = get_generations_dir(backup_file)
+    for seq in seqs[:generation]:
+        with open(gen_dir / f"{seq}.agbk", 'rb') as f:
+            raw = f.read()
+        header, payload_offset = decode_header(raw)
+        values = decode_values(raw, header, payload_offset, base_values=values)
+        for key, entry in header["entries"].items():
+            if compute_digest(values[key]) != entry["sha256"]:
+                raise ValueError(f"历史版本 #{seq} 的字段 {key} 校验失败")
+        meta = {k: v for k, v in header.items() if k not in ("entries", "backup_version")}
+
+    result = dict(meta)
+    for key, raw_value in values.items():
+        result[key] = raw_value.decode('utf-8')
+    return result
+
+
+def delete_generations(backup_file):
+    """Delete all older generations of a backup"""
+    gen_dir = get_generations_dir(backup_file)
+    if gen_dir.exists():
+        shutil.rmtree(gen_dir, ignore_errors=True)
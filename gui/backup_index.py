@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Backup Metadata Index
+Keeps email, time, size, mtime and blob references of every backup in one small file
+
+The index (~/.antigravity-agent/backup_index.json) is updated on every backup write
+and delete made through db_manager. It also stores the mtime of the backups
+directory at its last update; if the directory changed behind its back (another
+process, manual edits), the next read rescans the directory and only re-reads the
+headers of files whose size or mtime changed.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from utils import warning, debug, get_app_data_dir
+
+INDEX_VERSION = 2
+
+
+def get_backups_dir() -> Path:
+    """Get the backups directory (~/.antigravity-agent/backups)"""
+    return get_app_data_dir() / "backups"
+
+
+def _is_backup_name(name: str) -> bool:
+    return name.endswith(".json") and not name.endswith(".tmp")
+
+
+class BackupIndex:
+    """Metadata index over the backups directory (thread-safe)"""
+
+    def __init__(self, backups_dir: Path, index_file: Path):
+        self.backups_dir = Path(backups_dir)
+        self.index_file = Path(index_file)
+        self._lock = threading.RLock()
+        self._data: Optional[Dict] = None
+        self._index_mtime_ns = None
+
+    def _dir_mtime_ns(self):
+        try:
+            return self.backups_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        try:
+            st = self.index_file.stat()
+        except FileNotFoundError:
+            self._data = {"version": INDEX_VERSION, "dir_mtime_ns": None, "entries": {}}
+            self._index_mtime_ns = None
+            return
+        if self._data is not None and st.st_mtime_ns == self._index_mtime_ns:
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+                raise ValueError("unsupported index version")
+            self._data = data
+        except Exception as e:
+            warning(f"备份索引损坏，将重新扫描: {e}")
+            self._data = {"version": INDEX_VERSION, "dir_mtime_ns": None, "entries": {}}
+        self._index_mtime_ns = st.st_mtime_ns
+
+    def _save(self):
+        temp_file = self.index_file.with_suffix('.json.tmp')
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, ensure_ascii=False)
+            temp_file.replace(self.index_file)
+            self._index_mtime_ns = self.index_file.stat().st_mtime_ns
+        except Exception as e:
+            warning(f"保存备份索引失败: {e}")
+
+    @staticmethod
+    def _read_entry(path: str, st: os.stat_result) -> Dict:
+        from backup_format import read_metadata
+
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "email": "Unknown", "backup_time": None}
+        try:
+            header = read_metadata(path)
+            entry["email"] = header.get("account_email", "Unknown")
+            entry["backup_time"] = header.get("backup_time")
+            entry["backup_version"] = header.get("backup_version")
+            entry["blobs"] = [e["sha256"] for e in header["entries"].values() if e.get("blob")]
+        except Exception as e:
+            debug(f"无法读取备份文件 {path}: {e}")
+            entry["invalid"] = True
+        return entry
+
+    def _refresh(self):
+        """Bring the index up to date with the directory if it is stale"""
+        self._load()
+        dir_mtime = self._dir_mtime_ns()
+        if dir_mtime is not None and dir_mtime == self._data.get("dir_mtime_ns"):
+            return
+        self.rescan()
+
+    def rescan(self):
+        """Rescan the backups directory, re-reading only new or modified files"""
+        with self._lock:
+            self._load()
+            old_entries = self._data.get("entries", {})
+            entries = {}
+            dir_mtime = self._dir_mtime_ns()
+            if dir_mtime is not None:
+                with os.scandir(self.backups_dir) as it:
+                    for item in it:
+                        if not _is_backup_name(item.name) or not item.is_file():
+                            continue
+                        st = item.stat()
+                        old = old_entries.get(item.name)
+                        if old and old.get("size") == st.st_size and old.get("mtime_ns") == st.st_mtime_ns:
+                            entries[item.name] = old
+                        else:
+                            entries[item.name] = self._read_entry(item.path, st)
+            self._data["entries"] = entries
+            self._data["dir_mtime_ns"] = dir_mtime
+            self._save()
+
+    def entries(self) -> Dict[str, Dict]:
+        """Get filename -> metadata for every backup (copy)"""
+        with self._lock:
+            self._refresh()
+            return {name: dict(entry) for name, entry in self._data["entries"].items()}
+
+    def _owns(self, path) -> bool:
+        path = Path(path)
+        return path.parent.resolve() == self.backups_dir.resolve() and _is_backup_name(path.name)
+
+    def prepare(self, path=None):
+        """
+        Make sure the index is current before a backup is written or deleted
+
+        record()/forget() then only apply their own change; anything another
+        process changes in between is caught by the next directory mtime check.
+        Without a path, prepares for changes to any backup in the directory.
+        """
+        if path is not None and not self._owns(path):
+            return
+        with self._lock:
+            self._refresh()
+
+    def record(self, path):
+        """Update the entry of a backup that was just written"""
+        if not self._owns(path):
+            return
+        with self._lock:
+            self._load()
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                self._data["entries"].pop(Path(path).name, None)
+            else:
+                self._data["entries"][Path(path).name] = self._read_entry(str(path), st)
+            self._data["dir_mtime_ns"] = self._dir_mtime_ns()
+            self._save()
+
+    def forget(self, *paths):
+        """Remove the entries of backups that were just deleted (saved once)"""
+        paths = [path for path in paths if self._owns(path)]
+        if not paths:
+            return
+        with self._lock:
+            self._load()
+            for path in paths:
+                self._data["entries"].pop(Path(path).name, None)
+            self._data["dir_mtime_ns"] = self._dir_mtime_ns()
+            self._save()
+
+
+_index_instance: Optional[BackupIndex] = None
+
+
+def get_backup_index() -> BackupIndex:
+    """Get global backup index instance (singleton)"""
+    global _index_instance
+    if _index_instance is None:
+        _index_instance = BackupIndex(get_backups_dir(), get_app_data_dir() / "backup_index.json")
+    return _index_instance
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Backup Maintenance Engine
+One pass over the data directories: retention, orphan removal, leftover cleanup,
+blob garbage collection and size accounting
+
+Every directory is read once with os.scandir and the stat results cached in the
+DirEntry objects are reused for every decision, so the cost is one directory walk
+plus the deletions themselves.
+
+What is removed:
+    - older generations recorded more than backup_retention_days ago; a backup the
+      account registry references is never removed, however old
+    - backups not referenced by any account once they are older than
+      ORPHAN_GRACE_SECONDS (counted as expired past the retention period), and
+      generation directories whose backup no longer exists
+    - *.tmp files left by interrupted writes, once they are older than TEMP_GRACE_SECONDS
+    - recovery copies (*.corrupted, *.old, state.vscdb.safety_backup) once they
+      are older than the retention period (kept forever if retention is 0)
+    - blobs no remaining backup references
+"""
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from utils import info, error, warning, debug, get_accounts_file_path, get_app_data_dir, get_antigravity_db_paths
+from config_manager import get_config
+from blob_store import get_blob_store
+from backup_index import get_backup_index, get_backups_dir
+
+# Leftover temp files younger than this may belong to a write still in progress
+TEMP_GRACE_SECONDS = 3600
+
+# New backups are written before the registry that references them is saved,
+# so unreferenced backups younger than this are kept
+ORPHAN_GRACE_SECONDS = 3600
+
+RECOVERY_SUFFIXES = (".corrupted", ".old")
+SAFETY_BACKUP_SUFFIX = ".safety_backup"
+GENERATIONS_SUFFIX = ".gen"
+
+
+def _touched(st: os.stat_result) -> float:
+    # copy2() preserves mtime, so for copies ctime (inode change) is the better age
+    return max(st.st_mtime, st.st_ctime)
+
+
+def _tree_size(path: str) -> int:
+    size = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    size += entry.stat().st_size
+    except OSError:
+        pass
+    return size
+
+
+def _registry_signature():
+    """(mtime, size) of the account registry; changes whenever it is saved"""
+    try:
+        st = get_accounts_file_path().stat()
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+def get_referenced_backups() -> set:
+    """
+    Names of the backup files the account registry references
+
+    Raises:
+        RuntimeError: If the registry cannot be read; a broken registry must not
+            make every backup look orphaned
+    """
+    from account_manager import load_accounts
+
+    try:
+        accounts = load_accounts(strict=True)
+    except Exception as e:
+        raise RuntimeError(f"无法读取账号列表，已中止维护: {e}") from e
+    return {Path(acc["backup_file"]).name for acc in accounts.values()
+            if isinstance(acc, dict) and acc.get("backup_file")}
+
+
+class _Pass:
+    """State of one maintenance run"""
+
+    def __init__(self, dry_run: bool, throttle=None, job=None):
+        self.dry_run = dry_run
+        self.throttle = throttle
+        self.job = job
+        # Taken before the registry is read, so a save in between is noticed
+        self.registry_signature = _registry_signature()
+        self.referenced = get_referenced_backups()
+        self.deleted_backups: List[str] = []
+        self.report = {
+            "dry_run": dry_run,
+            "scanned": 0,
+            "expired": 0,
+            "orphaned": 0,
+            "orphaned_generations": 0,
+            "leftovers": 0,
+            "blobs_deleted": 0,
+            "bytes_freed": 0,
+            "backup_count": 0,
+            "backup_bytes": 0,
+            "generation_bytes": 0,
+            "blob_count": 0,
+            "blob_bytes": 0,
+            "total_bytes": 0,
+            "removed": [],
+        }
+
+    def _charge(self, nbytes: int):
+        if self.job is not None:
+            self.job.check()
+        if self.throttle is not None:
+            self.throttle.consume(nbytes)
+
+    def remove_file(self, path: str, size: int, kind: str) -> bool:
+        self._charge(size)
+        if not self.dry_run:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                return False
+            except OSError as e:
+                warning(f"删除文件失败 {path}: {e}")
+                return False
+        self.report[kind] += 1
+        self.report["bytes_freed"] += size
+        self.report["removed"].append(path)
+        debug(f"{'[模拟运行] ' if self.dry_run else ''}清理: {path}")
+        return True
+
+    def is_referenced(self, name: str) -> bool:
+        """Check a backup against the registry, re-reading it only if it was saved since"""
+        signature = _registry_signature()
+        if signature != self.registry_signature:
+            self.registry_signature = signature
+            self.referenced = get_referenced_backups()
+        return name in self.referenced
+
+    def remove_backup(self, path: str, size: int, kind: str) -> bool:
+        """Delete an unreferenced backup, unless the registry references it by now"""
+        from db_manager import delete_backup_file
+
+        self._charge(size)
+        # The registry may have changed since the pass started (or while throttled)
+        if self.is_referenced(Path(path).name):
+            debug(f"备份已被账号引用，保留: {path}")
+            return False
+        if not self.dry_run:
+            try:
+                # Frees referenced blobs and generations as well; the backup index
+                # is updated once at the end of the pass
+                size = delete_backup_file(path, update_index=False)
+                self.deleted_backups.append(path)
+            except FileNotFoundError:
+                return False
+            except Exception as e:
+                error(f"删除备份文件失败 {path}: {e}")
+                return False
+        else:
+            size += _tree_size(path[:-len(".json")] + GENERATIONS_SUFFIX)
+        self.report[kind] += 1
+        self.report["bytes_freed"] += size
+        self.report["removed"].append(path)
+        debug(f"{'[模拟运行] ' if self.dry_run else ''}删除备份: {path}")
+        return True
+
+    def expire_generations(self, backup_file: str, cutoff: float):
+        from backup_generations import expire_generations
+
+        if self.job is not None:
+            self.job.check()
+        count, size = expire_generations(backup_file, cutoff, dry_run=True)
+        if not count:
+            return
+        self._charge(size)
+        if not self.dry_run:
+            count, size = expire_generations(backup_file, cutoff)
+        self.report["expired"] += count
+        self.report["bytes_freed"] += size
+
+    def remove_tree(self, path: str, kind: str):
+        size = _tree_size(path)
+        self._charge(size)
+        if not self.dry_run:
+            shutil.rmtree(path, ignore_errors=True)
+        self.report[kind] += 1
+        self.report["bytes_freed"] += size
+        self.report["removed"].append(path)
+
+
+def run_maintenance(dry_run: bool = False, throttle=None, job=None) -> Dict:
+    """
+    Run all backup maintenance in a single pass
+
+    Args:
+        dry_run: If True, only report what would be removed
+        throttle: Optional IOThrottle (maintenance_scheduler) charged before each removal
+        job: Optional Job (jobs); progress counts backups-directory entries, and
+            cancellation is checked before each removal (removals already done stay done)
+
+    Returns:
+        Dict with counts (scanned, expired, orphaned, orphaned_generations,
+        leftovers, blobs_deleted), bytes_freed, the sizes of what remains
+        (backup_count, backup_bytes, generation_bytes, blob_count, blob_bytes,
+        total_bytes), removed (paths), elapsed_seconds and entries_per_second
+    """
+    start = time.perf_counter()
+    now = time.time()
+    retention_days = get_config().get("backup_retention_days", 30)
+    retention_cutoff = now - retention_days * 86400 if retention_days > 0 else None
+    temp_cutoff = now - TEMP_GRACE_SECONDS
+    orphan_cutoff = now - ORPHAN_GRACE_SECONDS
+
+    index = get_backup_index()
+    index.prepare()
+    run = _Pass(dry_run, throttle, job)
+    report = run.report
+
+    # 1. Backups directory: backups, generation directories, temp leftovers
+    backups_dir = get_backups_dir()
+    kept = set()
+    gen_dirs: List[os.DirEntry] = []
+    if backups_dir.exists():
+        with os.scandir(backups_dir) as it:
+            entries = list(it)
+        # An empty registry next to existing backups means it was lost or reset
+        # (load_accounts moves a corrupted file aside), not that every backup is orphaned
+        remove_orphans = bool(run.referenced) or not any(e.name.endswith(".json") for e in entries)
+        if not remove_orphans:
+            warning("账号列表为空但存在备份文件，本次不清理孤立备份")
+        if job is not None:
+            job.set_total(len(entries))
+        for entry in entries:
+            if job is not None:
+                job.advance(1)
+            report["scanned"] += 1
+            name = entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if name.endswith(GENERATIONS_SUFFIX):
+                    gen_dirs.append(entry)
+                continue
+            st = entry.stat()
+            if name.endswith(".tmp"):
+                if _touched(st) < temp_cutoff:
+                    run.remove_file(entry.path, st.st_size, "leftovers")
+                continue
+            if not name.endswith(".json"):
+                continue
+            if remove_orphans and name not in run.referenced and _touched(st) < orphan_cutoff:
+                expired = retention_cutoff is not None and st.st_mtime < retention_cutoff
+                if run.remove_backup(entry.path, st.st_size, "expired" if expired else "orphaned"):
+                    continue
+            kept.add(name)
+            report["backup_count"] += 1
+            report["backup_bytes"] += st.st_size
+
+    if run.deleted_backups:
+        index.forget(*run.deleted_backups)
+
+    removed_names = {Path(p).name for p in report["removed"]}
+    for entry in gen_dirs:
+        backup_name = entry.name[:-len(GENERATIONS_SUFFIX)] + ".json"
+        if backup_name in kept:
+            if retention_cutoff is not None:
+                run.expire_generations(str(backups_dir / backup_name), retention_cutoff)
+            report["generation_bytes"] += _tree_size(entry.path)
+        elif backup_name not in removed_names:
+            # removed backups took their generations with them (or counted them in dry-run)
+            run.remove_tree(entry.path, "orphaned_generations")
+
+    # 2. Data directory: temp files and recovery copies of the registry, config and indexes
+    with os.scandir(get_app_data_dir()) as it:
+        for entry in it:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            report["scanned"] += 1
+            st = entry.stat()
+            if entry.name.endswith(".tmp"):
+                if _touched(st) < temp_cutoff:
+                    run.remove_file(entry.path, st.st_size, "leftovers")
+            elif entry.name.endswith(RECOVERY_SUFFIXES):
+                if retention_cutoff is not None and _touched(st) < retention_cutoff:
+                    run.remove_file(entry.path, st.st_size, "leftovers")
+
+    # 3. Safety copies left next to state.vscdb by an interrupted restore
+    for db_path in get_antigravity_db_paths():
+        safety_backup = str(db_path) + SAFETY_BACKUP_SUFFIX
+        try:
+            st = os.stat(safety_backup)
+        except OSError:
+            continue
+        report["scanned"] += 1
+        if retention_cutoff is not None and _touched(st) < retention_cutoff:
+            run.remove_file(safety_backup, st.st_size, "leftovers")
+
+    # 4. Blob store: rebuild reference counts from the remaining backups and sweep
+    references = {}
+    for name, entry in index.entries().items():
+        if name not in kept:
+            continue
+        for digest in entry.get("blobs", ()):
+            references[digest] = references.get(digest, 0) + 1
+    run._charge(0)  # wait out a switch before touching the blob store
+    blob_result = get_blob_store().gc(references, dry_run=dry_run, grace_before=temp_cutoff)
+    report["blobs_deleted"] = blob_result["blobs_deleted"]
+    report["leftovers"] += blob_result["temp_files_deleted"]
+    report["bytes_freed"] += blob_result["bytes_freed"]
+    report["blob_count"] = blob_result["blob_count"]
+    report["blob_bytes"] = blob_result["blob_size_bytes"]
+    report["scanned"] += blob_result["blob_count"] + blob_result["blobs_deleted"] + blob_result["temp_files_deleted"]
+
+    report["total_bytes"] = report["backup_bytes"] + report["generation_bytes"] + report["blob_bytes"]
+    elapsed = time.perf_counter() - start
+    report["elapsed_seconds"] = elapsed
+    report["entries_per_second"] = report["scanned"] / elapsed if elapsed > 0 else 0.0
+
+    prefix = "[模拟运行] " if dry_run else ""
+    info(f"{prefix}维护完成: 扫描 {report['scanned']} 项, "
+         f"过期 {report['expired']}, 孤立 {report['orphaned'] + report['orphaned_generations']}, "
+         f"残留 {report['leftovers']}, 数据块 {report['blobs_deleted']}, "
+         f"释放 {report['bytes_freed'] / 1024 / 1024:.2f} MB; "
+         f"剩余 {report['total_bytes'] / 1024 / 1024:.2f} MB "
+         f"({elapsed * 1000:.1f} ms, {report['entries_per_second']:.0f} 项/秒)")
+    return report
@@ -4,46 +4,48 @@ Backup Management Utilities
 Handles backup cleanup, verification, and maintenance
 """
 import os
-import json
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import List, Dict, Tuple
 
 from utils import info, error, warning, debug, get_app_data_dir
 from config_manager import get_config
+from blob_store import get_blob_store
+from backup_index import get_backup_index
 
 
 def get_backup_files() -> List[Path]:
-    """Get all backup files in the backups directory"""
-    backup_dir = get_app_data_dir() / "backups"
-    if not backup_dir.exists():
-        return []
-    
-    return list(backup_dir.glob("*.json"))
+    """Get all backup files in the backups directory (from the backup index)"""
+    index = get_backup_index()
+    return [index.backups_dir / name for name in sorted(index.entries())]
+
+
+def _backup_info_from_entry(backup_path: Path, entry: Dict) -> Dict:
+    return {
+        "path": backup_path,
+        "email": entry.get("email", "Unknown"),
+        "backup_time": entry.get("backup_time"),
+        "size": entry["size"],
+        "created": datetime.fromtimestamp(entry["mtime_ns"] / 1e9),
+    }
 
 
 def get_backup_info(backup_path: Path) -> Dict:
-    """Extract metadata from a backup file"""
-    try:
-        with open(backup_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        return {
-            "path": backup_path,
-            "email": data.get("account_email", "Unknown"),
-            "backup_time": data.get("backup_time"),
-            "size": backup_path.stat().st_size,
-            "created": datetime.fromtimestamp(backup_path.stat().st_ctime),
-        }
-    except Exception as e:
-        debug(f"无法读取备份文件 {backup_path}: {e}")
+    """Get metadata of a backup file (from the backup index; no file is opened)"""
+    entry = get_backup_index().entries().get(Path(backup_path).name)
+    if entry is None or entry.get("invalid"):
+        debug(f"无法读取备份文件 {backup_path}")
         return None
+    return _backup_info_from_entry(Path(backup_path), entry)
 
 
 def cleanup_old_backups(dry_run: bool = False) -> Tuple[int, int]:
     """
     Clean up old backups based on retention policy
     
+    Backups referenced by an account are never removed, however old
+    (backup_maintenance.run_maintenance also expires their older generations).
+    
     Args:
         dry_run: If True, only report what would be deleted without actually deleting
     
@@ -57,20 +59,23 @@ def cleanup_old_backups(dry_run: bool = False) -> Tuple[int, int]:
         info("备份保留策略: 永久保留")
         return 0, 0
     
-    cutoff_date = datetime.now() - timedelta(days=retention_days)
-    backup_files = get_backup_files()
+    from backup_maintenance import get_referenced_backups
+    
+    cutoff_ns = (datetime.now() - timedelta(days=retention_days)).timestamp() * 1e9
+    index = get_backup_index()
+    try:
+        referenced = get_referenced_backups()
+    except RuntimeError as e:
+        error(str(e))
+        return 0, 0
     
     files_to_delete = []
     space_to_free = 0
     
-    for backup_file in backup_files:
-        try:
-            file_time = datetime.fromtimestamp(backup_file.stat().st_mtime)
-            if file_time < cutoff_date:
-                files_to_delete.append(backup_file)
-                space_to_free += backup_file.stat().st_size
-        except Exception as e:
-            warning(f"检查文件 {backup_file} 时出错: {e}")
+    for name, entry in sorted(index.entries().items()):
+        if entry["mtime_ns"] < cutoff_ns and name not in referenced:
+            files_to_delete.append(index.backups_dir / name)
+            space_to_free += entry["size"]
     
     if not files_to_delete:
         info(f"没有超过 {retention_days} 天的备份需要清理")
@@ -86,10 +91,11 @@ def cleanup_old_backups(dry_run: bool = False) -> Tuple[int, int]:
     deleted_count = 0
     freed_space = 0
     
+    from db_manager import delete_backup_file
+    
     for backup_file in files_to_delete:
         try:
-            file_size = backup_file.stat().st_size
-            backup_file.unlink()
+            file_size = delete_backup_file(str(backup_file))
             deleted_count += 1
             freed_space += file_size
             debug(f"已删除旧备份: {backup_file.name}")
@@ -133,10 +139,12 @@ def cleanup_orphaned_backups() -> int:
         return 0
     
     # Delete orphaned files
+    from db_manager import delete_backup_file
+    
     deleted_count = 0
     for backup_file in orphaned_files:
         try:
-            backup_file.unlink()
+            delete_backup_file(str(backup_file))
             deleted_count += 1
             debug(f"已删除孤立备份: {backup_file.name}")
         except Exception as e:
@@ -148,64 +156,146 @@ def cleanup_orphaned_backups() -> int:
     return deleted_count
 
 
-def verify_all_backups() -> Tuple[int, int, List[str]]:
+def collect_blob_references() -> Dict[str, int]:
     """
-    Verify integrity of all backup files
+    Count how many backup manifests reference each blob
     
     Returns:
-        Tuple of (valid_count, invalid_count, invalid_file_paths)
+        Dict of blob digest -> reference count
     """
-    from db_manager import verify_backup_integrity
+    references = {}
+    for entry in get_backup_index().entries().values():
+        for digest in entry.get("blobs", ()):
+            references[digest] = references.get(digest, 0) + 1
+    return references
+
+
+def cleanup_unreferenced_blobs(dry_run: bool = False) -> Tuple[int, int]:
+    """
+    Garbage-collect the blob store: rebuild reference counts from the manifests
+    and delete blobs no manifest references
     
-    backup_files = get_backup_files()
-    valid_count = 0
-    invalid_count = 0
-    invalid_files = []
+    Args:
+        dry_run: If True, only report what would be deleted
+    
+    Returns:
+        Tuple of (blobs_deleted, space_freed_bytes)
+    """
+    result = get_blob_store().gc(collect_blob_references(), dry_run=dry_run)
+    deleted, freed = result["blobs_deleted"], result["bytes_freed"]
+    
+    if deleted > 0:
+        prefix = "[模拟运行] 将" if dry_run else ""
+        info(f"{prefix}清理 {deleted} 个无引用的数据块，释放 {freed / 1024 / 1024:.2f} MB")
+    else:
+        debug("没有无引用的数据块")
+    return deleted, freed
+
+
+def migrate_backups_to_v2() -> Tuple[int, int]:
+    """
+    Convert all version 1.x backups in the backups directory to the v2 format in place
+    
+    Returns:
+        Tuple of (migrated_count, failed_count)
+    """
+    from db_manager import migrate_backup_file
+    from backup_format import is_v2_file
+    
+    migrated = 0
+    failed = 0
+    for backup_file in get_backup_files():
+        if is_v2_file(backup_file):
+            continue
+        try:
+            if migrate_backup_file(str(backup_file)):
+                migrated += 1
+                debug(f"已迁移: {backup_file.name}")
+            else:
+                failed += 1
+        except Exception as e:
+            failed += 1
+            error(f"迁移备份失败 {backup_file}: {e}")
+    
+    info(f"迁移完成: {migrated} 个已转换为 v2 格式, {failed} 个失败")
+    return migrated, failed
+
+
+def verify_backups_report(use_cache: bool = True, workers: int = None, job=None) -> Dict:
+    """
+    Verify integrity of all backup files in parallel
+    
+    Files unchanged since the last run reuse their cached result (see backup_verify).
+    
+    Args:
+        use_cache: If False, every file is fully verified again (the cache is refreshed)
+        workers: Worker thread count (default: based on CPU count)
+        job: Optional Job (jobs) for progress and cancellation
+    
+    Returns:
+        Report dict from backup_verify.verify_backups
+    """
+    from backup_verify import get_verify_cache, verify_backups
+    
+    cache = get_verify_cache()
+    if not use_cache:
+        cache.clear()
     
+    backup_files = get_backup_files()
     info(f"开始验证 {len(backup_files)} 个备份文件...")
+    report = verify_backups(backup_files, cache=cache, workers=workers, prune=True, job=job)
     
-    for backup_file in backup_files:
-        is_valid, error_msg = verify_backup_integrity(str(backup_file))
-        
-        if is_valid:
-            valid_count += 1
-            debug(f"✓ {backup_file.name}")
-        else:
-            invalid_count += 1
-            invalid_files.append(str(backup_file))
-            warning(f"✗ {backup_file.name}: {error_msg}")
+    for path, error_msg in report["invalid_files"].items():
+        warning(f"✗ {Path(path).name}: {error_msg}")
+    
+    info(f"验证完成: {report['valid']} 个有效, {report['invalid']} 个无效 "
+         f"({report['cached']} 个未变化, {report['verified']} 个已校验; "
+         f"{report['elapsed_seconds'] * 1000:.1f} ms, {report['files_per_second']:.0f} 个/秒, "
+         f"{report['mb_per_second']:.1f} MB/s)", event="verify_backups",
+         duration=report["elapsed_seconds"], bytes=report["bytes_read"])
+    return report
+
+
+def verify_all_backups(use_cache: bool = True) -> Tuple[int, int, List[str]]:
+    """
+    Verify integrity of all backup files
     
-    info(f"验证完成: {valid_count} 个有效, {invalid_count} 个无效")
-    return valid_count, invalid_count, invalid_files
+    Returns:
+        Tuple of (valid_count, invalid_count, invalid_file_paths)
+    """
+    report = verify_backups_report(use_cache=use_cache)
+    return report["valid"], report["invalid"], list(report["invalid_files"])
 
 
 def get_backup_statistics() -> Dict:
     """Get statistics about backups"""
     from account_manager import load_accounts
     
-    backup_files = get_backup_files()
+    index = get_backup_index()
+    entries = index.entries()
     accounts = load_accounts()
     
-    total_size = sum(f.stat().st_size for f in backup_files)
+    blob_stats = get_blob_store().stats()
+    total_size = sum(e["size"] for e in entries.values()) + blob_stats["blob_size_bytes"]
     
     # Group by email
     backups_by_email = {}
-    for backup_file in backup_files:
-        info_dict = get_backup_info(backup_file)
-        if info_dict:
-            email = info_dict["email"]
-            if email not in backups_by_email:
-                backups_by_email[email] = []
-            backups_by_email[email].append(info_dict)
+    for name, entry in sorted(entries.items()):
+        if entry.get("invalid"):
+            continue
+        info_dict = _backup_info_from_entry(index.backups_dir / name, entry)
+        backups_by_email.setdefault(info_dict["email"], []).append(info_dict)
     
+    mtimes = [e["mtime_ns"] / 1e9 for e in entries.values()]
     return {
-        "total_backups": len(backup_files),
+        "total_backups": len(entries),
         "total_accounts": len(accounts),
         "total_size_bytes": total_size,
         "total_size_mb": total_size / 1024 / 1024,
+        "blob_count": blob_stats["blob_count"],
         "backups_by_email": backups_by_email,
-        "oldest_backup": min((f.stat().st_mtime for f in backup_files), default=None),
-        "newest_backup": max((f.stat().st_mtime for f in backup_files), default=None),
+        "oldest_backup": min(mtimes, default=None),
+        "newest_backup": max(mtimes, default=None),
     }
 
 
@@ -213,6 +303,9 @@ def export_backup(account_id: str, export_path: str) -> bool:
     """
     Export a backup to a specific location
     
+    The exported file is a self-contained v2 backup (values stored as compressed
+    sections), so it can be imported on a machine that does not have this blob store.
+    
     Args:
         account_id: Account ID to export
         export_path: Destination path for the exported backup
@@ -221,7 +314,7 @@ def export_backup(account_id: str, export_path: str) -> bool:
         True if successful
     """
     from account_manager import load_accounts
-    import shutil
+    from db_manager import load_backup_data, write_backup
     
     accounts = load_accounts()
     if account_id not in accounts:
@@ -236,58 +329,80 @@ def export_backup(account_id: str, export_path: str) -> bool:
         return False
     
     try:
-        shutil.copy2(backup_file, export_path)
-        info(f"备份已导出至: {export_path}")
+        data = load_backup_data(backup_file)
+        if not write_backup(data, export_path, inline=True):
+            return False
+        info(f"备份已导出至: {export_path}", event="export_backup", account_id=account_id,
+             bytes=os.path.getsize(export_path))
         return True
     except Exception as e:
         error(f"导出备份失败: {e}")
         return False
 
 
-def import_backup(import_path: str, account_name: str = None) -> bool:
+def import_backup(import_path: str, account_name: str = None, job=None) -> bool:
     """
     Import a backup from an external file
     
+    Values are written to the blob store, so content already stored is not
+    duplicated. If an account with the same email already has a backup with
+    identical content, nothing is imported.
+    
     Args:
         import_path: Path to the backup file to import
         account_name: Optional name for the imported account
+        job: Optional Job (jobs) for progress and cancellation (checked before writing)
     
     Returns:
-        True if successful
+        True if successful (including when an identical backup already exists)
     """
-    from account_manager import add_account_snapshot
-    from db_manager import verify_backup_integrity
-    import shutil
+    from db_manager import (
+        read_verified_backup, write_backup,
+        encode_backup_value, read_backup_refs, KEYS_TO_BACKUP
+    )
+    from blob_store import compute_digest
     import uuid
     
     if not os.path.exists(import_path):
         error(f"导入文件不存在: {import_path}")
         return False
+    if job is not None:
+        job.set_total(1, os.path.getsize(import_path))
     
-    # Verify backup integrity
-    is_valid, error_msg = verify_backup_integrity(import_path)
-    if not is_valid:
+    # Verify and read backup data in one pass
+    data, error_msg = read_verified_backup(import_path)
+    if data is None:
         error(f"备份文件无效: {error_msg}")
         return False
+    if job is not None:
+        job.check()
     
-    # Read backup metadata
     try:
-        with open(import_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
         email = data.get("account_email", "Unknown")
         
-        # Copy to backups directory
+        # Skip if an account with this email already has identical content
+        digests = sorted(
+            compute_digest(encode_backup_value(data[key])) for key in KEYS_TO_BACKUP if key in data
+        )
+        from account_manager import load_accounts, save_accounts, sync_current_profile
+        accounts = load_accounts()
+        for acc_data in accounts.values():
+            if acc_data.get("email") != email:
+                continue
+            existing_file = acc_data.get("backup_file")
+            if existing_file and sorted(read_backup_refs(existing_file)) == digests:
+                info(f"已存在内容相同的备份，跳过导入: {acc_data.get('name', email)}")
+                return True
+        
+        # Write manifest + blobs into the backups directory
         backup_dir = get_app_data_dir() / "backups"
         backup_dir.mkdir(exist_ok=True)
         
         new_backup_file = backup_dir / f"{uuid.uuid4()}.json"
-        shutil.copy2(import_path, new_backup_file)
+        if not write_backup(data, str(new_backup_file)):
+            return False
         
         # Add to accounts list
-        from account_manager import load_accounts, save_accounts
-        accounts = load_accounts()
-        
         account_id = str(uuid.uuid4())
         accounts[account_id] = {
             "id": account_id,
@@ -299,11 +414,17 @@ def import_backup(import_path: str, account_name: str = None) -> bool:
         }
         
         if save_accounts(accounts):
-            info(f"备份已导入: {account_name or email}")
+            # 导入的账号可能与 state.vscdb 中登录的账号同邮箱，校正 swap 切换记录的当前账号
+            sync_current_profile(accounts)
+            info(f"备份已导入: {account_name or email}", event="import_backup", account_id=account_id,
+                 bytes=os.path.getsize(import_path))
+            if job is not None:
+                job.advance(1, os.path.getsize(import_path))
             return True
         else:
             # Clean up if save failed
-            new_backup_file.unlink()
+            from db_manager import delete_backup_file
+            delete_backup_file(str(new_backup_file))
             return False
             
     except Exception as e:
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Backup Verification Engine
+Verifies many backups in parallel and remembers results between runs
+
+Results are cached in ~/.antigravity-agent/verify_cache.json, keyed by path and
+validated against (size, mtime_ns, content hash):
+    - size and mtime unchanged       -> cached result is reused without reading the file
+    - size or mtime changed          -> file is read and hashed; same hash reuses the result
+    - content changed / not cached   -> full (deep) verification in the worker pool
+A cached result is only trusted while every blob the backup references still exists.
+
+Verification is I/O plus hashlib/zlib work, both of which release the GIL, so a
+thread pool scales across cores without the pickling cost of a process pool.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from utils import warning, debug, get_app_data_dir
+from blob_store import compute_digest, get_blob_store
+from backup_format import MAGIC, decode_header
+
+CACHE_VERSION = 1
+
+
+def get_verify_cache_path() -> Path:
+    """Get the verification cache file (~/.antigravity-agent/verify_cache.json)"""
+    return get_app_data_dir() / "verify_cache.json"
+
+
+def default_workers() -> int:
+    """Default worker pool size"""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _blob_refs(raw: bytes) -> List[str]:
+    """Digests of the blobs referenced by backup bytes (empty if unparseable)"""
+    try:
+        if raw.startswith(MAGIC):
+            header, _ = decode_header(raw)
+            return [e["sha256"] for e in header["entries"].values() if e.get("blob")]
+        data = json.loads(raw)
+        return list((data.get("blobs") or {}).values()) if isinstance(data, dict) else []
+    except Exception:
+        return []
+
+
+class VerifyCache:
+    """Verification results by path, persisted as JSON (thread-safe)"""
+
+    def __init__(self, cache_file: Path):
+        self.cache_file = Path(cache_file)
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict]] = None
+
+    def _load(self) -> Dict[str, Dict]:
+        if self._entries is None:
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+                    raise ValueError("unsupported cache version")
+                self._entries = data["entries"]
+            except FileNotFoundError:
+                self._entries = {}
+            except Exception as e:
+                warning(f"验证缓存损坏，已重置: {e}")
+                self._entries = {}
+        return self._entries
+
+    def get(self, path: str) -> Optional[Dict]:
+        with self._lock:
+            return self._load().get(path)
+
+    def put(self, path: str, entry: Dict):
+        with self._lock:
+            self._load()[path] = entry
+
+    def retain(self, paths: Iterable[str]) -> int:
+        """Drop results of files that are no longer verified (returns the number dropped)"""
+        keep = set(paths)
+        with self._lock:
+            entries = self._load()
+            stale = [p for p in entries if p not in keep]
+            for path in stale:
+                del entries[path]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+    def save(self):
+        with self._lock:
+            temp_file = self.cache_file.with_suffix('.json.tmp')
+            try:
+                content = json.dumps({"version": CACHE_VERSION, "entries": self._load()}, ensure_ascii=False)
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                temp_file.replace(self.cache_file)
+            except Exception as e:
+                warning(f"保存验证缓存失败: {e}")
+
+
+def _refs_present(entry: Dict) -> bool:
+    store = get_blob_store()
+    return all(store.exists(digest) for digest in entry.get("blobs", ()))
+
+
+def _verify_file(path: str, st: os.stat_result, cached: Optional[Dict], deep: bool, throttle=None) -> Dict:
+    """Read, hash and (unless the hash matches the cached result) verify one file"""
+    from db_manager import verify_backup_bytes
+
+    if throttle is not None:
+        throttle.consume(st.st_size)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    digest = compute_digest(raw)
+    if cached and cached.get("sha256") == digest and _refs_present(cached):
+        entry = dict(cached, size=st.st_size, mtime_ns=st.st_mtime_ns)
+        return {"entry": entry, "bytes_read": len(raw), "verified": False}
+
+    io_stats = {}
+    is_valid, error_msg = verify_backup_bytes(raw, deep=deep, io_stats=io_stats)
+    blob_bytes = io_stats.get("blob_bytes", 0)
+    if throttle is not None and blob_bytes:
+        throttle.consume(blob_bytes)
+    entry = {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": digest,
+        "valid": is_valid,
+        "error": error_msg,
+        "blobs": _blob_refs(raw),
+    }
+    return {"entry": entry, "bytes_read": len(raw) + blob_bytes, "verified": True}
+
+
+def verify_backups(paths: Iterable, cache: Optional[VerifyCache] = None, workers: Optional[int] = None,
+                   deep: bool = True, prune: bool = False, throttle=None, job=None) -> Dict:
+    """
+    Verify backup files, reusing cached results for unchanged files
+
+    Args:
+        paths: Backup files to verify
+        cache: Result cache (None = verify everything, remember nothing)
+        workers: Thread pool size (default: default_workers())
+        deep: Decompress inline sections, read referenced blobs and check their digests
+        prune: Drop cached results of files not in paths
+        throttle: Optional IOThrottle (maintenance_scheduler) charged before each file read
+        job: Optional Job (jobs) for progress and cancellation; results verified
+            before a cancellation are still cached
+
+    Returns:
+        Dict with valid, invalid, invalid_files ({path: error}), cached (results
+        reused), verified (fully verified), bytes_read (backup files plus the
+        blobs read in deep mode), elapsed_seconds, files_per_second and mb_per_second
+    """
+    start = time.perf_counter()
+    paths = [str(p) for p in paths]
+    results: Dict[str, Dict] = {}
+    pending = []
+    cached_count = 0
+    bytes_read = 0
+
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            results[path] = {"valid": False, "error": "备份文件不存在"}
+            continue
+        cached = cache.get(path) if cache is not None else None
+        if (cached and cached.get("size") == st.st_size and cached.get("mtime_ns") == st.st_mtime_ns
+                and _refs_present(cached)):
+            results[path] = cached
+            cached_count += 1
+        else:
+            pending.append((path, st, cached))
+
+    if job is not None:
+        job.set_total(len(paths), sum(st.st_size for _, st, _ in pending))
+        job.advance(len(paths) - len(pending))
+
+    verified_count = 0
+    cancelled = False
+    if pending:
+        with ThreadPoolExecutor(max_workers=workers or default_workers()) as pool:
+            futures = [(path, st, pool.submit(_verify_file, path, st, cached, deep, throttle))
+                       for path, st, cached in pending]
+            for path, st, future in futures:
+                if job is not None and job.cancelled:
+                    cancelled = True
+                    for _, _, remaining in futures:
+                        remaining.cancel()
+                    break
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    results[path] = {"valid": False, "error": f"验证失败: {e}"}
+                    if job is not None:
+                        job.advance(1, st.st_size)
+                    continue
+                entry = outcome["entry"]
+                results[path] = entry
+                bytes_read += outcome["bytes_read"]
+                if outcome["verified"]:
+                    verified_count += 1
+                else:
+                    cached_count += 1
+                if cache is not None:
+                    cache.put(path, entry)
+                if job is not None:
+                    job.advance(1, st.st_size)
+
+    if cancelled:
+        if cache is not None and bytes_read:
+            cache.save()
+        job.check()
+
+    if cache is not None:
+        dropped = cache.retain(paths) if prune else 0
+        if pending or dropped:
+            cache.save()
+
+    invalid_files = {path: r.get("error") for path, r in results.items() if not r.get("valid")}
+    elapsed = time.perf_counter() - start
+    debug(f"验证 {len(paths)} 个备份: {verified_count} 个完整验证, {cached_count} 个使用缓存, "
+          f"读取 {bytes_read / 1024 / 1024:.2f} MB, 耗时 {elapsed * 1000:.1f} ms")
+    return {
+        "valid": len(paths) - len(invalid_files),
+        "invalid": len(invalid_files),
+        "invalid_files": invalid_files,
+        "cached": cached_count,
+        "verified": verified_count,
+        "bytes_read": bytes_read,
+        "elapsed_seconds": elapsed,
+        "files_per_second": len(paths) / elapsed if elapsed > 0 else 0.0,
+        "mb_per_second": bytes_read / 1024 / 1024 / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+_cache_instance: Optional[VerifyCache] = None
+
+
+def get_verify_cache() -> VerifyCache:
+    """Get global verification cache instance (singleton)"""
+    global _cache_instance
+    if _cache_instance is None:
+        _cache_instance = VerifyCache(get_verify_cache_path())
+    return _cache_instance
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Content-Addressed Blob Store
+Stores each backed-up value once, keyed by its SHA-256 digest, with reference counting
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from utils import error, warning, debug, file_lock, get_app_data_dir
+
+
+def get_blobs_dir() -> Path:
+    """Get the blob store directory (~/.antigravity-agent/blobs)"""
+    return get_app_data_dir() / "blobs"
+
+
+# Suffix of zlib-compressed blobs (blobs without it are stored raw)
+COMPRESSED_SUFFIX = ".z"
+
+# decref() keeps blobs that put() touched more recently than this: a backup that
+# is being written may have stored the blob but not taken its reference yet
+PUT_GRACE_SECONDS = 300
+
+
+def compute_digest(data: bytes) -> str:
+    """Get the content address (SHA-256 hex digest) of a blob"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """
+    Content-addressed storage for backup values
+
+    Blobs live in <root>/<first two hex chars>/<digest>.z (zlib-compressed; the
+    digest is always of the uncompressed content). Reference counts are kept in
+    <root>/refcounts.json and updated whenever a backup manifest is written or deleted.
+    Every update re-reads the file under <root>/refcounts.lock, so the GUI and the
+    command line can share a store. The blob count and total size are kept in
+    <root>/stats.json under the same lock, so stats() is a single small read. A blob is removed when its count drops from one
+    to zero; a missing or unreadable count is never treated as zero. In that case the
+    counts are left alone and gc() rebuilds them from the manifests on disk.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.refcounts_file = self.root / "refcounts.json"
+        self.stats_file = self.root / "stats.json"
+        self.lock_file = self.root / "refcounts.lock"
+        self._lock = threading.RLock()
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest}{COMPRESSED_SUFFIX}"
+
+    def _existing_path(self, digest: str) -> Optional[Path]:
+        path = self.blob_path(digest)
+        if path.exists():
+            return path
+        raw_path = path.with_name(digest)
+        if raw_path.exists():
+            return raw_path
+        return None
+
+    def exists(self, digest: str) -> bool:
+        # os.path on plain strings: called once per referenced blob when verifying
+        base = os.path.join(str(self.root), digest[:2], digest)
+        return os.path.exists(base + COMPRESSED_SUFFIX) or os.path.exists(base)
+
+    def put(self, data: bytes) -> str:
+        """
+        Store a blob (no-op if identical content is already stored)
+
+        Returns:
+            Digest of the blob
+        """
+        digest = compute_digest(data)
+        with self._lock, file_lock(self.lock_file):
+            # Under the lock a concurrent decref() either deleted the blob already
+            # (and it is written again below) or sees the refreshed mtime and keeps it
+            existing = self._existing_path(digest)
+            if existing is not None:
+                # Refresh the mtime so decref() and gc(grace_before=...) see the blob as recently used
+                try:
+                    os.utime(existing)
+                except OSError:
+                    pass
+                return digest
+            if not self.refcounts_file.exists() and next(self.iter_digests(), None) is None:
+                # New store: start with known (empty) counts before the first blob exists
+                self._save_refcounts({})
+
+        path = self.blob_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{digest}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(zlib.compress(data, 6))
+            with self._lock, file_lock(self.lock_file):
+                if self._existing_path(digest) is not None:
+                    # Another writer stored the same content meanwhile
+                    temp_path.unlink()
+                    return digest
+                size = temp_path.stat().st_size
+                temp_path.replace(path)
+                self._adjust_stats(1, size)
+        except Exception:
+            if temp_path.exists():
+                try:
+                    temp_path.unlink()
+                except:
+                    pass
+            raise
+        return digest
+
+    def get(self, digest: str, verify: bool = True) -> bytes:
+        """
+        Read a blob
+
+        Raises:
+            FileNotFoundError: If the blob is missing
+            ValueError: If verify is set and the content does not match the digest
+        """
+        return self.read(digest, verify)[0]
+
+    def read(self, digest: str, verify: bool = True) -> Tuple[bytes, int]:
+        """
+        Read a blob and report the I/O it took
+
+        Returns:
+            Tuple of (content, bytes read from disk)
+
+        Raises:
+            Same as get()
+        """
+        path = self._existing_path(digest)
+        if path is None:
+            raise FileNotFoundError(f"Blob not found: {digest}")
+        with open(path, 'rb') as f:
+            data = f.read()
+        size = len(data)
+        if path.name.endswith(COMPRESSED_SUFFIX):
+            data = zlib.decompress(data)
+        if verify and compute_digest(data) != digest:
+            raise ValueError(f"Blob content does not match digest: {digest}")
+        return data, size
+
+    # ---------------------------------------------------------------------
+    # Reference counting
+    # ---------------------------------------------------------------------
+
+    def _read_refcounts(self) -> Optional[Dict[str, int]]:
+        """
+        Read the reference counts from disk (call with the file lock held)
+
+        Returns:
+            Digest -> count, or None if the counts are unknown: the file is
+            unreadable, or missing while blobs exist (gc() rebuilds it)
+        """
+        try:
+            with open(self.refcounts_file, 'r', encoding='utf-8') as f:
+                refcounts = json.load(f)
+            if not isinstance(refcounts, dict):
+                raise ValueError("not an object")
+            return refcounts
+        except FileNotFoundError:
+            if next(self.iter_digests(), None) is not None:
+                warning("引用计数文件缺失，将在下次垃圾回收时重建")
+                return None
+            return {}
+        except Exception as e:
+            warning(f"引用计数文件损坏，将在下次垃圾回收时重建: {e}")
+            return None
+
+    def _save_refcounts(self, refcounts: Dict[str, int]):
+        self.root.mkdir(parents=True, exist_ok=True)
+        temp_file = self.refcounts_file.with_name(f"refcounts.json.{os.getpid()}.tmp")
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(refcounts, f)
+            temp_file.replace(self.refcounts_file)
+        except Exception as e:
+            error(f"保存引用计数失败: {e}")
+
+    # ---------------------------------------------------------------------
+    # Totals
+    # ---------------------------------------------------------------------
+
+    def _read_stats(self) -> Optional[Dict]:
+        try:
+            with open(self.stats_file, 'r', encoding='utf-8') as f:
+                stats = json.load(f)
+            if isinstance(stats.get("blob_count"), int) and isinstance(stats.get("blob_size_bytes"), int):
+                return stats
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            debug(f"数据块统计文件无效，将重新扫描: {e}")
+        return None
+
+    def _save_stats(self, blob_count: int, blob_size_bytes: int):
+        self.root.mkdir(parents=True, exist_ok=True)
+        temp_file = self.stats_file.with_name(f"stats.json.{os.getpid()}.tmp")
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({"blob_count": blob_count, "blob_size_bytes": blob_size_bytes}, f)
+            temp_file.replace(self.stats_file)
+        except Exception as e:
+            warning(f"保存数据块统计失败: {e}")
+
+    def _adjust_stats(self, count_delta: int, size_delta: int):
+        """Apply a change to the stored totals (call with the file lock held)"""
+        stats = self._read_stats()
+        if stats is None:
+            # Unknown totals are rebuilt by the next stats() scan
+            return
+        self._save_stats(max(0, stats["blob_count"] + count_delta),
+                         max(0, stats["blob_size_bytes"] + size_delta))
+
+    def _scan_stats(self) -> Dict:
+        count = 0
+        size = 0
+        for blob in self._iter_blob_entries():
+            if not blob.name.endswith(".tmp"):
+                size += blob.stat().st_size
+                count += 1
+        return {"blob_count": count, "blob_size_bytes": size}
+
+    def refcount(self, digest: str) -> int:
+        with self._lock, file_lock(self.lock_file):
+            return (self._read_refcounts() or {}).get(digest, 0)
+
+    def incref(self, digests: Iterable[str]):
+        """Add one reference to each digest"""
+        with self._lock, file_lock(self.lock_file):
+            refcounts = self._read_refcounts()
+            if refcounts is None:
+                return
+            for digest in digests:
+                refcounts[digest] = refcounts.get(digest, 0) + 1
+            self._save_refcounts(refcounts)
+
+    def decref(self, digests: Iterable[str]) -> int:
+        """
+        Drop one reference from each digest and delete blobs no longer referenced
+
+        Digests without a recorded count are skipped, and blobs put() touched in the
+        last PUT_GRACE_SECONDS are kept; gc() sweeps both later.
+
+        Returns:
+            Bytes freed
+        """
+        freed = 0
+        deleted = 0
+        with self._lock, file_lock(self.lock_file):
+            refcounts = self._read_refcounts()
+            if refcounts is None:
+                return 0
+            recent = time.time() - PUT_GRACE_SECONDS
+            for digest in digests:
+                count = refcounts.get(digest)
+                if not isinstance(count, int) or count <= 0:
+                    continue
+                if count > 1:
+                    refcounts[digest] = count - 1
+                    continue
+                del refcounts[digest]
+                path = self._existing_path(digest)
+                try:
+                    if path is not None and path.stat().st_mtime < recent:
+                        size = self._delete_blob(digest)
+                        freed += size
+                        deleted += int(size > 0)
+                except OSError:
+                    pass
+            self._save_refcounts(refcounts)
+            if deleted:
+                self._adjust_stats(-deleted, -freed)
+        return freed
+
+    def _delete_blob(self, digest: str) -> int:
+        path = self._existing_path(digest)
+        if path is None:
+            return 0
+        try:
+            size = path.stat().st_size
+            path.unlink()
+            debug(f"已删除无引用的数据块: {digest}")
+            return size
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            warning(f"删除数据块失败 {digest}: {e}")
+            return 0
+
+    def iter_digests(self):
+        """Yield the digest of every stored blob"""
+        for blob in self._iter_blob_entries():
+            if not blob.name.endswith(".tmp"):
+                yield blob.name[:-len(COMPRESSED_SUFFIX)] if blob.name.endswith(COMPRESSED_SUFFIX) else blob.name
+
+    def gc(self, references: Dict[str, int], dry_run: bool = False,
+           grace_before: Optional[float] = None) -> Dict:
+        """
+        Rebuild reference counts from the given references and sweep unreferenced blobs
+
+        Args:
+            references: Digest -> number of manifests referencing it (from a directory scan)
+            dry_run: If True, only report what would be deleted
+            grace_before: If set, *.tmp leftovers of interrupted writes modified before
+                          this timestamp are removed, and unreferenced blobs modified
+                          after it are kept (a backup referencing them may be
+                          in the middle of being written)
+
+        Returns:
+            Dict with blobs_deleted, bytes_freed, temp_files_deleted, and the
+            blob_count / blob_size_bytes of the blobs that remain
+        """
+        result = {"blobs_deleted": 0, "bytes_freed": 0, "temp_files_deleted": 0,
+                  "blob_count": 0, "blob_size_bytes": 0}
+        with self._lock, file_lock(self.lock_file):
+            for blob in self._iter_blob_entries():
+                st = blob.stat()
+                size = st.st_size
+                if blob.name.endswith(".tmp"):
+                    if grace_before is None or st.st_mtime >= grace_before:
+                        continue
+                    if not dry_run:
+                        try:
+                            os.remove(blob.path)
+                        except OSError as e:
+                            warning(f"删除临时文件失败 {blob.path}: {e}")
+                            continue
+                    result["temp_files_deleted"] += 1
+                    result["bytes_freed"] += size
+                    continue
+
+                digest = blob.name[:-len(COMPRESSED_SUFFIX)] if blob.name.endswith(COMPRESSED_SUFFIX) else blob.name
+                if references.get(digest, 0) > 0 or (grace_before is not None and st.st_mtime >= grace_before):
+                    result["blob_count"] += 1
+                    result["blob_size_bytes"] += size
+                    continue
+                if not dry_run:
+                    size = self._delete_blob(digest)
+                result["blobs_deleted"] += 1
+                result["bytes_freed"] += size
+
+            if not dry_run:
+                self._save_refcounts({d: c for d, c in references.items() if c > 0})
+                self._save_stats(result["blob_count"], result["blob_size_bytes"])
+        return result
+
+    def _iter_blob_entries(self):
+        """Yield a DirEntry for every file in the shard directories (stat results are cached)"""
+        if not self.root.exists():
+            return
+        for shard in os.scandir(self.root):
+            if not shard.is_dir() or len(shard.name) != 2:
+                continue
+            for blob in os.scandir(shard.path):
+                if blob.is_file():
+                    yield blob
+
+    def stats(self) -> Dict:
+        """
+        Get blob count and total size
+
+        Read from stats.json; the directory is scanned (and the file rewritten)
+        only when it is missing or unreadable.
+        """
+        stats = self._read_stats()
+        if stats is not None:
+            return {"blob_count": stats["blob_count"], "blob_size_bytes": stats["blob_size_bytes"]}
+        with self._lock, file_lock(self.lock_file):
+            stats = self._scan_stats()
+            self._save_stats(stats["blob_count"], stats["blob_size_bytes"])
+        return stats
+
+
+_store_instance: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """Get global blob store instance (singleton)"""
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = BlobStore(get_blobs_dir())
+    return _store_instance
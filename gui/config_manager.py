@@ -8,7 +8,7 @@ import os
 from pathlib import Path
 from typing import Any, Dict, Optional
 
-from utils import info, error, warning, get_app_data_dir
+from utils import info, error, warning, get_app_data_dir, set_debug_logging, set_structured_logging
 
 # Default configuration
 DEFAULT_CONFIG = {
@@ -27,7 +27,17 @@ DEFAULT_CONFIG = {
     "db_timeout": 30.0,
     "db_max_retries": 3,
     "process_close_timeout": 10,
+    "wait_for_ready": False,  # After a switch, wait until Antigravity has opened its database
+    "ready_timeout": 30,  # Seconds to wait for Antigravity to become ready
+    "switch_strategy": "restore",  # "restore" (patch state.vscdb), "swap" (rename in a prepared copy) or "instance" (one isolated instance per account)
+    "antigravity_executable": "",  # Executable used to launch isolated instances (empty = platform default)
+    "rotation_cooldown_minutes": 0,  # Minimum minutes before an account is picked again by rotation
+    "background_maintenance": True,  # Run retention, cleanup and verification in the background
+    "maintenance_interval_hours": 24,  # Minimum hours between background maintenance runs
+    "maintenance_idle_seconds": 120,  # Wait this long after the last switch/backup before running
+    "maintenance_io_limit_mb": 5,  # Background maintenance I/O limit in MB/s (0 = unlimited)
     "enable_debug_logging": False,
+    "structured_logging": False,  # Also write every log call as a JSON line to events.jsonl
 }
 
 
@@ -56,6 +66,7 @@ class ConfigManager:
             
             # Validate and migrate if needed
             self._validate_config()
+            self._apply_runtime_settings()
             
             info("配置加载成功")
             return True
@@ -80,6 +91,7 @@ class ConfigManager:
     
     def save(self) -> bool:
         """Save configuration to file (atomic write)"""
+        self._apply_runtime_settings()
         temp_file = self.config_file.with_suffix('.json.tmp')
         
         try:
@@ -126,6 +138,11 @@ class ConfigManager:
         self._config = DEFAULT_CONFIG.copy()
         return self.save()
     
+    def _apply_runtime_settings(self):
+        """Push settings that other modules read without loading the config"""
+        set_debug_logging(self._config.get("enable_debug_logging", False))
+        set_structured_logging(self._config.get("structured_logging", False))
+    
     def _validate_config(self):
         """Validate and fix configuration values"""
         # Ensure numeric values are in valid ranges
@@ -144,6 +161,22 @@ class ConfigManager:
         if self._config.get("process_close_timeout", 5) < 5:
             self._config["process_close_timeout"] = 5
         
+        if self._config.get("ready_timeout", 30) <= 0:
+            self._config["ready_timeout"] = 30
+        
+        if self._config.get("rotation_cooldown_minutes", 0) < 0:
+            self._config["rotation_cooldown_minutes"] = 0
+        
+        if self._config.get("maintenance_interval_hours", 24) <= 0:
+            self._config["maintenance_interval_hours"] = 24
+        
+        for key in ("maintenance_idle_seconds", "maintenance_io_limit_mb"):
+            if self._config.get(key, 0) < 0:
+                self._config[key] = 0
+        
+        if self._config.get("switch_strategy") not in ("restore", "swap", "instance"):
+            self._config["switch_strategy"] = "restore"
+        
         # Ensure theme mode is valid
         valid_themes = ["light", "dark", "system"]
         if self._config.get("theme_mode") not in valid_themes:
@@ -3,10 +3,19 @@ import sqlite3
 import json
 import os
 import time
+import zlib
 from datetime import datetime
+from pathlib import Path
 
 # Use relative imports
 from utils import info, error, warning, debug, get_antigravity_db_paths
+from blob_store import compute_digest, get_blob_store
+from backup_index import get_backup_index
+from backup_generations import push_generation, drop_generation, prune_generations, load_generation, delete_generations
+from backup_format import (
+    MAGIC, BackupFormatError, FORMAT_VERSION, decode_header, encode_backup, is_v2_file,
+    metadata_from_v1, read_header, read_metadata, read_section
+)
 
 # 需要备份的键列表
 KEYS_TO_BACKUP = [
@@ -14,6 +23,12 @@ KEYS_TO_BACKUP = [
     "jetskiStateSync.agentManagerInitState",
 ]
 
+# 备份文件格式版本
+# 1.0: JSON，键值直接内嵌
+# 1.1: JSON 清单，键值存放在内容寻址的数据块存储中，"blobs" 记录 键 -> 摘要
+# 2.0: 二进制格式 (见 backup_format)，头部记录元数据，键值为压缩数据段或数据块引用
+BACKUP_VERSION = FORMAT_VERSION
+
 # Database connection settings
 DB_TIMEOUT = 30.0  # 30 seconds timeout
 MAX_RETRIES = 3
@@ -43,10 +58,11 @@ def get_db_connection(db_path, max_retries=3, timeout=10.0):
             if "locked" in error_msg.lower():
                 if attempt < max_retries - 1:
                     wait_time = (attempt + 1) * 2  # 指数退避: 2s, 4s, 6s
-                    warning(f"数据库被锁定，{wait_time}秒后重试 (尝试 {attempt + 1}/{max_retries})...")
+                    warning(f"数据库被锁定，{wait_time}秒后重试 (尝试 {attempt + 1}/{max_retries})...",
+                            event="db_locked", db_path=db_path, retry=attempt + 1)
                     time.sleep(wait_time)
                 else:
-                    error(f"数据库被锁定: {e}")
+                    error(f"数据库被锁定: {e}", event="db_locked", db_path=db_path, retry=attempt + 1)
                     error("提示: 请确保 Antigravity 应用已完全关闭")
                     return None
             else:
@@ -67,8 +83,6 @@ def verify_backup_integrity(backup_file_path):
     Returns:
         tuple: (is_valid, error_message)
     """
-    import hashlib
-    
     try:
         if not os.path.exists(backup_file_path):
             return False, "备份文件不存在"
@@ -81,34 +95,171 @@ def verify_backup_integrity(backup_file_path):
         if file_size > 50 * 1024 * 1024:  # 50MB
             return False, "备份文件异常大，可能已损坏"
         
-        # 尝试解析 JSON
-        with open(backup_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # 读取元数据 (v2 只读取头部，v1 需解析整个 JSON)
+        try:
+            if is_v2_file(backup_file_path):
+                data, payload_offset = read_header(backup_file_path)
+            else:
+                data, payload_offset = read_metadata(backup_file_path, KEYS_TO_BACKUP), None
+        except BackupFormatError as e:
+            return False, f"备份文件格式错误: {e}"
+        
+        return _check_backup_metadata(data, payload_offset, file_size)
+        
+    except json.JSONDecodeError as e:
+        return False, f"JSON 解析失败: {e}"
+    except Exception as e:
+        return False, f"验证失败: {e}"
+
+def _check_backup_metadata(data, payload_offset, file_size):
+    """检查备份头部: 账号信息、时间戳、数据是否存在，数据块是否存在、数据段是否完整"""
+    if "account_email" not in data:
+        return False, "备份文件缺少账号信息"
+    
+    if "backup_time" not in data:
+        return False, "备份文件缺少时间戳"
+    
+    # 检查是否有实际数据
+    entries = data["entries"]
+    has_data = any(key in entries for key in KEYS_TO_BACKUP)
+    if not has_data:
+        return False, "备份文件不包含有效数据"
+    
+    # 检查数据块是否存在、数据段是否完整
+    store = get_blob_store()
+    for key, entry in entries.items():
+        if entry.get("blob"):
+            if not store.exists(entry["sha256"]):
+                return False, f"数据块缺失: {key}"
+        elif payload_offset is not None:
+            if payload_offset + entry["offset"] + entry["length"] > file_size:
+                return False, f"数据段被截断: {key}"
+    
+    return True, None
+
+def verify_backup_bytes(raw, deep=True, io_stats=None):
+    """验证内存中的备份文件内容
+    
+    Args:
+        raw: 备份文件的全部字节
+        deep: 为 True 时解压每个内嵌数据段、读取每个引用的数据块，并校验其 SHA-256 摘要
+        io_stats: 可选字典，deep 模式下从数据块读取的字节数累加到其 "blob_bytes" 中
+    
+    Returns:
+        tuple: (is_valid, error_message)
+    """
+    is_valid, error_msg, _ = _check_backup_bytes(raw, deep=deep, io_stats=io_stats)
+    return is_valid, error_msg
+
+def load_verified_backup_bytes(raw):
+    """一次解析完成内存中备份内容的校验与读取
+    
+    每个键值 (内嵌数据段或数据块) 在解码的同时与头部记录的 SHA-256 摘要比对。
+    
+    Returns:
+        tuple: (backup_data, error_message)，校验失败时 backup_data 为 None
+    """
+    is_valid, error_msg, data = _check_backup_bytes(raw, deep=True, decode=True)
+    return (data, None) if is_valid else (None, error_msg)
+
+def read_verified_backup(backup_file_path):
+    """读取一次备份文件，同时完成完整性校验与数据读取
+    
+    Returns:
+        tuple: (backup_data, error_message)，校验失败时 backup_data 为 None
+    """
+    try:
+        with open(backup_file_path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None, "备份文件不存在"
+    except OSError as e:
+        return None, f"读取备份文件失败: {e}"
+    return load_verified_backup_bytes(raw)
+
+def _check_backup_bytes(raw, deep=True, decode=False, io_stats=None):
+    """校验 (并可选解码) 内存中的备份内容，头部只解析一次
+    
+    读取的数据块字节数累加到 io_stats["blob_bytes"] (io_stats 不为 None 时)
+    
+    Returns:
+        tuple: (is_valid, error_message, backup_data)，decode 为 False 时 backup_data 为 None
+    """
+    try:
+        if not raw:
+            return False, "备份文件为空", None
         
-        # 检查必需字段
-        if not isinstance(data, dict):
-            return False, "备份文件格式错误"
+        if len(raw) > 50 * 1024 * 1024:  # 50MB
+            return False, "备份文件异常大，可能已损坏", None
         
-        if "account_email" not in data:
-            return False, "备份文件缺少账号信息"
+        v1_data = None
+        try:
+            if raw.startswith(MAGIC):
+                header, payload_offset = decode_header(raw)
+            else:
+                v1_data = json.loads(raw)
+                header, payload_offset = metadata_from_v1(v1_data, KEYS_TO_BACKUP), None
+        except BackupFormatError as e:
+            return False, f"备份文件格式错误: {e}", None
         
-        if "backup_time" not in data:
-            return False, "备份文件缺少时间戳"
+        is_valid, error_msg = _check_backup_metadata(header, payload_offset, len(raw))
+        if not is_valid or not (deep or decode):
+            return is_valid, error_msg, None
         
-        # 检查是否有实际数据
-        has_data = any(key in data for key in KEYS_TO_BACKUP)
-        if not has_data:
-            return False, "备份文件不包含有效数据"
+        store = get_blob_store()
         
-        return True, None
+        def read_blob(digest):
+            value, size = store.read(digest, verify=True)  # 读取时校验摘要
+            if io_stats is not None:
+                io_stats["blob_bytes"] = io_stats.get("blob_bytes", 0) + size
+            return value
         
-    except json.JSONDecodeError as e:
-        return False, f"JSON 解析失败: {e}"
+        if v1_data is not None:
+            data = dict(v1_data)
+            for key, digest in (data.pop("blobs", None) or {}).items():
+                data[key] = read_blob(digest).decode('utf-8')
+            return True, None, data if decode else None
+        
+        values = {}
+        for key, entry in header["entries"].items():
+            if entry.get("blob"):
+                value = read_blob(entry["sha256"])
+                if len(value) != entry["size"]:
+                    return False, f"数据块校验失败: {key}", None
+                values[key] = value
+                continue
+            start = payload_offset + entry["offset"]
+            value = zlib.decompress(raw[start:start + entry["length"]])
+            if len(value) != entry["size"] or compute_digest(value) != entry["sha256"]:
+                return False, f"数据段校验失败: {key}", None
+            values[key] = value
+        
+        if not decode:
+            return True, None, None
+        data = {k: v for k, v in header.items() if k != "entries"}
+        for key, value in values.items():
+            data[key] = value.decode('utf-8')
+        return True, None, data
+        
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        return False, f"JSON 解析失败: {e}", None
+    except zlib.error as e:
+        return False, f"数据段解压失败: {e}", None
+    except FileNotFoundError as e:
+        return False, f"数据块缺失: {e}", None
+    except ValueError as e:
+        return False, f"数据块校验失败: {e}", None
     except Exception as e:
-        return False, f"验证失败: {e}"
+        return False, f"验证失败: {e}", None
+
+def backup_account(email, backup_file_path, generations=1):
+    """备份账号数据到文件，支持完整性验证
 
-def backup_account(email, backup_file_path):
-    """备份账号数据到 JSON 文件，支持完整性验证"""
+    Args:
+        email: 账号邮箱
+        backup_file_path: 备份文件路径
+        generations: 保留的版本数 (含当前版本)，大于 1 时旧备份转为历史版本
+    """
     db_paths = get_antigravity_db_paths()
     if not db_paths:
         error("未找到 Antigravity 数据库路径")
@@ -120,6 +271,7 @@ def backup_account(email, backup_file_path):
         return False
         
     info(f"正在从数据库备份数据: {db_path}")
+    start = time.perf_counter()
     conn = get_db_connection(db_path)
     if not conn:
         return False
@@ -145,44 +297,15 @@ def backup_account(email, backup_file_path):
         # 2. 添加元数据
         data_map["account_email"] = email
         data_map["backup_time"] = datetime.now().isoformat()
-        data_map["backup_version"] = "1.0"
         
-        # 3. 写入临时文件
-        temp_file = backup_file_path + ".tmp"
-        try:
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(data_map, f, ensure_ascii=False, indent=2)
-            
-            # 4. 验证备份完整性
-            is_valid, error_msg = verify_backup_integrity(temp_file)
-            if not is_valid:
-                error(f"备份验证失败: {error_msg}")
-                os.remove(temp_file)
-                return False
-            
-            # 5. 原子性替换（如果旧备份存在，先备份）
-            if os.path.exists(backup_file_path):
-                old_backup = backup_file_path + ".old"
-                if os.path.exists(old_backup):
-                    os.remove(old_backup)
-                os.rename(backup_file_path, old_backup)
-            
-            os.rename(temp_file, backup_file_path)
-            
-            # 6. 清理旧备份
-            old_backup = backup_file_path + ".old"
-            if os.path.exists(old_backup):
-                os.remove(old_backup)
-            
-            info(f"备份成功: {backup_file_path}")
-            return True
-            
-        except IOError as e:
-            error(f"写入备份文件失败: {e}")
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+        # 3. 写入备份 (数据块存储 + v2 头部)，旧备份转为历史版本并按上限淘汰最旧的版本
+        if not update_backup(data_map, backup_file_path, generations):
             return False
         
+        info(f"备份成功: {backup_file_path}", event="backup_db", db_path=db_path,
+             duration=time.perf_counter() - start, bytes=os.path.getsize(backup_file_path))
+        return True
+        
     except sqlite3.Error as e:
         error(f"数据库查询出错: {e}")
         return False
@@ -197,25 +320,239 @@ def backup_account(email, backup_file_path):
         except:
             pass
 
-def restore_account(backup_file_path):
-    """从 JSON 文件恢复账号数据，支持完整性验证和回滚"""
-    if not os.path.exists(backup_file_path):
-        error(f"备份文件不存在: {backup_file_path}")
+def encode_backup_value(value):
+    """将数据库中的值编码为备份内容"""
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, str):
+        value = json.dumps(value)
+    return value.encode('utf-8')
+
+def read_backup_refs(backup_file_path):
+    """读取备份文件引用的数据块 (文件不存在或无法解析时返回空列表)"""
+    try:
+        header = read_metadata(backup_file_path)
+    except Exception:
+        return []
+    return [entry["sha256"] for entry in header["entries"].values() if entry.get("blob")]
+
+def encode_backup_data(data_map, store=None):
+    """将备份数据编码为 v2 格式字节
+    
+    Args:
+        data_map: 包含 account_email、backup_time 以及 KEYS_TO_BACKUP 中键值的字典
+        store: 数据块存储；为 None 时键值以压缩数据段内嵌 (自包含)
+    
+    Returns:
+        tuple: (文件字节, 头部字典)
+    """
+    meta = {
+        "account_email": data_map.get("account_email", "Unknown"),
+        "backup_time": data_map.get("backup_time") or datetime.now().isoformat(),
+    }
+    values = {key: encode_backup_value(data_map[key]) for key in KEYS_TO_BACKUP if key in data_map}
+    return encode_backup(meta, values, store=store)
+
+def write_backup(data_map, backup_file_path, inline=False):
+    """以 v2 格式原子写入备份文件
+
+    Args:
+        data_map: 包含 account_email、backup_time 以及 KEYS_TO_BACKUP 中键值的字典
+        backup_file_path: 备份文件路径
+        inline: True 时键值以压缩数据段写入文件本身 (自包含，用于导出)；
+                否则写入数据块存储，文件只包含头部
+
+    相同内容的值在数据块存储中只存储一次；新文件替换成功后，
+    旧文件引用的数据块引用计数减一。
+    """
+    store = None if inline else get_blob_store()
+    backup_file_path = str(backup_file_path)
+    
+    try:
+        payload, header = encode_backup_data(data_map, store=store)
+    except Exception as e:
+        error(f"写入数据块失败: {e}")
         return False
     
-    # 1. 验证备份文件完整性
-    info("验证备份文件完整性...")
-    is_valid, error_msg = verify_backup_integrity(backup_file_path)
+    old_refs = read_backup_refs(backup_file_path)
+    new_refs = [entry["sha256"] for entry in header["entries"].values() if entry.get("blob")]
+    
+    index = get_backup_index()
+    index.prepare(backup_file_path)
+    
+    # 验证备份完整性 (直接校验内存中的字节；摘要由 encode_backup 刚刚计算，无需重新读取数据块)
+    is_valid, error_msg = verify_backup_bytes(payload, deep=False)
     if not is_valid:
-        error(f"备份文件验证失败: {error_msg}")
+        error(f"备份验证失败: {error_msg}")
         return False
     
-    # 2. 读取备份数据
+    temp_file = backup_file_path + ".tmp"
     try:
-        with open(backup_file_path, 'r', encoding='utf-8') as f:
-            backup_data = json.load(f)
-    except Exception as e:
-        error(f"读取备份文件失败: {e}")
+        with open(temp_file, 'wb') as f:
+            f.write(payload)
+        
+        # 写入磁盘的内容只需与已验证的字节逐字节比对，通过后才替换旧备份
+        with open(temp_file, 'rb') as f:
+            written = f.read()
+        if written != payload:
+            error("备份验证失败: 写入的内容与备份数据不一致")
+            os.remove(temp_file)
+            return False
+        
+        # 先增加新引用，再替换文件，最后释放旧引用，避免共享数据块被误删
+        if new_refs:
+            store.incref(new_refs)
+        os.replace(temp_file, backup_file_path)
+        if old_refs:
+            get_blob_store().decref(old_refs)
+        index.record(backup_file_path)
+        return True
+        
+    except IOError as e:
+        error(f"写入备份文件失败: {e}")
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        return False
+
+def update_backup(data_map, backup_file_path, generations=1):
+    """替换账号的当前备份，旧备份转为历史版本
+
+    先保存历史版本再替换当前备份：历史版本保存失败时不覆盖旧备份，
+    替换失败时撤销刚保存的历史版本，任何一步失败都不会丢失上一个快照。
+
+    Args:
+        data_map: 新的备份数据
+        backup_file_path: 当前备份文件路径
+        generations: 保留的版本总数 (含当前备份)
+    """
+    previous_data = None
+    if generations > 1 and os.path.exists(backup_file_path):
+        try:
+            previous_data = load_backup_data(backup_file_path)
+        except Exception as e:
+            warning(f"无法读取旧备份，本次不保留历史版本: {e}")
+    
+    seq = None
+    if previous_data is not None:
+        try:
+            seq = push_generation(backup_file_path, previous_data, data_map)
+        except Exception as e:
+            error(f"保存历史版本失败，保留旧备份: {e}")
+            return False
+    
+    if not write_backup(data_map, backup_file_path):
+        if seq is not None:
+            drop_generation(backup_file_path, seq)
+        return False
+    prune_generations(backup_file_path, generations)
+    return True
+
+def load_backup_data(backup_file_path, keys=None):
+    """读取备份文件，返回键值已展开的备份数据
+
+    兼容 1.0 (内嵌)、1.1 (JSON 清单) 与 2.0 (二进制) 格式。
+    v2 文件只解压 keys 中指定的数据段 (默认全部)。
+
+    Raises:
+        FileNotFoundError: 备份文件或数据块不存在
+        ValueError: 文件格式错误或数据块内容与摘要不符
+    """
+    store = get_blob_store()
+    
+    if is_v2_file(backup_file_path):
+        header, payload_offset = read_header(backup_file_path)
+        data = {k: v for k, v in header.items() if k != "entries"}
+        for key, entry in header["entries"].items():
+            if keys is not None and key not in keys:
+                continue
+            if entry.get("blob"):
+                raw = store.get(entry["sha256"])
+            else:
+                raw = read_section(backup_file_path, payload_offset, entry)
+            data[key] = raw.decode('utf-8')
+        return data
+    
+    with open(backup_file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    
+    blobs = data.pop("blobs", None) or {}
+    for key, digest in blobs.items():
+        if keys is not None and key not in keys:
+            continue
+        data[key] = store.get(digest).decode('utf-8')
+    return data
+
+def migrate_backup_file(backup_file_path):
+    """将 1.x 格式的备份文件原地迁移为 v2 格式
+
+    Returns:
+        bool: 是否进行了迁移 (已是 v2 或失败时返回 False)
+    """
+    if is_v2_file(backup_file_path):
+        return False
+    
+    data = load_backup_data(backup_file_path)
+    return write_backup(data, backup_file_path)
+
+def delete_backup_file(backup_file_path, update_index=True):
+    """删除备份文件 (含历史版本) 并释放其引用的数据块
+
+    Args:
+        backup_file_path: 备份文件路径
+        update_index: 为 False 时不更新备份索引，由调用方批量删除后统一调用 forget()
+
+    Returns:
+        int: 释放的字节数 (清单文件 + 不再被引用的数据块)
+    """
+    refs = read_backup_refs(backup_file_path)
+    size = os.path.getsize(backup_file_path)
+    index = get_backup_index()
+    if update_index:
+        index.prepare(backup_file_path)
+    os.remove(backup_file_path)
+    if update_index:
+        index.forget(backup_file_path)
+    delete_generations(backup_file_path)
+    if refs:
+        size += get_blob_store().decref(refs)
+    return size
+
+def _load_restore_data(backup_file_path, generation=0):
+    """读取要恢复的备份数据，失败时记录错误并返回 None"""
+    if not os.path.exists(backup_file_path):
+        error(f"备份文件不存在: {backup_file_path}")
+        return None
+    
+    # 读取备份数据并校验完整性 (一次读取，每个键值按摘要校验)
+    info("验证备份文件完整性...")
+    backup_data, error_msg = read_verified_backup(backup_file_path)
+    if backup_data is None:
+        error(f"备份文件验证失败: {error_msg}")
+        return None
+    
+    # 历史版本以当前版本为基础重建
+    if generation:
+        try:
+            backup_data = load_generation(backup_file_path, generation, current_data=backup_data)
+        except Exception as e:
+            error(f"读取备份文件失败: {e}")
+            return None
+        if backup_data is None:
+            error(f"备份不存在第 {generation} 个历史版本")
+            return None
+        info(f"恢复历史版本 #{generation} ({backup_data.get('backup_time')})")
+    return backup_data
+
+def restore_account(backup_file_path, generation=0):
+    """从备份文件恢复账号数据，支持完整性验证和回滚
+
+    Args:
+        backup_file_path: 备份文件路径
+        generation: 要恢复的版本 (0 = 当前版本，1 = 上一个版本 ...)
+    """
+    # 1-2. 读取并校验备份，按需重建历史版本
+    backup_data = _load_restore_data(backup_file_path, generation)
+    if backup_data is None:
         return False
     
     # 3. 获取数据库路径
@@ -299,6 +636,7 @@ def _restore_single_db(db_path, backup_data):
         return False
         
     info(f"正在恢复数据库: {db_path}")
+    start = time.perf_counter()
     conn = get_db_connection(db_path)
     if not conn:
         return False
@@ -329,7 +667,8 @@ def _restore_single_db(db_path, backup_data):
         
         # 提交事务
         conn.commit()
-        info(f"数据库恢复完成: {db_path} (恢复了 {len(restored_keys)} 个字段)")
+        info(f"数据库恢复完成: {db_path} (恢复了 {len(restored_keys)} 个字段)", event="restore_db",
+             db_path=db_path, duration=time.perf_counter() - start)
         return True
         
     except sqlite3.Error as e:
@@ -354,6 +693,132 @@ def _restore_single_db(db_path, backup_data):
             pass
 
 
+def seed_database(db_path, backup_file_path, generation=0, template_db=None):
+    """用备份创建一个新的 state.vscdb (用于独立实例的 --user-data-dir 和 swap 切换)
+
+    没有模板时新数据库只包含备份中的账号字段，其余状态由 Antigravity 首次启动时创建；
+    有模板时先通过 SQLite 在线备份复制模板 (Antigravity 运行中也能得到一致的快照)，
+    再写入账号字段。先写入临时文件再原子替换，已有的数据库不会被半途写坏。
+
+    Args:
+        db_path: 要创建的数据库路径 (父目录不存在时自动创建)
+        backup_file_path: 备份文件路径
+        generation: 要使用的备份版本 (0 = 当前版本)
+        template_db: 作为基础的数据库 (通常是当前的 state.vscdb)，不存在时忽略
+    """
+    backup_data = _load_restore_data(backup_file_path, generation)
+    if backup_data is None:
+        return False
+
+    db_path = Path(db_path)
+    temp_path = db_path.with_name(db_path.name + ".tmp")
+    try:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        for leftover in (temp_path, Path(str(temp_path) + "-wal"), Path(str(temp_path) + "-shm")):
+            if leftover.exists():
+                leftover.unlink()
+        conn = sqlite3.connect(temp_path)
+        try:
+            if template_db and os.path.exists(template_db):
+                source = sqlite3.connect(f"file:{Path(template_db).as_posix()}?mode=ro", uri=True, timeout=DB_TIMEOUT)
+                try:
+                    source.backup(conn)
+                finally:
+                    source.close()
+            # 与 Antigravity (VS Code) 的 state.vscdb 结构相同
+            conn.execute("CREATE TABLE IF NOT EXISTS ItemTable (key TEXT UNIQUE ON CONFLICT REPLACE, value BLOB)")
+            conn.commit()
+        finally:
+            conn.close()
+        if not _restore_single_db(temp_path, backup_data):
+            temp_path.unlink()
+            return False
+        os.replace(temp_path, db_path)
+        info(f"已创建数据库: {db_path}")
+        return True
+    except (OSError, sqlite3.Error) as e:
+        error(f"创建数据库失败: {e}")
+        return False
+
+def refresh_database(db_path, backup_file_path):
+    """把备份中的账号字段写入一个不在使用中的数据库 (例如 swap 切换预先准备的数据库)"""
+    backup_data = _load_restore_data(backup_file_path)
+    if backup_data is None:
+        return False
+    return _restore_single_db(Path(db_path), backup_data)
+
+def _checkpoint_database(db_path):
+    """把 WAL 中的内容合并回数据库文件，使数据库只由单个文件组成"""
+    wal_path = Path(str(db_path) + "-wal")
+    if not wal_path.exists():
+        return
+    conn = sqlite3.connect(db_path, timeout=DB_TIMEOUT)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        # 最后一个连接关闭时 SQLite 会删除 -wal 和 -shm 文件
+        conn.close()
+
+def swap_database(db_path, incoming_db, outgoing_db=None):
+    """通过重命名把预先准备好的数据库换成 state.vscdb (Antigravity 必须已关闭)
+
+    写入阶段只有两次 rename，耗时与数据库大小无关。原 state.vscdb 移动到 outgoing_db
+    (不指定时删除)；state.vscdb.backup 随数据库一起交换。第二次 rename 失败时把原
+    数据库移回。incoming_db 与 db_path 必须在同一文件系统上，否则抛出 OSError (EXDEV)。
+
+    Args:
+        db_path: 当前使用的 state.vscdb
+        incoming_db: 要换入的数据库
+        outgoing_db: 换出的原数据库的保存位置
+
+    Returns:
+        重命名阶段耗时 (秒)
+    """
+    db_path = Path(db_path)
+    incoming_db = Path(incoming_db)
+    if not incoming_db.exists():
+        raise FileNotFoundError(incoming_db)
+
+    # rename 只移动主文件，先合并两边残留的 WAL
+    _checkpoint_database(incoming_db)
+    if db_path.exists():
+        _checkpoint_database(db_path)
+
+    start = time.perf_counter()
+    moved_out = False
+    if db_path.exists():
+        if outgoing_db is not None:
+            Path(outgoing_db).parent.mkdir(parents=True, exist_ok=True)
+            os.replace(db_path, outgoing_db)
+            moved_out = True
+        else:
+            os.remove(db_path)
+    try:
+        os.replace(incoming_db, db_path)
+    except OSError:
+        if moved_out:
+            os.replace(outgoing_db, db_path)
+        raise
+    elapsed = time.perf_counter() - start
+
+    # VS Code 自己的备份副本 (只在主数据库损坏时使用)，失败不影响切换
+    live_backup = db_path.with_suffix('.vscdb.backup')
+    incoming_backup = incoming_db.with_suffix('.vscdb.backup')
+    try:
+        if live_backup.exists():
+            if outgoing_db is not None:
+                os.replace(live_backup, Path(outgoing_db).with_suffix('.vscdb.backup'))
+            else:
+                os.remove(live_backup)
+        if incoming_backup.exists():
+            os.replace(incoming_backup, live_backup)
+    except OSError as e:
+        warning(f"交换 state.vscdb.backup 失败: {e}")
+
+    info(f"已交换数据库: {incoming_db} -> {db_path} ({elapsed * 1000:.2f} ms)", event="swap_db",
+         db_path=db_path, duration=elapsed)
+    return elapsed
+
 def get_current_account_info():
     """从数据库中提取当前账号信息 (邮箱等)"""
     db_paths = get_antigravity_db_paths()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Event Log Queries
+Reads the structured event log written when structured_logging is enabled
+(events.jsonl plus its rotated events.jsonl.N.gz archives) and aggregates it
+
+Every record is one JSON object with ts, level, event, module, msg, pid and the
+fields duration (seconds), account_id, db_path, retry and bytes (null when the
+call did not provide them); see utils.info and utils.log_context.
+"""
+import fnmatch
+import gzip
+import json
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from utils import get_event_log_path, get_event_writer
+
+_SINCE_RE = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+_SINCE_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_since(value: str) -> datetime:
+    """
+    Parse a relative age ("30s", "15m", "2h", "7d") or an ISO timestamp
+
+    Raises:
+        ValueError: If the value is neither
+    """
+    match = _SINCE_RE.match(value.strip())
+    if match:
+        amount, unit = match.groups()
+        return datetime.now() - timedelta(**{_SINCE_UNITS[unit]: float(amount)})
+    return datetime.fromisoformat(value)
+
+
+def event_log_files(path: Optional[Path] = None, archives: bool = False) -> List[Path]:
+    """Event log files in write order: rotated archives oldest first (with archives=True), then the live file"""
+    path = Path(path) if path else get_event_log_path()
+    files = []
+    if archives:
+        numbered = []
+        for archive in path.parent.glob(path.name + ".*.gz"):
+            suffix = archive.name[len(path.name) + 1:-len(".gz")]
+            if suffix.isdigit():
+                numbered.append((int(suffix), archive))
+        files.extend(archive for _, archive in sorted(numbered, reverse=True))
+    if path.exists():
+        files.append(path)
+    return files
+
+
+def iter_events(path: Optional[Path] = None, archives: bool = False) -> Iterator[Dict]:
+    """Yield event records in the order they were written (malformed lines are skipped)"""
+    if path is None:
+        # Include events still buffered in this process
+        writer = get_event_writer()
+        if writer is not None:
+            writer.flush()
+    for file in event_log_files(path, archives):
+        opener = gzip.open if file.suffix == ".gz" else open
+        try:
+            with opener(file, "rt", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(record, dict):
+                        yield record
+        except OSError:
+            continue
+
+
+def filter_events(events: Iterable[Dict], event: Optional[str] = None, level: Optional[str] = None,
+                  account_id: Optional[str] = None, since: Optional[datetime] = None,
+                  min_duration: Optional[float] = None) -> Iterator[Dict]:
+    """
+    Filter event records
+
+    Args:
+        event: Event name or glob pattern ("process_manager.*", "switch")
+        level: INFO, WARN, ERR or DBUG
+        account_id: Only events of this account
+        since: Only events at or after this time
+        min_duration: Only events with a duration of at least this many seconds
+    """
+    since_ts = since.isoformat(timespec="milliseconds") if since else None
+    for record in events:
+        if event and not fnmatch.fnmatchcase(record.get("event") or "", event):
+            continue
+        if level and record.get("level") != level:
+            continue
+        if account_id and record.get("account_id") != account_id:
+            continue
+        # ts is a local ISO timestamp with a fixed width, so strings compare in time order
+        if since_ts and (record.get("ts") or "") < since_ts:
+            continue
+        if min_duration is not None and (record.get("duration") or 0) < min_duration:
+            continue
+        yield record
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize_events(events: Iterable[Dict]) -> List[Dict]:
+    """
+    Aggregate event records per event name
+
+    Returns:
+        List of dicts sorted by total duration (descending) with event, count,
+        errors (ERR records), warnings (WARN records), timed (records with a
+        duration), total_seconds, avg_seconds, p50_seconds, p95_seconds,
+        max_seconds, retries (sum of retry) and bytes (sum of bytes)
+    """
+    groups: Dict[str, Dict] = {}
+    for record in events:
+        name = record.get("event") or "?"
+        group = groups.get(name)
+        if group is None:
+            group = groups[name] = {"event": name, "count": 0, "errors": 0, "warnings": 0,
+                                    "retries": 0, "bytes": 0, "durations": []}
+        group["count"] += 1
+        level = record.get("level")
+        if level == "ERR":
+            group["errors"] += 1
+        elif level == "WARN":
+            group["warnings"] += 1
+        if isinstance(record.get("duration"), (int, float)):
+            group["durations"].append(record["duration"])
+        if isinstance(record.get("retry"), int):
+            group["retries"] += record["retry"]
+        if isinstance(record.get("bytes"), int):
+            group["bytes"] += record["bytes"]
+
+    summary = []
+    for group in groups.values():
+        durations = sorted(group.pop("durations"))
+        total = sum(durations)
+        group["timed"] = len(durations)
+        group["total_seconds"] = total
+        group["avg_seconds"] = total / len(durations) if durations else None
+        group["p50_seconds"] = _percentile(durations, 0.5) if durations else None
+        group["p95_seconds"] = _percentile(durations, 0.95) if durations else None
+        group["max_seconds"] = durations[-1] if durations else None
+        summary.append(group)
+    summary.sort(key=lambda g: (g["total_seconds"], g["count"]), reverse=True)
+    return summary
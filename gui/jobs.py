@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Background Jobs
+Progress reporting and cooperative cancellation for long-running operations
+
+An operation that supports jobs takes an optional `job` argument and calls
+    job.set_total(items, nbytes)   once the amount of work is known
+    job.advance(items, nbytes)     as work completes
+    job.check()                    at safe points (raises JobCancelled after cancel())
+Callers either create a Job themselves or use run_job() to run the operation in a
+background thread with progress and completion callbacks.
+"""
+import itertools
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from utils import error, debug
+
+# Minimum seconds between two progress callbacks (the final one is always sent)
+PROGRESS_INTERVAL = 0.1
+
+_job_ids = itertools.count(1)
+
+
+class JobCancelled(Exception):
+    """Raised by Job.check() when the job has been cancelled"""
+
+
+class Job:
+    """Progress and cancellation state of one operation (thread-safe)"""
+
+    def __init__(self, name: str, on_progress: Optional[Callable[[Dict], None]] = None):
+        self.id = next(_job_ids)
+        self.name = name
+        self.on_progress = on_progress
+        self.state = "pending"  # pending, running, done, cancelled, failed
+        self.result = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+        self._total_items = None
+        self._total_bytes = None
+        self._done_items = 0
+        self._done_bytes = 0
+        self._started = None
+        self._ended = None
+        self._last_report = 0.0
+
+    # Reporting (called by the operation) ----------------------------------
+
+    def start(self):
+        with self._lock:
+            self.state = "running"
+            self._started = time.perf_counter()
+        self._report(force=True)
+
+    def set_total(self, items: Optional[int] = None, nbytes: Optional[int] = None):
+        with self._lock:
+            if items is not None:
+                self._total_items = items
+            if nbytes is not None:
+                self._total_bytes = nbytes
+        self._report(force=True)
+
+    def advance(self, items: int = 1, nbytes: int = 0):
+        with self._lock:
+            self._done_items += items
+            self._done_bytes += nbytes
+        self._report()
+
+    def check(self):
+        """Raise JobCancelled if cancellation was requested"""
+        if self._cancel.is_set():
+            raise JobCancelled(self.name)
+
+    def finish(self, state: str, result=None, error_msg: Optional[str] = None):
+        with self._lock:
+            self.state = state
+            self.result = result
+            self.error = error_msg
+            self._ended = time.perf_counter()
+        self._report(force=True)
+        self._finished.set()
+
+    # Control (called by the UI) -------------------------------------------
+
+    def cancel(self):
+        """Request cooperative cancellation"""
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def progress(self) -> Dict:
+        """
+        Snapshot of the job progress
+
+        Returns:
+            Dict with name, state, done_items, total_items, done_bytes, total_bytes,
+            fraction (0..1 or None), elapsed_seconds, items_per_second,
+            bytes_per_second and eta_seconds (None if unknown)
+        """
+        with self._lock:
+            end = self._ended or time.perf_counter()
+            elapsed = end - self._started if self._started is not None else 0.0
+            fraction = None
+            if self._total_bytes:
+                fraction = min(1.0, self._done_bytes / self._total_bytes)
+            elif self._total_items:
+                fraction = min(1.0, self._done_items / self._total_items)
+            eta = None
+            if fraction and self.state == "running":
+                eta = elapsed * (1 - fraction) / fraction
+            return {
+                "id": self.id,
+                "name": self.name,
+                "state": self.state,
+                "done_items": self._done_items,
+                "total_items": self._total_items,
+                "done_bytes": self._done_bytes,
+                "total_bytes": self._total_bytes,
+                "fraction": fraction,
+                "elapsed_seconds": elapsed,
+                "items_per_second": self._done_items / elapsed if elapsed > 0 else 0.0,
+                "bytes_per_second": self._done_bytes / elapsed if elapsed > 0 else 0.0,
+                "eta_seconds": eta,
+                "error": self.error,
+            }
+
+    def _report(self, force: bool = False):
+        if self.on_progress is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        try:
+            self.on_progress(self.progress())
+        except Exception as e:
+            debug(f"进度回调失败: {e}")
+
+
+def run_job(name: str, target: Callable[["Job"], object],
+            on_progress: Optional[Callable[[Dict], None]] = None,
+            on_done: Optional[Callable[["Job"], None]] = None) -> Job:
+    """
+    Run target(job) in a background thread
+
+    Args:
+        name: Display name of the operation
+        target: Callable receiving the Job; its return value becomes job.result
+        on_progress: Called with Job.progress() snapshots (at most every PROGRESS_INTERVAL)
+        on_done: Called with the Job once it is done, cancelled or failed
+
+    Returns:
+        The running Job (call job.cancel() to stop it)
+    """
+    job = Job(name, on_progress)
+
+    def runner():
+        job.start()
+        try:
+            result = target(job)
+        except JobCancelled:
+            job.finish("cancelled")
+        except Exception as e:
+            error(f"{name} 失败: {e}")
+            job.finish("failed", error_msg=str(e))
+        else:
+            job.finish("cancelled" if job.cancelled else "done", result=result)
+        if on_done is not None:
+            try:
+                on_done(job)
+            except Exception as e:
+                debug(f"完成回调失败: {e}")
+
+    threading.Thread(target=runner, name=f"job-{job.id}", daemon=True).start()
+    return job
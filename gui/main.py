@@ -169,6 +169,16 @@ def main(page: ft.Page):
         page.update()
 
     page.on_platform_brightness_change = theme_changed
+    
+    # Background maintenance (retention, cleanup, verification) while idle
+    try:
+        from config_manager import get_config
+        if get_config().get("background_maintenance", True):
+            from maintenance_scheduler import get_maintenance_scheduler
+            get_maintenance_scheduler().start()
+    except Exception as e:
+        from utils import warning
+        warning(f"Failed to start background maintenance: {e}")
 
 if __name__ == "__main__":
     # Handle assets path for both development and PyInstaller frozen state
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Background Maintenance Scheduler
+Runs retention, orphan/leftover cleanup and incremental verification while the user is idle
+
+The GUI starts one scheduler thread; the CLI `daemon` command runs the same loop in
+the foreground (or a single due run with --once, for cron). Runs are coordinated
+across processes through files in the data directory:
+    maintenance.lock        held while a run is in progress (pid inside)
+    maintenance_state.json  time and summary of the last run
+    switch.lock             present while a switch or snapshot is in progress (pid inside)
+    last_activity           touched when a switch or snapshot finishes
+
+Maintenance I/O goes through an IOThrottle: a token bucket that limits bytes per
+second and blocks entirely while a switch is in progress, so the user-facing path
+never waits on the store.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import psutil
+
+from utils import info, error, warning, debug, get_app_data_dir
+from config_manager import get_config
+
+# A switch marker older than this is considered left over from a crash
+SWITCH_MARKER_MAX_AGE = 15 * 60
+# A maintenance lock older than this is considered left over from a crash
+RUN_LOCK_MAX_AGE = 6 * 3600
+# How often the scheduler thread re-checks whether a run is due
+POLL_SECONDS = 30
+
+_busy_lock = threading.Lock()
+_busy_count = 0
+_last_activity = 0.0
+
+
+def _switch_marker():
+    return get_app_data_dir() / "switch.lock"
+
+
+def _activity_stamp():
+    return get_app_data_dir() / "last_activity"
+
+
+def _pid_alive(pid) -> bool:
+    try:
+        return psutil.pid_exists(int(pid))
+    except (TypeError, ValueError):
+        return False
+
+
+def _marker_active(path, max_age: float) -> bool:
+    """Check a pid marker file: present, recent and owned by a live process"""
+    try:
+        st = os.stat(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            pid = f.read().strip()
+    except OSError:
+        return False
+    return time.time() - st.st_mtime < max_age and _pid_alive(pid)
+
+
+# -------------------------------------------------------------------------
+# User activity
+# -------------------------------------------------------------------------
+
+@contextlib.contextmanager
+def user_operation():
+    """Mark a user-facing operation (switch, snapshot) so background maintenance pauses"""
+    global _busy_count, _last_activity
+    with _busy_lock:
+        _busy_count += 1
+        if _busy_count == 1:
+            try:
+                with open(_switch_marker(), 'w', encoding='utf-8') as f:
+                    f.write(str(os.getpid()))
+            except OSError as e:
+                debug(f"无法写入切换标记: {e}")
+    try:
+        yield
+    finally:
+        with _busy_lock:
+            _busy_count -= 1
+            _last_activity = time.time()
+            if _busy_count == 0:
+                with contextlib.suppress(OSError):
+                    os.remove(_switch_marker())
+                with contextlib.suppress(OSError):
+                    _activity_stamp().touch()
+
+
+def is_user_busy() -> bool:
+    """Check whether a switch or snapshot is in progress (in any process)"""
+    if _busy_count > 0:
+        return True
+    return _marker_active(_switch_marker(), SWITCH_MARKER_MAX_AGE)
+
+
+def seconds_since_activity() -> float:
+    """Seconds since the last switch or snapshot finished (in any process)"""
+    last = _last_activity
+    with contextlib.suppress(OSError):
+        last = max(last, os.stat(_activity_stamp()).st_mtime)
+    return time.time() - last
+
+
+# -------------------------------------------------------------------------
+# I/O throttling
+# -------------------------------------------------------------------------
+
+class IOThrottle:
+    """Token bucket over bytes that also pauses while the user is busy (thread-safe)"""
+
+    def __init__(self, bytes_per_second: float = 0, stop_event: Optional[threading.Event] = None):
+        self.rate = bytes_per_second
+        self._stop = stop_event or threading.Event()
+        self._lock = threading.Lock()
+        self._allowance = float(bytes_per_second)
+        self._stamp = time.monotonic()
+        self.paused_seconds = 0.0
+
+    def wait_until_idle(self):
+        """Block while a switch or snapshot is in progress"""
+        start = time.monotonic()
+        while is_user_busy() and not self._stop.is_set():
+            self._stop.wait(0.5)
+        self.paused_seconds += time.monotonic() - start
+
+    def consume(self, nbytes: int):
+        """Account for nbytes of I/O, sleeping as needed to stay under the rate"""
+        self.wait_until_idle()
+        if self.rate <= 0 or nbytes <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Allow bursts of up to one second worth of I/O
+            self._allowance = min(self.rate, self._allowance + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._allowance -= nbytes
+            delay = -self._allowance / self.rate if self._allowance < 0 else 0.0
+        if delay > 0:
+            self._stop.wait(delay)
+
+
+# -------------------------------------------------------------------------
+# Scheduler
+# -------------------------------------------------------------------------
+
+class MaintenanceScheduler:
+    """Runs maintenance at most once per interval, only while the user is idle"""
+
+    def __init__(self, interval_seconds: Optional[float] = None, idle_seconds: Optional[float] = None,
+                 io_limit_bytes: Optional[float] = None):
+        config = get_config()
+        self.interval_seconds = interval_seconds if interval_seconds is not None else \
+            config.get("maintenance_interval_hours", 24) * 3600
+        self.idle_seconds = idle_seconds if idle_seconds is not None else \
+            config.get("maintenance_idle_seconds", 120)
+        self.io_limit_bytes = io_limit_bytes if io_limit_bytes is not None else \
+            config.get("maintenance_io_limit_mb", 5) * 1024 * 1024
+        self.state_file = get_app_data_dir() / "maintenance_state.json"
+        self.lock_file = get_app_data_dir() / "maintenance.lock"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # State ---------------------------------------------------------------
+
+    def load_state(self) -> Dict:
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state: Dict):
+        temp_file = self.state_file.with_suffix('.json.tmp')
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            temp_file.replace(self.state_file)
+        except OSError as e:
+            warning(f"保存维护状态失败: {e}")
+
+    def seconds_until_due(self) -> float:
+        last_run = self.load_state().get("last_run", 0)
+        return max(0.0, last_run + self.interval_seconds - time.time())
+
+    def _acquire(self) -> bool:
+        for _ in range(2):
+            try:
+                fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if _marker_active(self.lock_file, RUN_LOCK_MAX_AGE):
+                    return False
+                # Left over from a crashed run
+                with contextlib.suppress(OSError):
+                    os.remove(self.lock_file)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def _release(self):
+        with contextlib.suppress(OSError):
+            os.remove(self.lock_file)
+
+    # Running -------------------------------------------------------------
+
+    def run_once(self, force: bool = False) -> Optional[Dict]:
+        """
+        Run retention/cleanup and incremental verification if due
+
+        Args:
+            force: Run even if the interval has not elapsed
+
+        Returns:
+            Summary dict, or None if not due or another process is running maintenance
+        """
+        from backup_maintenance import run_maintenance
+        from backup_manager import get_backup_files
+        from backup_verify import get_verify_cache, verify_backups
+
+        if not force and self.seconds_until_due() > 0:
+            return None
+        if not self._acquire():
+            debug("其他进程正在执行维护，跳过")
+            return None
+
+        throttle = IOThrottle(self.io_limit_bytes, self._stop)
+        start = time.perf_counter()
+        try:
+            maintenance = run_maintenance(dry_run=False, throttle=throttle)
+            verification = verify_backups(get_backup_files(), cache=get_verify_cache(), workers=1,
+                                          prune=True, throttle=throttle)
+            for path, error_msg in verification["invalid_files"].items():
+                warning(f"✗ {os.path.basename(path)}: {error_msg}")
+
+            summary = {
+                "last_run": time.time(),
+                "elapsed_seconds": time.perf_counter() - start,
+                "paused_seconds": throttle.paused_seconds,
+                "expired": maintenance["expired"],
+                "orphaned": maintenance["orphaned"] + maintenance["orphaned_generations"],
+                "leftovers": maintenance["leftovers"],
+                "blobs_deleted": maintenance["blobs_deleted"],
+                "bytes_freed": maintenance["bytes_freed"],
+                "total_bytes": maintenance["total_bytes"],
+                "verified": verification["verified"],
+                "invalid": verification["invalid"],
+            }
+            self._save_state(summary)
+            info(f"后台维护完成: 耗时 {summary['elapsed_seconds']:.1f} 秒 "
+                 f"(暂停 {summary['paused_seconds']:.1f} 秒), {summary['invalid']} 个备份无效")
+            return summary
+        except Exception as e:
+            error(f"后台维护失败: {e}")
+            # Record the attempt so a persistent failure is retried next interval, not every poll
+            self._save_state({"last_run": time.time(), "error": str(e)})
+            return None
+        finally:
+            self._release()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            wait = self.seconds_until_due()
+            if wait > 0:
+                self._stop.wait(min(wait, POLL_SECONDS))
+                continue
+            if is_user_busy() or seconds_since_activity() < self.idle_seconds:
+                self._stop.wait(POLL_SECONDS)
+                continue
+            if self.run_once() is None:
+                # Another process holds the lock; retry later
+                self._stop.wait(POLL_SECONDS)
+
+    def run_forever(self):
+        """Run the scheduler loop in the calling thread until stop() (CLI daemon)"""
+        try:
+            self._loop()
+        except KeyboardInterrupt:
+            self.stop()
+
+    def start(self):
+        """Start the scheduler in a background daemon thread (GUI)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="maintenance-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+_scheduler_instance: Optional[MaintenanceScheduler] = None
+
+
+def get_maintenance_scheduler() -> MaintenanceScheduler:
+    """Get global maintenance scheduler instance (singleton)"""
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        _scheduler_instance = MaintenanceScheduler()
+    return _scheduler_instance
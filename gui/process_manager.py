@@ -1,51 +1,727 @@
 # -*- coding: utf-8 -*-
+import contextlib
 import os
+from collections import deque
+import re
+import select
+import sys
+import threading
 import time
 import platform
 import subprocess
+from pathlib import Path
 import psutil
 
 # Use relative imports
-from utils import info, error, warning, get_antigravity_executable_path, open_uri
+from utils import (
+    info, error, warning, debug, get_antigravity_executable_path, get_antigravity_db_paths, get_instances_dir,
+    open_uri
+)
 
-def is_process_running(process_name=None):
-    """检查 Antigravity 进程是否在运行
+# 完整扫描 (解析每个进程的 exe) 的最小间隔（秒）
+FULL_SCAN_INTERVAL = 60
+# 每隔多少次检查输出一次检测开销统计
+STATS_LOG_EVERY = 300
+# Linux 进程信息目录
+PROC_ROOT = "/proc"
+# 主进程退出后，等待其子进程随之退出的时间（秒）
+SUBTREE_GRACE_SECONDS = 2
+# 启动后等待就绪的默认超时与检测间隔（秒）
+READY_TIMEOUT = 30
+READY_POLL_SECONDS = 0.2
+# 独立实例使用的 Electron 参数，以及实例目录中数据库的相对路径（各平台相同）
+USER_DATA_DIR_ARG = "--user-data-dir"
+INSTANCE_DB_PARTS = ("User", "globalStorage", "state.vscdb")
+
+# Linux 快速扫描的预筛选规则（在原始字节上匹配，避免逐个解码）
+_PROC_PATH_RE = re.compile(rb"antigravity", re.IGNORECASE)
+
+
+def _matches_antigravity(name, exe, system=None):
+    """按平台规则判断进程名/可执行文件路径是否属于 Antigravity
     
-    使用跨平台的检测方式：
     - macOS: 检查路径包含 Antigravity.app
-    - Windows: 检查进程名或路径包含 antigravity
+    - Windows: 进程名为 antigravity.exe，或路径包含 antigravity 且不是 Manager 本身
     - Linux: 检查进程名或路径包含 antigravity
     """
-    system = platform.system()
+    system = system or platform.system()
+    process_name_lower = name.lower() if name else ""
+    exe_path = exe.lower() if exe else ""
+    
+    if system == "Darwin":
+        return 'antigravity.app' in exe_path
+    elif system == "Windows":
+        return (process_name_lower in ['antigravity.exe', 'antigravity'] or
+                ('antigravity' in exe_path and 'manager' not in process_name_lower))
+    else:
+        return (process_name_lower == 'antigravity' or
+                'antigravity' in exe_path)
+
+
+def _app_dir():
+    """当前应用所在目录（小写）
+    
+    在 PyInstaller 打包环境中，sys.executable 指向 exe 文件；
+    在开发环境中，它指向 python 解释器
+    """
+    try:
+        return os.path.dirname(os.path.abspath(sys.executable)).lower()
+    except Exception:
+        return None
+
+
+def _use_procfs():
+    return platform.system() == "Linux" and os.path.isdir(PROC_ROOT)
+
+
+def _read_proc_file(path):
+    # os.open/os.read: no buffered file object per process (about 2x faster than open())
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.read(fd, 4096)
+    finally:
+        os.close(fd)
+
+
+def _iter_proc_candidates(proc_root=PROC_ROOT):
+    """Linux 快速路径: 直接读取 /proc/<pid>/cmdline 和 comm
+    
+    每个进程只读取一次 cmdline；只有 cmdline 包含 antigravity 的少数进程才读取 comm
+    作为进程名（包括 "/bin/sh /usr/bin/antigravity" 这类启动脚本，其 comm 为脚本名），
+    并解析 exe 符号链接得到真实的可执行文件路径。argv[0] 不可信：路径中含
+    antigravity 的目录下的解释器 (例如本项目目录中的 venv) 不是 Antigravity；
+    无权限解析 exe 时只使用 argv[0] 的文件名。
+    cmdline 为空的是内核线程或僵尸进程，直接跳过。
     
-    for proc in psutil.process_iter(['name', 'exe']):
+    Yields:
+        (pid, name, path)
+    """
+    for name in os.listdir(proc_root):
+        if not name.isdigit():
+            continue
+        base = f"{proc_root}/{name}"
         try:
-            process_name_lower = proc.info['name'].lower() if proc.info['name'] else ""
-            exe_path = proc.info.get('exe', '').lower() if proc.info.get('exe') else ""
-            
-            # 跨平台检测
-            is_antigravity = False
-            
-            if system == "Darwin":
-                # macOS: 检查路径包含 Antigravity.app
-                is_antigravity = 'antigravity.app' in exe_path
-            elif system == "Windows":
-                # Windows: 检查进程名或路径包含 antigravity
-                is_antigravity = (process_name_lower in ['antigravity.exe', 'antigravity'] or 
-                                 'antigravity' in exe_path)
+            cmdline = _read_proc_file(base + "/cmdline")
+            if not cmdline or not _PROC_PATH_RE.search(cmdline):
+                continue
+            argv0 = cmdline.split(b"\0", 1)[0]
+            comm = _read_proc_file(base + "/comm").rstrip(b"\n")
+        except OSError:
+            # 进程已退出或无权限
+            continue
+        try:
+            exe = os.readlink(base + "/exe")
+        except OSError:
+            exe = os.path.basename(argv0.decode('utf-8', 'replace'))
+        yield int(name), comm.decode('utf-8', 'replace'), exe
+
+
+def _iter_psutil_candidates(full):
+    """通用路径: 通过 psutil 遍历进程
+    
+    full=False 时只读取进程名，仅对名称包含 antigravity 的进程解析 exe
+    
+    Yields:
+        (pid, name, exe)
+    """
+    attrs = ['name', 'exe'] if full else ['name']
+    for proc in psutil.process_iter(attrs):
+        try:
+            name = proc.info.get('name')
+            if full:
+                exe = proc.info.get('exe')
             else:
-                # Linux: 检查进程名或路径包含 antigravity
-                is_antigravity = (process_name_lower == 'antigravity' or 
-                                 'antigravity' in exe_path)
-            
-            if is_antigravity:
-                return True
-                
+                if not name or 'antigravity' not in name.lower():
+                    continue
+                exe = proc.exe()
+            yield proc.pid, name, exe
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            continue
+
+
+def scan_antigravity_processes(full=True, exclude_app_dir=False, proc_root=None):
+    """扫描进程表，查找 Antigravity 进程
+    
+    Linux 上读取 /proc（full 参数无意义，总是完整扫描），其他平台使用 psutil。
+    
+    Args:
+        full: 是否解析所有进程的 exe（仅 psutil 路径）
+        exclude_app_dir: 是否排除当前应用目录下的进程 (防止误杀自己和子进程)
+        proc_root: 覆盖 /proc 路径（用于基准测试）
+    
+    Returns:
+        {pid: {"name", "exe", "create_time"}}
+    """
+    system = platform.system()
+    own_pid = os.getpid()
+    app_dir = _app_dir() if exclude_app_dir else None
+    
+    if proc_root or _use_procfs():
+        candidates = _iter_proc_candidates(proc_root or PROC_ROOT)
+    else:
+        candidates = _iter_psutil_candidates(full)
+    
+    found = {}
+    for pid, name, exe in candidates:
+        if pid == own_pid:
+            continue
+        if not _matches_antigravity(name, exe, system):
+            continue
+        if app_dir and exe and app_dir in exe.lower():
+            continue
+        try:
+            create_time = psutil.Process(pid).create_time()
         except (psutil.NoSuchProcess, psutil.AccessDenied):
-            pass
-    return False
+            continue
+        found[pid] = {"name": name, "exe": exe, "create_time": create_time}
+    return found
+
+
+class ProcessTracker:
+    """跟踪 Antigravity 进程的 PID，避免每次检查都遍历整个进程表
+    
+    首次检查时扫描一次进程表，记录匹配进程的 (pid, create_time)。之后的检查只查询
+    这些 PID，create_time 不一致说明 PID 已被复用，视为进程已退出。
+    
+    所有已跟踪进程都退出时（未命中）才重新扫描：
+    - 快速扫描: 只读取进程名，仅对名称包含 antigravity 的进程解析 exe
+    - 完整扫描: 解析所有进程的 exe（与旧实现等价），最多每 FULL_SCAN_INTERVAL 秒一次，
+      用于发现进程名不含 antigravity 的进程
+    Linux 上扫描直接读取 /proc 且总是覆盖所有进程，不区分快速/完整扫描。
+    """
+    
+    def __init__(self, full_scan_interval=FULL_SCAN_INTERVAL):
+        self.full_scan_interval = full_scan_interval
+        self._lock = threading.Lock()
+        self._tracked = {}  # pid -> create_time
+        self._last_full_scan = None
+        self._stats = {
+            "checks": 0,
+            "hits": 0,
+            "quick_scans": 0,
+            "full_scans": 0,
+            "total_seconds": 0.0,
+            "last_check_seconds": 0.0,
+        }
+    
+    def _alive(self, pid, create_time):
+        try:
+            proc = psutil.Process(pid)
+            return proc.create_time() == create_time and proc.status() != psutil.STATUS_ZOMBIE
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+    
+    def refresh(self, full=False):
+        """重新扫描进程表并替换已跟踪的 PID（只跟踪默认实例，独立实例的进程不计入）"""
+        found = {pid: p["create_time"] for pid, p in scan_antigravity_processes(full).items()
+                 if not _is_isolated_instance(pid)}
+        with self._lock:
+            self._tracked = found
+            if full:
+                self._last_full_scan = time.monotonic()
+                self._stats["full_scans"] += 1
+            else:
+                self._stats["quick_scans"] += 1
+        return found
+    
+    def pids(self):
+        """当前仍存活的已跟踪 PID（未命中时按上述规则重新扫描）"""
+        start = time.perf_counter()
+        with self._lock:
+            tracked = dict(self._tracked)
+        alive = {pid: ct for pid, ct in tracked.items() if self._alive(pid, ct)}
+        hit = bool(alive)
+        if hit:
+            if len(alive) != len(tracked):
+                with self._lock:
+                    self._tracked = alive
+        else:
+            full_due = (self._last_full_scan is None or
+                        time.monotonic() - self._last_full_scan >= self.full_scan_interval)
+            alive = self.refresh(full=False)
+            if not alive and full_due and not _use_procfs():
+                alive = self.refresh(full=True)
+        
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._stats["checks"] += 1
+            self._stats["hits"] += int(hit)
+            self._stats["total_seconds"] += elapsed
+            self._stats["last_check_seconds"] = elapsed
+            checks = self._stats["checks"]
+        if checks % STATS_LOG_EVERY == 0:
+            stats = self.stats()
+            debug(f"进程检测: {stats['checks']} 次检查, 命中 {stats['hits']}, "
+                  f"快速扫描 {stats['quick_scans']}, 完整扫描 {stats['full_scans']}, "
+                  f"平均 {stats['avg_check_ms']:.2f} ms")
+        return sorted(alive)
+    
+    def is_running(self):
+        return bool(self.pids())
+    
+    def stats(self):
+        """检测开销统计: checks, hits, quick_scans, full_scans, avg_check_ms, last_check_ms, tracked"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["tracked"] = len(self._tracked)
+        stats["avg_check_ms"] = stats["total_seconds"] * 1000 / stats["checks"] if stats["checks"] else 0.0
+        stats["last_check_ms"] = stats.pop("last_check_seconds") * 1000
+        return stats
+
+
+_tracker_instance = None
+
+
+def get_process_tracker():
+    """获取全局进程跟踪器实例（单例）"""
+    global _tracker_instance
+    if _tracker_instance is None:
+        _tracker_instance = ProcessTracker()
+    return _tracker_instance
+
+
+def is_process_running(process_name=None):
+    """检查默认实例的 Antigravity 进程是否在运行（不含独立实例）
+    
+    只检查已跟踪的 PID，未命中时才重新扫描进程表（见 ProcessTracker）
+    """
+    return get_process_tracker().is_running()
+
+
+class ProcessWatcher:
+    """共享的进程状态监视服务：单个检测线程，向订阅者推送事件
+    
+    事件为 dict，包含 event、time (epoch 秒) 以及事件相关字段：
+    - "state":   订阅时的当前状态 (running, pids)
+    - "started": Antigravity 从停止变为运行 (running, pids, previous_seconds)
+    - "stopped": Antigravity 从运行变为停止 (running, pids, previous_seconds)
+    - 其他事件由 publish() 发布，例如切换流程的 "switching" / "switched"
+    
+    检测间隔自适应：状态变化或 poke() 后的 FAST_WINDOW 秒内每 FAST_INTERVAL 秒检测一次，
+    之后每次乘以 1.5 逐渐放缓，最长 SLOW_INTERVAL 秒。没有订阅者时线程退出。
+    """
+    
+    FAST_INTERVAL = 0.25
+    SLOW_INTERVAL = 5.0
+    FAST_WINDOW = 10.0
+    
+    def __init__(self, tracker=None):
+        self.tracker = tracker or get_process_tracker()
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._subscribers = []
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = None
+        self._pids = []
+        self._changed_at = time.time()
+        self._fast_until = 0.0
+    
+    def subscribe(self, callback, replay=True):
+        """订阅事件
+        
+        Args:
+            callback: 以事件 dict 调用，在监视线程中执行（应尽快返回）
+            replay: 是否立即以当前状态调用一次 ("state" 事件)
+        
+        Returns:
+            取消订阅的函数
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="process-watcher", daemon=True)
+                self._thread.start()
+        if replay:
+            if self._running is None:
+                self._check()
+            self._deliver(callback, self._event("state"))
+        
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+            self._wake.set()
+        return unsubscribe
+    
+    def publish(self, event, **fields):
+        """向所有订阅者发布事件"""
+        payload = {"event": event, "time": time.time()}
+        payload.update(fields)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            self._deliver(callback, payload)
+    
+    def poke(self):
+        """进程即将启动或关闭：立即检测，并在接下来的 FAST_WINDOW 秒内加快检测"""
+        self._fast_until = time.monotonic() + self.FAST_WINDOW
+        self._wake.set()
+    
+    @property
+    def running(self):
+        """最近一次检测到的状态（尚未检测时为 None）"""
+        return self._running
+    
+    def _event(self, name, **fields):
+        event = {"event": name, "time": time.time(), "running": bool(self._running), "pids": list(self._pids)}
+        event.update(fields)
+        return event
+    
+    def _deliver(self, callback, event):
+        try:
+            callback(event)
+        except Exception as e:
+            debug(f"进程状态订阅者处理失败: {e}")
+    
+    def _check(self):
+        with self._check_lock:
+            pids = self.tracker.pids()
+            running = bool(pids)
+            previous = self._running
+            self._pids = pids
+            if running == previous:
+                return
+            self._running = running
+            now = time.time()
+            previous_seconds = now - self._changed_at
+            self._changed_at = now
+        if previous is None:
+            return
+        self._fast_until = time.monotonic() + self.FAST_WINDOW
+        self.publish("started" if running else "stopped", running=running, pids=pids,
+                     previous_seconds=previous_seconds)
+    
+    def _loop(self):
+        interval = self.FAST_INTERVAL
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            self._check()
+            if time.monotonic() < self._fast_until:
+                interval = self.FAST_INTERVAL
+            else:
+                interval = min(self.SLOW_INTERVAL, interval * 1.5)
+            self._wake.wait(interval)
+            self._wake.clear()
+
+
+_watcher_instance = None
+
+
+def get_process_watcher():
+    """获取全局进程状态监视服务实例（单例）"""
+    global _watcher_instance
+    if _watcher_instance is None:
+        _watcher_instance = ProcessWatcher()
+    return _watcher_instance
+
+
+def _current_account():
+    """最近切换到的账号 (按 last_used)，没有账号时返回 None"""
+    try:
+        from account_manager import get_account_index
+        accounts = get_account_index().accounts
+    except Exception:
+        return None
+    if not accounts:
+        return None
+    account_id, account = max(accounts.items(), key=lambda item: item[1].get("last_used") or "")
+    return {"id": account_id, "name": account.get("name"), "email": account.get("email")}
+
+
+class ResourceSampler:
+    """Antigravity 进程树资源采样：CPU%、RSS、线程数、句柄数 (Windows) / 文件描述符数
+    
+    采样结果保存在固定容量的环形缓冲区中，并以 "sample" 事件通过 ProcessWatcher 发布。
+    每个样本记录当时的账号，便于把变慢与账号状态对应起来。
+    
+    开销控制：
+    - psutil.Process 对象跨样本复用 (cpu_percent 基于两次采样的差值)，每个进程在
+      oneshot() 中读取，Linux 上只读取 /proc/<pid>/stat、status 和 fd 目录
+    - 进程树 (含名称不匹配的子进程) 只在 TREE_REFRESH_SECONDS 秒后或有进程退出时重建
+    - Antigravity 未运行时只检查已跟踪 PID
+    采样线程自身的 CPU 时间记录在 overhead_percent 中。
+    """
+    
+    TREE_REFRESH_SECONDS = 30
+    
+    def __init__(self, interval=2.0, capacity=300):
+        self.interval = interval
+        self._samples = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._procs = {}  # pid -> psutil.Process
+        self._tree_refreshed = 0.0
+        self._latest_processes = []
+        self._account = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._unsubscribe = None
+        self._users = 0
+        self._users_lock = threading.RLock()
+        self._cpu_seconds = 0.0
+        self._wall_start = None
+    
+    # 采样 ------------------------------------------------------------------
+    
+    def _refresh_tree(self):
+        targets = _find_target_processes()
+        roots, subtree = _build_process_tree(targets) if targets else ([], [])
+        procs = {}
+        for proc in roots + subtree:
+            # 保留已有对象，cpu_percent 才能继续计算差值
+            existing = self._procs.get(proc.pid)
+            procs[proc.pid] = existing if existing is not None and existing == proc else proc
+        self._procs = procs
+        self._tree_refreshed = time.monotonic()
+    
+    def sample(self):
+        """采集一个样本并加入环形缓冲区
+        
+        Returns:
+            Dict: time, running, processes, cpu_percent, rss_bytes, threads, handles, account
+        """
+        if not self._procs and not get_process_tracker().is_running():
+            processes = []
+        else:
+            if not self._procs or time.monotonic() - self._tree_refreshed >= self.TREE_REFRESH_SECONDS:
+                self._refresh_tree()
+            processes, exited = self._read_processes()
+            if exited:
+                # 有进程退出（或被重新拉起），重建进程树
+                self._refresh_tree()
+        
+        if self._account is None:
+            self._account = _current_account()
+        sample = {
+            "time": time.time(),
+            "running": bool(processes),
+            "processes": len(processes),
+            "cpu_percent": sum(p["cpu_percent"] for p in processes),
+            "rss_bytes": sum(p["rss_bytes"] for p in processes),
+            "threads": sum(p["threads"] for p in processes),
+            "handles": sum(p["handles"] for p in processes),
+            "account": self._account,
+        }
+        with self._lock:
+            self._samples.append(sample)
+            self._latest_processes = processes
+        return sample
+    
+    def _read_processes(self):
+        windows = platform.system() == "Windows"
+        processes = []
+        exited = False
+        for pid, proc in list(self._procs.items()):
+            try:
+                with proc.oneshot():
+                    processes.append({
+                        "pid": pid,
+                        "name": proc.name(),
+                        "cpu_percent": proc.cpu_percent(None),
+                        "rss_bytes": proc.memory_info().rss,
+                        "threads": proc.num_threads(),
+                        "handles": proc.num_handles() if windows else proc.num_fds(),
+                    })
+            except psutil.NoSuchProcess:
+                exited = True
+            except psutil.AccessDenied:
+                continue
+        return processes, exited
+    
+    # 查询 ------------------------------------------------------------------
+    
+    def latest(self):
+        """最近一个样本 (没有时返回 None)"""
+        with self._lock:
+            return self._samples[-1] if self._samples else None
+    
+    def latest_processes(self):
+        """最近一个样本中各进程的明细: pid, name, cpu_percent, rss_bytes, threads, handles"""
+        with self._lock:
+            return list(self._latest_processes)
+    
+    def history(self, seconds=None):
+        """环形缓冲区中的样本 (可只取最近 seconds 秒)"""
+        with self._lock:
+            samples = list(self._samples)
+        if seconds is not None:
+            cutoff = time.time() - seconds
+            samples = [s for s in samples if s["time"] >= cutoff]
+        return samples
+    
+    def overhead_percent(self):
+        """采样线程占用的 CPU 时间占运行时间的百分比"""
+        if self._wall_start is None:
+            return 0.0
+        elapsed = time.monotonic() - self._wall_start
+        return self._cpu_seconds / elapsed * 100 if elapsed > 0 else 0.0
+    
+    # 运行 ------------------------------------------------------------------
+    
+    def _on_event(self, event):
+        if event["event"] == "switched" and event.get("ok"):
+            self._account = _current_account()
+    
+    def _loop(self):
+        watcher = get_process_watcher()
+        while not self._stop.is_set():
+            cpu_start = time.thread_time()
+            try:
+                sample = self.sample()
+            except Exception as e:
+                debug(f"资源采样失败: {e}")
+                sample = None
+            self._cpu_seconds += time.thread_time() - cpu_start
+            if sample is not None:
+                watcher.publish("sample", **{k: v for k, v in sample.items() if k != "time"})
+            self._stop.wait(self.interval)
+    
+    def start(self):
+        """在后台线程中开始采样，返回释放函数
+        
+        可以有多个使用者：每次 start() 增加一个引用，释放函数减少一个 (重复调用无影响)；
+        最后一个引用释放后采样线程退出，并取消对 ProcessWatcher 的订阅，
+        没有其他订阅者时监视线程也随之退出。
+        """
+        with self._users_lock:
+            self._users += 1
+            if self._thread is None or not self._thread.is_alive() or self._stop.is_set():
+                if self._thread is not None:
+                    # 上一次 stop() 的线程可能还在退出
+                    self._thread.join()
+                self._stop.clear()
+                self._account = _current_account()
+                self._unsubscribe = get_process_watcher().subscribe(self._on_event, replay=False)
+                self._wall_start = time.monotonic()
+                self._cpu_seconds = 0.0
+                self._thread = threading.Thread(target=self._loop, name="resource-sampler", daemon=True)
+                self._thread.start()
+        
+        released = False
+        
+        def release():
+            nonlocal released
+            with self._users_lock:
+                if released:
+                    return
+                released = True
+                self._users -= 1
+                if self._users <= 0:
+                    self.stop()
+        
+        return release
+    
+    def stop(self):
+        """立即停止采样 (不论还有多少引用)"""
+        with self._users_lock:
+            self._users = 0
+            self._stop.set()
+            if self._unsubscribe:
+                self._unsubscribe()
+                self._unsubscribe = None
+
+
+_sampler_instance = None
 
-def close_antigravity(timeout=10, force_kill=True, max_retries=3):
+
+def get_resource_sampler():
+    """获取全局资源采样器实例（单例）"""
+    global _sampler_instance
+    if _sampler_instance is None:
+        _sampler_instance = ResourceSampler()
+    return _sampler_instance
+
+_close_stats = {"count": 0, "total_seconds": 0.0, "last_seconds": None, "last_result": None,
+                "last_exit_times": {}}
+
+
+def get_close_stats():
+    """关闭耗时统计: count, total_seconds, last_seconds, last_result, avg_seconds,
+    last_exit_times ({pid: {"name", "seconds"}}，最近一次关闭中每个进程的退出耗时)"""
+    stats = dict(_close_stats)
+    stats["avg_seconds"] = stats["total_seconds"] / stats["count"] if stats["count"] else None
+    return stats
+
+
+def _wait_pidfds(procs, timeout, on_exit, until):
+    """Linux: 通过 pidfd 阻塞等待进程退出，最后一个进程退出时立即返回
+    
+    Returns:
+        仍在运行的进程列表；不支持 pidfd 时返回 None
+    """
+    if not hasattr(os, "pidfd_open") or not hasattr(select, "poll"):
+        return None
+    poller = select.poll()
+    fds = {}
+    try:
+        for proc in procs:
+            try:
+                fd = os.pidfd_open(proc.pid)
+            except ProcessLookupError:
+                on_exit(proc)
+                continue
+            except OSError:
+                # 内核不支持 pidfd (Linux < 5.3)
+                return None
+            fds[fd] = proc
+            poller.register(fd, select.POLLIN)
+        
+        deadline = time.monotonic() + timeout
+        while fds and any(proc.pid in until for proc in fds.values()):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for fd, _ in poller.poll(remaining * 1000):
+                # pidfd 可读表示进程已退出（包括尚未被回收的僵尸进程）
+                poller.unregister(fd)
+                os.close(fd)
+                proc = fds.pop(fd)
+                with contextlib.suppress(psutil.Error, ChildProcessError):
+                    # 若是本进程的子进程，回收以免残留僵尸进程
+                    proc.wait(0)
+                on_exit(proc)
+        return list(fds.values())
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def wait_for_exit(procs, timeout, on_exit=None, until=None):
+    """阻塞等待进程退出，所有进程退出时立即返回
+    
+    Linux 上使用 pidfd + poll，其他平台使用 psutil.wait_procs。
+    
+    Args:
+        procs: psutil.Process 列表
+        timeout: 最长等待时间（秒）
+        on_exit: 每个进程退出时调用 on_exit(proc)
+        until: 只等待这些进程退出即返回（其余进程仅记录退出），默认等待全部
+    
+    Returns:
+        仍在运行的进程列表
+    """
+    procs = list(procs)
+    if not procs:
+        return []
+    
+    def exited(proc):
+        debug(f"进程已退出: {proc.pid}")
+        if on_exit is not None:
+            on_exit(proc)
+    
+    until = {proc.pid for proc in (until if until is not None else procs)}
+    alive = _wait_pidfds(procs, timeout, exited, until)
+    if alive is not None:
+        return alive
+    _, alive = psutil.wait_procs([p for p in procs if p.pid in until], timeout=timeout, callback=exited)
+    _, others = psutil.wait_procs([p for p in procs if p.pid not in until], timeout=0, callback=exited)
+    return alive + others
+
+
+def close_antigravity(timeout=10, force_kill=True, max_retries=3, user_data_dir=None):
     """优雅地关闭所有 Antigravity 进程，支持重试和指数退避
     
     关闭策略（三阶段，跨平台）：
@@ -56,37 +732,189 @@ def close_antigravity(timeout=10, force_kill=True, max_retries=3):
     2. 温和终止 (SIGTERM/TerminateProcess) - 给进程机会清理
     3. 强制杀死 (SIGKILL/taskkill /F) - 最后手段
     
+    每个阶段都阻塞等待进程退出（见 wait_for_exit），最后一个进程退出时立即返回；
+    重试前的退避时间同样在进程退出时提前结束。耗时记录在 get_close_stats() 中。
+    
     Args:
         timeout: 等待进程退出的超时时间（秒）
         force_kill: 是否在超时后强制终止
         max_retries: 最大重试次数
+        user_data_dir: 只关闭以该 --user-data-dir 启动的独立实例（见 launch_instance）
     """
-    for attempt in range(max_retries):
-        if attempt > 0:
-            wait_time = attempt * 3  # 指数退避: 3s, 6s, 9s
-            info(f"第 {attempt + 1} 次尝试关闭 Antigravity (等待 {wait_time}s)...")
-            time.sleep(wait_time)
-        else:
-            info("正在尝试关闭 Antigravity...")
-        
-        result = _close_antigravity_once(timeout, force_kill)
-        
-        if result:
-            return True
-        
-        # 检查是否还有进程在运行
-        if not is_process_running():
-            info("所有 Antigravity 进程已关闭")
-            return True
+    start = time.perf_counter()
+    result = False
+    attempt = 0
+    get_process_watcher().poke()
+    try:
+        for attempt in range(max_retries):
+            if attempt > 0:
+                wait_time = attempt * 3  # 指数退避: 3s, 6s, 9s
+                info(f"第 {attempt + 1} 次尝试关闭 Antigravity (最多等待 {wait_time}s)...", retry=attempt)
+                if not wait_for_exit(_find_target_processes(user_data_dir), wait_time):
+                    info("所有 Antigravity 进程已关闭")
+                    result = True
+                    return True
+            else:
+                info("正在尝试关闭 Antigravity...")
+            
+            if _close_antigravity_once(timeout, force_kill, user_data_dir):
+                result = True
+                return True
+            
+            # 检查是否还有进程在运行
+            if not (_find_target_processes(user_data_dir) if user_data_dir else is_process_running()):
+                info("所有 Antigravity 进程已关闭")
+                result = True
+                return True
+            
+            if attempt < max_retries - 1:
+                warning(f"关闭失败，将在 {(attempt + 1) * 3} 秒内重试...")
         
-        if attempt < max_retries - 1:
-            warning(f"关闭失败，将在 {(attempt + 1) * 3} 秒后重试...")
+        error(f"经过 {max_retries} 次尝试后仍无法关闭 Antigravity")
+        return False
+    finally:
+        elapsed = time.perf_counter() - start
+        _close_stats["count"] += 1
+        _close_stats["total_seconds"] += elapsed
+        _close_stats["last_seconds"] = elapsed
+        _close_stats["last_result"] = result
+        info(f"关闭 Antigravity 耗时 {elapsed * 1000:.0f} ms", event="close", duration=elapsed,
+             ok=result, retry=attempt)
+
+
+def _find_target_processes(user_data_dir=None, include_instances=False):
+    """查找需要关闭的 Antigravity 进程
+    
+    排除自身进程和当前应用目录下的所有进程 (防止误杀自己和子进程)
+    
+    Args:
+        user_data_dir: 只返回以该 --user-data-dir 启动的独立实例的进程；默认只返回
+                       默认实例的进程，不含 get_instances_dir() 下的独立实例
+        include_instances: 为 True 时不排除独立实例 (user_data_dir 为 None 时有效)
+    """
+    target_processes = []
+    for pid, proc_info in scan_antigravity_processes(exclude_app_dir=True).items():
+        try:
+            proc = psutil.Process(pid)
+            if proc.create_time() != proc_info["create_time"]:
+                continue
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        if user_data_dir is not None:
+            if not _same_dir(_process_user_data_dir(proc), user_data_dir):
+                continue
+        elif not include_instances and _is_isolated_instance(proc):
+            continue
+        proc.info = proc_info
+        target_processes.append(proc)
+    return target_processes
+
+
+def _parse_user_data_dir(args):
+    """从命令行参数中取出 --user-data-dir（支持 "--user-data-dir=X" 和 "--user-data-dir X"）"""
+    prefix = USER_DATA_DIR_ARG + "="
+    for i, arg in enumerate(args):
+        if arg.startswith(prefix):
+            return arg[len(prefix):]
+        if arg == USER_DATA_DIR_ARG and i + 1 < len(args):
+            return args[i + 1]
+    return None
+
+
+def _process_user_data_dir(proc):
+    """进程的 --user-data-dir；默认实例或无权读取命令行时返回 None
+    
+    Electron 会把 --user-data-dir 传给 renderer/GPU/utility 子进程，因此实例的
+    所有 Electron 进程都能按此归属到实例。
+    """
+    try:
+        return _parse_user_data_dir(proc.cmdline())
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+        return None
+
+
+def _is_isolated_instance(proc):
+    """进程是否属于 get_instances_dir() 下的独立实例 (proc 为 psutil.Process 或 PID)"""
+    if not isinstance(proc, psutil.Process):
+        try:
+            proc = psutil.Process(proc)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+    user_data_dir = _process_user_data_dir(proc)
+    if not user_data_dir:
+        return False
+    root = os.path.normcase(os.path.abspath(get_instances_dir()))
+    path = os.path.normcase(os.path.abspath(user_data_dir))
+    return path.startswith(root + os.sep)
+
+
+def _same_dir(a, b):
+    if not a or not b:
+        return False
+    return os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+
+def _build_process_tree(targets):
+    """从匹配到的进程构建进程树
+    
+    根进程是父进程不属于 Antigravity 的匹配进程（Electron 主进程）；
+    子树包含根进程的所有后代，包括名称不匹配的 renderer/GPU/utility 进程。
     
-    error(f"经过 {max_retries} 次尝试后仍无法关闭 Antigravity")
-    return False
+    Returns:
+        (roots, subtree): 根进程列表，以及其余所有进程（不含根进程）
+    """
+    target_pids = {proc.pid for proc in targets}
+    roots = []
+    for proc in targets:
+        try:
+            if proc.ppid() not in target_pids:
+                roots.append(proc)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    
+    own_pid = os.getpid()
+    subtree = {proc.pid: proc for proc in targets if proc not in roots}
+    for root in roots:
+        try:
+            for child in root.children(recursive=True):
+                if child.pid != own_pid and child.pid not in subtree:
+                    child.info = {"name": _process_name(child), "exe": None}
+                    subtree[child.pid] = child
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return roots, list(subtree.values())
+
 
-def _close_antigravity_once(timeout=10, force_kill=True):
-    """单次关闭 Antigravity 进程的尝试"""
+def _process_name(proc):
+    try:
+        return proc.name()
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return "?"
+
+
+def _signal_all(procs, kill=False):
+    """向一批进程发送 SIGTERM/SIGKILL（不逐个等待）"""
+    for proc in procs:
+        try:
+            if kill:
+                proc.kill()
+            else:
+                proc.terminate()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+
+
+def _close_antigravity_once(timeout=10, force_kill=True, user_data_dir=None):
+    """单次关闭 Antigravity 进程的尝试
+    
+    按进程树关闭：先只向根进程（Electron 主进程）请求优雅退出，由它关闭自己的
+    子进程，避免子进程被重新拉起或成为孤儿；根进程退出后仍残留的子树作为一批
+    同时 SIGTERM，超时后同时 SIGKILL。每个进程的退出耗时记录在
+    get_close_stats()["last_exit_times"] 中。
+    
+    指定 user_data_dir 时只关闭该实例，否则只关闭默认实例；macOS 上 AppleScript 会退出
+    所有实例，因此关闭独立实例或有独立实例在运行时改为向主进程发送信号。
+    """
     system = platform.system()
     
     # Platform check
@@ -94,9 +922,25 @@ def _close_antigravity_once(timeout=10, force_kill=True):
         warning(f"Unknown System Platform: {system}，将尝试通用方法")
     
     try:
-        # 阶段 1: 平台特定的优雅退出
-        if system == "Darwin":
-            # macOS: 使用 AppleScript
+        targets = _find_target_processes(user_data_dir)
+        if not targets:
+            info("所有 Antigravity 进程已正常关闭")
+            return True
+        roots, subtree = _build_process_tree(targets)
+        tree = roots + subtree
+        for proc in roots:
+            info(f"发现目标进程: {proc.info['name']} ({proc.pid}) - {proc.info['exe']}，子进程 {len(subtree)} 个")
+        
+        start = time.perf_counter()
+        exit_times = {}
+        _close_stats["last_exit_times"] = exit_times
+        
+        def record_exit(proc):
+            exit_times[proc.pid] = {"name": proc.info["name"], "seconds": time.perf_counter() - start}
+        
+        # 阶段 1: 只向根进程请求优雅退出
+        if system == "Darwin" and user_data_dir is None and not list_instances():
+            # macOS: 使用 AppleScript (会退出所有实例，独立实例在运行时改为发送信号)
             info("尝试通过 AppleScript 优雅退出 Antigravity...")
             try:
                 result = subprocess.run(
@@ -106,152 +950,74 @@ def _close_antigravity_once(timeout=10, force_kill=True):
                 )
                 if result.returncode == 0:
                     info("Exit Request Sent, Awaiting Application Response ...")
-                    time.sleep(2)
+                else:
+                    _signal_all(roots)
             except Exception as e:
                 warning(f"AppleScript 退出失败: {e}，将使用其他方式")
+                _signal_all(roots)
         
         elif system == "Windows":
             # Windows: 使用 taskkill 优雅终止（不带 /F 参数）
             info("尝试通过 taskkill 优雅退出 Antigravity...")
             try:
                 # CREATE_NO_WINDOW = 0x08000000
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                
+                args = ["taskkill", "/T"]
+                for proc in roots:
+                    args += ["/PID", str(proc.pid)]
                 result = subprocess.run(
-                    ["taskkill", "/IM", "Antigravity.exe", "/T"],
+                    args,
                     capture_output=True,
                     timeout=3,
                     creationflags=0x08000000
                 )
                 if result.returncode == 0:
                     info("已发送退出请求，等待应用响应...")
-                    time.sleep(2)
+                else:
+                    _signal_all(roots)
             except Exception as e:
                 warning(f"taskkill 退出失败: {e}，将使用其他方式")
+                _signal_all(roots)
         
-        # Linux 不需要特殊处理，直接使用 SIGTERM
-        
-        # 检查并收集仍在运行的进程
-        target_processes = []
-        for proc in psutil.process_iter(['pid', 'name', 'exe']):
-            try:
-                process_name_lower = proc.info['name'].lower() if proc.info['name'] else ""
-                exe_path = proc.info.get('exe', '').lower() if proc.info.get('exe') else ""
-                
-                # 排除自身进程
-                if proc.pid == os.getpid():
-                    continue
-                
-                # 排除当前应用目录下的所有进程 (防止误杀自己和子进程)
-                # 在 PyInstaller 打包环境中，sys.executable 指向 exe 文件
-                # 在开发环境中，它指向 python.exe
-                try:
-                    import sys
-                    current_exe = sys.executable
-                    current_dir = os.path.dirname(os.path.abspath(current_exe)).lower()
-                    if exe_path and current_dir in exe_path:
-                        # print(f"DEBUG: Skipping process in current dir: {proc.info['name']}")
-                        continue
-                except:
-                    pass
-
-                # 跨平台检测：检查进程名或可执行文件路径
-                is_antigravity = False
-                
-                if system == "Darwin":
-                    # macOS: 检查路径包含 Antigravity.app
-                    is_antigravity = 'antigravity.app' in exe_path
-                elif system == "Windows":
-                    # Windows: 严格匹配进程名 antigravity.exe
-                    # 或者路径包含 antigravity 且进程名不是 Antigravity Manager.exe
-                    is_target_name = process_name_lower in ['antigravity.exe', 'antigravity']
-                    is_in_path = 'antigravity' in exe_path
-                    is_manager = 'manager' in process_name_lower
-                    
-                    is_antigravity = is_target_name or (is_in_path and not is_manager)
-                else:
-                    # Linux: 检查进程名或路径包含 antigravity
-                    is_antigravity = (process_name_lower == 'antigravity' or 
-                                     'antigravity' in exe_path)
-                
-                if is_antigravity:
-                    info(f"发现目标进程: {proc.info['name']} ({proc.pid}) - {exe_path}")
-                    target_processes.append(proc)
-                    
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
-
-        if not target_processes:
-            info("所有 Antigravity 进程已正常关闭")
-            return True
+        else:
+            # Linux: 向主进程发送 SIGTERM，由它关闭子进程
+            info("向主进程发送终止信号 (SIGTERM)...")
+            _signal_all(roots)
         
-        info(f"检测到 {len(target_processes)} 个进程仍在运行")
-
-        # 阶段 2: 温和地请求进程终止 (SIGTERM)
-        info("发送终止信号 (SIGTERM)...")
-        for proc in target_processes:
-            try:
-                if proc.is_running():
-                    proc.terminate()
-            except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
-                continue
-            except Exception as e:
-                continue
-
-        # 等待进程自然终止
+        # 等待根进程退出，同时记录子进程的退出时间
         info(f"等待进程退出（最多 {timeout} 秒）...")
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            still_running = []
-            for proc in target_processes:
-                try:
-                    if proc.is_running():
-                        still_running.append(proc)
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-            
-            if not still_running:
-                info("所有 Antigravity 进程已正常关闭")
-                return True
-                
-            time.sleep(0.5)
-
-        # 阶段 3: 强制终止顽固进程 (SIGKILL)
-        if still_running:
-            still_running_names = ", ".join([f"{p.info['name']}({p.pid})" for p in still_running])
-            warning(f"仍有 {len(still_running)} 个进程未退出: {still_running_names}")
+        remaining = wait_for_exit(tree, timeout, on_exit=record_exit, until=roots)
+        if remaining and not any(proc in remaining for proc in roots):
+            # 主进程已退出，给子进程一点时间随之退出
+            remaining = wait_for_exit(remaining, min(SUBTREE_GRACE_SECONDS, timeout), on_exit=record_exit)
+        
+        if remaining:
+            # 阶段 2: 残留进程（主进程未响应，或孤立的子进程）同时 SIGTERM
+            info(f"向 {len(remaining)} 个残留进程同时发送终止信号 (SIGTERM)...")
+            _signal_all(remaining)
+            remaining = wait_for_exit(remaining, min(SUBTREE_GRACE_SECONDS, timeout), on_exit=record_exit)
+        
+        if remaining:
+            # 阶段 3: 强制终止顽固进程 (SIGKILL)
+            still_running_names = ", ".join([f"{p.info['name']}({p.pid})" for p in remaining])
+            warning(f"仍有 {len(remaining)} 个进程未退出: {still_running_names}")
             
-            if force_kill:
-                info("发送强制终止信号 (SIGKILL)...")
-                for proc in still_running:
-                    try:
-                        if proc.is_running():
-                            proc.kill()
-                    except (psutil.NoSuchProcess, psutil.AccessDenied):
-                        continue
-                
-                # 最后检查
-                time.sleep(1)
-                final_check = []
-                for proc in still_running:
-                    try:
-                        if proc.is_running():
-                            final_check.append(proc)
-                    except (psutil.NoSuchProcess, psutil.AccessDenied):
-                        continue
-                
-                if not final_check:
-                    info("所有 Antigravity 进程已被终止")
-                    return True
-                else:
-                    final_list = ", ".join([f"{p.info['name']}({p.pid})" for p in final_check])
-                    error(f"无法终止的进程: {final_list}")
-                    return False
-            else:
+            if not force_kill:
                 error("部分进程未能关闭，请手动关闭后重试")
                 return False
-                
+            
+            info("发送强制终止信号 (SIGKILL)...")
+            _signal_all(remaining, kill=True)
+            # SIGKILL 无法被忽略，通常立即退出
+            remaining = wait_for_exit(remaining, 3, on_exit=record_exit)
+            if remaining:
+                final_list = ", ".join([f"{p.info['name']}({p.pid})" for p in remaining])
+                error(f"无法终止的进程: {final_list}")
+                return False
+        
+        for pid, exited in sorted(exit_times.items(), key=lambda item: item[1]["seconds"]):
+            debug(f"  {exited['name']}({pid}) 退出于 {exited['seconds'] * 1000:.0f} ms")
+        slowest = max((e["seconds"] for e in exit_times.values()), default=0.0)
+        info(f"所有 Antigravity 进程已关闭 ({len(exit_times)} 个进程, 最慢 {slowest * 1000:.0f} ms)")
         return True
 
     except Exception as e:
@@ -260,13 +1026,128 @@ def _close_antigravity_once(timeout=10, force_kill=True):
         debug(traceback.format_exc())
         return False
 
-def start_antigravity(use_uri=True):
+_launch_stats = {"count": 0, "ready": 0, "last": None}
+
+
+def get_launch_stats():
+    """启动就绪统计: count, ready（成功就绪次数）, last（最近一次 wait_until_ready 的结果）"""
+    return dict(_launch_stats)
+
+
+def _db_files(user_data_dir=None):
+    """state.vscdb 及其 WAL 文件的路径（指定 user_data_dir 时为该实例的数据库）"""
+    files = []
+    db_paths = [instance_db_path(user_data_dir)] if user_data_dir else get_antigravity_db_paths()
+    for db_path in db_paths:
+        files.append(str(db_path))
+        files.append(str(db_path) + "-wal")
+    return files
+
+
+def _db_snapshot(user_data_dir=None):
+    """记录 state.vscdb 与 WAL 的 (size, mtime_ns)，用于检测启动后的写入"""
+    snapshot = {}
+    for path in _db_files(user_data_dir):
+        try:
+            st = os.stat(path)
+            snapshot[path] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            snapshot[path] = None
+    return snapshot
+
+
+def _opened_db(procs, db_files):
+    """返回打开了 state.vscdb 的进程 PID（没有则返回 None）"""
+    for proc in procs:
+        try:
+            if any(f.path in db_files for f in proc.open_files()):
+                return proc.pid
+        except psutil.Error:
+            continue
+    return None
+
+
+def wait_until_ready(timeout=READY_TIMEOUT, started=None, baseline=None, user_data_dir=None):
+    """等待 Antigravity 启动就绪
+    
+    就绪条件：主进程已出现，并且已打开 state.vscdb（通过进程的打开文件检测），
+    或 state.vscdb / WAL 在启动后发生了变化（无权读取打开文件时的备用判断）。
+    
+    Args:
+        timeout: 最长等待时间（秒）
+        started: 计时起点 (time.perf_counter())，默认为调用时
+        baseline: 启动前的 _db_snapshot()，默认为调用时
+        user_data_dir: 等待以该 --user-data-dir 启动的独立实例（见 launch_instance）
+    
+    Returns:
+        Dict: ready, pid (主进程), method ("open_files"/"wal"/None),
+        process_seconds (进程出现耗时), ready_seconds (就绪耗时)
+    """
+    started = started if started is not None else time.perf_counter()
+    baseline = baseline if baseline is not None else _db_snapshot(user_data_dir)
+    db_files = set(_db_files(user_data_dir))
+    deadline = time.monotonic() + timeout
+    result = {"ready": False, "pid": None, "method": None, "process_seconds": None, "ready_seconds": None}
+    
+    while True:
+        targets = _find_target_processes(user_data_dir)
+        if targets:
+            roots, subtree = _build_process_tree(targets)
+            if result["process_seconds"] is None:
+                result["process_seconds"] = time.perf_counter() - started
+                result["pid"] = (roots or targets)[0].pid
+                debug(f"Antigravity 进程已出现: {result['pid']} ({result['process_seconds'] * 1000:.0f} ms)")
+            if _opened_db(roots + subtree, db_files) is not None:
+                result["method"] = "open_files"
+            elif _db_snapshot(user_data_dir) != baseline:
+                result["method"] = "wal"
+            if result["method"]:
+                result["ready"] = True
+                result["ready_seconds"] = time.perf_counter() - started
+                break
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(READY_POLL_SECONDS)
+    
+    _launch_stats["count"] += 1
+    _launch_stats["ready"] += int(result["ready"])
+    _launch_stats["last"] = result
+    if result["ready"]:
+        info(f"Antigravity 已就绪，耗时 {result['ready_seconds'] * 1000:.0f} ms "
+             f"(进程出现 {result['process_seconds'] * 1000:.0f} ms)", event="ready",
+             duration=result["ready_seconds"], method=result["method"])
+    elif result["pid"] is None:
+        warning(f"{timeout} 秒内未检测到 Antigravity 进程", event="ready", duration=time.perf_counter() - started)
+    else:
+        warning(f"Antigravity 进程已启动，但 {timeout} 秒内未打开 state.vscdb", event="ready",
+                duration=time.perf_counter() - started)
+    return result
+
+
+def start_antigravity(use_uri=True, wait_ready=False, ready_timeout=READY_TIMEOUT):
     """启动 Antigravity
     
     Args:
         use_uri: 是否使用 URI 协议启动（默认 True）
                  URI 协议更可靠，不需要查找可执行文件路径
+        wait_ready: 是否等待启动就绪（见 wait_until_ready），为 False 时命令发出即返回
+        ready_timeout: 等待就绪的超时时间（秒）
+    
+    Returns:
+        启动命令是否发出成功；wait_ready=True 时为是否在超时内就绪
     """
+    baseline = _db_snapshot() if wait_ready else None
+    started = time.perf_counter()
+    if not _launch_antigravity(use_uri):
+        return False
+    get_process_watcher().poke()
+    if not wait_ready:
+        return True
+    return wait_until_ready(ready_timeout, started, baseline)["ready"]
+
+
+def _launch_antigravity(use_uri=True):
+    """发送启动命令"""
     info("正在启动 Antigravity...")
     system = platform.system()
     
@@ -306,5 +1187,84 @@ def start_antigravity(use_uri=True):
         # 如果 URI 启动失败，尝试使用可执行文件路径
         if use_uri:
             warning("URI 启动失败，尝试使用可执行文件路径...")
-            return start_antigravity(use_uri=False)
+            return _launch_antigravity(use_uri=False)
         return False
+
+
+def instance_db_path(user_data_dir):
+    """独立实例的 state.vscdb 路径"""
+    return Path(user_data_dir).joinpath(*INSTANCE_DB_PARTS)
+
+
+def _instance_command(user_data_dir, executable=None):
+    """启动独立实例的命令行；找不到可执行文件时返回 None"""
+    arg = f"{USER_DATA_DIR_ARG}={user_data_dir}"
+    if executable:
+        return [str(executable), arg]
+    system = platform.system()
+    if system == "Darwin":
+        # -n: 即使已有实例在运行也启动新进程，由 Electron 按 user-data-dir 决定是否转交
+        return ["open", "-n", "-a", "Antigravity", "--args", arg]
+    if system == "Windows":
+        path = get_antigravity_executable_path()
+        return [str(path), arg] if path and path.exists() else None
+    return ["antigravity", arg]
+
+
+def launch_instance(user_data_dir, executable=None, wait_ready=False, ready_timeout=READY_TIMEOUT):
+    """以独立的 --user-data-dir 启动 Antigravity 实例
+    
+    每个实例有自己的 state.vscdb (<user_data_dir>/User/globalStorage/state.vscdb)，
+    多个实例可以同时运行，互不影响。实例已在运行时发出同样的命令：Electron 的
+    单实例锁按 user-data-dir 区分，新进程会把请求转交给已运行的实例（窗口切到
+    前台）后退出。URI 协议只能打开默认实例，这里总是使用可执行文件启动。
+    
+    Args:
+        user_data_dir: 实例目录
+        executable: Antigravity 可执行文件，默认按平台查找 (Linux 上为 PATH 中的 antigravity)
+        wait_ready: 是否等待实例打开自己的 state.vscdb（已在运行的实例立即返回）
+        ready_timeout: 等待就绪的超时时间（秒）
+    
+    Returns:
+        Dict: ok, running (启动前是否已在运行), pid (Popen 的进程), ready
+        (见 wait_until_ready，未等待时为 None)
+    """
+    user_data_dir = os.path.abspath(user_data_dir)
+    result = {"ok": False, "running": bool(_find_target_processes(user_data_dir)), "pid": None, "ready": None}
+    command = _instance_command(user_data_dir, executable)
+    if command is None:
+        error("找不到 Antigravity 可执行文件")
+        return result
+    
+    baseline = _db_snapshot(user_data_dir) if wait_ready and not result["running"] else None
+    started = time.perf_counter()
+    info(f"{'切换到' if result['running'] else '正在启动'} Antigravity 实例: {user_data_dir}")
+    try:
+        kwargs = {"creationflags": 0x08000000} if platform.system() == "Windows" else {}
+        # 不继承标准输入输出，实例不会占住调用方的管道
+        proc = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL, **kwargs)
+    except Exception as e:
+        error(f"启动实例时出错: {e}")
+        return result
+    result["ok"] = True
+    result["pid"] = proc.pid
+    get_process_watcher().poke()
+    if wait_ready:
+        result["ready"] = result["running"] or wait_until_ready(
+            ready_timeout, started, baseline, user_data_dir)["ready"]
+    return result
+
+
+def list_instances():
+    """正在运行的独立实例
+    
+    Returns:
+        {user_data_dir: [pid, ...]}，PID 按启动时间排序（第一个为主进程）
+    """
+    instances = {}
+    for proc in sorted(_find_target_processes(include_instances=True), key=lambda p: p.info["create_time"]):
+        user_data_dir = _process_user_data_dir(proc)
+        if user_data_dir:
+            instances.setdefault(os.path.abspath(user_data_dir), []).append(proc.pid)
+    return instances
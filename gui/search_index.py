@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Trigram Search Index
+Incremental, typo-tolerant fuzzy matching over short texts (account names and emails)
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, FrozenSet, Hashable, List, Optional, Set, Tuple
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+# Fraction of the query trigrams a document must share to count as a match
+DEFAULT_MIN_SIMILARITY = 0.4
+
+# Trigrams present in more than this fraction of documents carry almost no signal
+# (e.g. "gma" when every email is @gmail.com) and are left out of fuzzy matching
+MAX_TRIGRAM_DOC_FREQUENCY = 0.5
+
+# ...but only once they are in more than this many documents: in a small pool every
+# trigram is "frequent" (e.g. "  u" for user0..user4) and cutting them loses simple typos
+MIN_COMMON_TRIGRAM_DOCS = 50
+
+# Number of per-trigram document sets TrigramIndex keeps between queries
+GRAM_CACHE_SIZE = 1024
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase alphanumeric tokens"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def token_trigrams(token: str) -> Set[str]:
+    """
+    Get the trigram set of a single token
+
+    The token is padded with two leading and one trailing space (like pg_trgm),
+    so short words and word starts still produce distinctive trigrams.
+    """
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigrams(text: str) -> Set[str]:
+    """Get the trigram set of a text (union over its tokens)"""
+    grams = set()
+    for token in tokenize(text):
+        grams |= token_trigrams(token)
+    return grams
+
+
+class TrigramIndex:
+    """
+    Inverted index from trigram to document IDs
+
+    Documents can be added, updated and removed one at a time, so the index can be
+    kept current on every registry write instead of being rebuilt.
+
+    Postings are kept per distinct token (trigram -> tokens -> documents): names and
+    email parts repeat across accounts, so each token's trigrams are computed and
+    indexed once, and ranking scores each token once per query instead of once per
+    candidate document.
+    """
+
+    def __init__(self):
+        self._doc_tokens: Dict[Hashable, Tuple[str, ...]] = {}
+        self._token_docs: Dict[str, Set[Hashable]] = {}
+        self._token_grams: Dict[str, FrozenSet[str]] = {}
+        self._token_postings: Dict[str, Set[str]] = defaultdict(set)
+        # Document sets of recently queried trigrams (consecutive keystrokes share
+        # most trigrams); cleared whenever a document changes
+        self._gram_docs_cache: Dict[str, Set[Hashable]] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_tokens)
+
+    def __contains__(self, doc_id: Hashable) -> bool:
+        return doc_id in self._doc_tokens
+
+    def add(self, doc_id: Hashable, text: str):
+        """Index a document (replaces any previous text for the same ID)"""
+        if doc_id in self._doc_tokens:
+            self.remove(doc_id)
+        self._gram_docs_cache.clear()
+        tokens = tuple(dict.fromkeys(tokenize(text)))
+        for token in tokens:
+            docs = self._token_docs.get(token)
+            if docs is None:
+                docs = self._token_docs[token] = set()
+                grams = self._token_grams[token] = frozenset(token_trigrams(token))
+                for gram in grams:
+                    self._token_postings[gram].add(token)
+            docs.add(doc_id)
+        self._doc_tokens[doc_id] = tokens
+
+    def remove(self, doc_id: Hashable):
+        """Remove a document from the index"""
+        self._gram_docs_cache.clear()
+        for token in self._doc_tokens.pop(doc_id, ()):
+            docs = self._token_docs.get(token)
+            if docs is None:
+                continue
+            docs.discard(doc_id)
+            if docs:
+                continue
+            del self._token_docs[token]
+            for gram in self._token_grams.pop(token, ()):
+                posting = self._token_postings.get(gram)
+                if posting is None:
+                    continue
+                posting.discard(token)
+                if not posting:
+                    del self._token_postings[gram]
+
+    def _gram_docs(self, gram: str) -> Set[Hashable]:
+        """Documents containing a trigram (do not modify the returned set)"""
+        docs = self._gram_docs_cache.get(gram)
+        if docs is not None:
+            return docs
+        tokens = self._token_postings.get(gram)
+        if not tokens:
+            return set()
+        if len(tokens) == 1:
+            return self._token_docs[next(iter(tokens))]
+        if len(self._gram_docs_cache) >= GRAM_CACHE_SIZE:
+            self._gram_docs_cache.clear()
+        docs = self._gram_docs_cache[gram] = set().union(*[self._token_docs[token] for token in tokens])
+        return docs
+
+    def containing(self, query: str) -> Optional[Set[Hashable]]:
+        """
+        Find the documents that may contain the query as a substring
+
+        Every three-character window inside a query token is also a trigram of the
+        document token that contains it, so the result is a superset of the real
+        matches (the caller checks them against the text).
+
+        Returns:
+            Set of candidate document IDs, or None if the query has no token of at
+            least three characters and cannot be narrowed down
+        """
+        windows = {token[i:i + 3] for token in tokenize(query) for i in range(len(token) - 2)}
+        if not windows:
+            return None
+        postings = sorted((self._gram_docs(gram) for gram in windows), key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+    def search(self, query: str, min_similarity: float = DEFAULT_MIN_SIMILARITY,
+               exclude: Optional[Set[Hashable]] = None) -> Dict[Hashable, float]:
+        """
+        Find documents sharing enough trigrams with the query
+
+        Args:
+            query: Search text
+            min_similarity: Minimum fraction of query trigrams a document must contain
+            exclude: Documents to leave out (e.g. those already found by substring)
+
+        Returns:
+            Dict of document ID to relevance score (0..1), the best Dice similarity
+            between the query and any single token of the document
+        """
+        all_grams = trigrams(query)
+        max_postings = max(MIN_COMMON_TRIGRAM_DOCS, int(len(self._doc_tokens) * MAX_TRIGRAM_DOC_FREQUENCY))
+        postings = [posting for posting in map(self._gram_docs, all_grams) if len(posting) <= max_postings]
+        if not postings:
+            return {}
+
+        total = len(postings)
+        min_shared = max(1, math.ceil(total * min_similarity))
+
+        # Any document sharing min_shared of the query trigrams must appear in at
+        # least one of the (total - min_shared + 1) rarest postings, so candidates
+        # are collected from those only and checked against the rest.
+        postings.sort(key=len)
+        probe_count = total - min_shared + 1
+        counts = Counter()
+        for posting in postings[:probe_count]:
+            counts.update(posting)
+        for doc_id in exclude or ():
+            counts.pop(doc_id, None)
+
+        remaining = postings[probe_count:]
+        if remaining:
+            matches = []
+            for doc_id, shared in counts.items():
+                if shared + len(remaining) < min_shared:
+                    continue
+                for posting in remaining:
+                    if doc_id in posting:
+                        shared += 1
+                if shared >= min_shared:
+                    matches.append(doc_id)
+        else:
+            matches = [doc_id for doc_id, shared in counts.items() if shared >= min_shared]
+        if not matches:
+            return {}
+        token_score = self._token_scores(all_grams).__getitem__
+        return {doc_id: max(map(token_score, self._doc_tokens[doc_id])) for doc_id in matches}
+
+    def _token_scores(self, query_grams: Set[str]) -> Dict[str, float]:
+        """Dice similarity between the query and each token (scored once per query, 0.0 if unrelated)"""
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self._token_postings.get(gram, ()))
+        size = len(query_grams)
+        scores = defaultdict(float)
+        for token, count in shared.items():
+            scores[token] = 2 * count / (len(self._token_grams[token]) + size)
+        return scores
@@ -1,7 +1,16 @@
 # -*- coding: utf-8 -*-
+import atexit
+import contextlib
+import contextvars
+import gzip
+import json
 import os
+import queue
+import shutil
 import sys
 import platform
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
 
@@ -17,19 +26,292 @@ def get_log_file_path():
     except:
         return None
 
+# 日志文件写入：调用方只入队，后台线程批量写入
+LOG_FLUSH_INTERVAL = 1.0  # 缓冲的日志最多延迟多少秒写入
+LOG_FLUSH_BYTES = 64 * 1024  # 缓冲达到多少字节立即写入
+LOG_MAX_BYTES = 5 * 1024 * 1024  # app.log 超过该大小时轮转
+LOG_BACKUP_COUNT = 5  # 保留的压缩归档数 (app.log.1.gz 最新)
+
+
+class LogWriter:
+    """后台日志写入线程
+
+    write() 只把 (时间, 消息) 放入队列；写入线程把日志攒成一批，在达到
+    LOG_FLUSH_BYTES 或距上次写入 LOG_FLUSH_INTERVAL 秒时一次写入，文件句柄
+    保持打开。每批写入后检查大小，超过 LOG_MAX_BYTES 时把 app.log 压缩为
+    app.log.1.gz 并依次后移旧归档。退出时 (atexit) 写完队列中剩余的日志。
+    其他进程 (例如 CLI 与 GUI 同时运行) 轮转了文件时自动重新打开。
+    """
+
+    def __init__(self, path, flush_interval=LOG_FLUSH_INTERVAL, flush_bytes=LOG_FLUSH_BYTES,
+                 max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._direct_lock = threading.Lock()
+        self._closed = False
+        self._file = None
+        self._stamp_second = None
+        self._stamp = ""
+        self.stats = {"lines": 0, "batches": 0, "bytes": 0, "rotations": 0}
+
+    # 调用方 ------------------------------------------------------------------
+
+    def write(self, message):
+        """记录一行日志 (不做任何 I/O)"""
+        if self._closed:
+            # 退出流程中产生的日志直接写入
+            with self._direct_lock:
+                self._write_batch([self._format(time.time(), message)])
+            return
+        if self._thread is None:
+            self._start()
+        self._queue.put((time.time(), message))
+
+    def flush(self, timeout=5.0):
+        """等待此前入队的日志全部写入文件"""
+        if self._thread is None or self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """写完剩余日志并停止写入线程，之后的日志直接写入文件"""
+        if self._thread is not None and not self._closed:
+            self._queue.put(None)
+            self._thread.join(timeout)
+        with self._direct_lock:
+            self._closed = True
+            # 停止信号之后才入队的日志
+            leftover = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, tuple):
+                    leftover.append(self._format(*item))
+                elif isinstance(item, threading.Event):
+                    item.set()
+            if leftover:
+                self._write_batch(leftover)
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    # 写入线程 ----------------------------------------------------------------
+
+    def _format(self, timestamp, message):
+        second = int(timestamp)
+        if second != self._stamp_second:
+            self._stamp_second = second
+            self._stamp = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+        return f"[{self._stamp}] {message}\n"
+
+    def _run(self):
+        batch = []
+        size = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            if isinstance(item, tuple):
+                line = self._format(*item)
+                batch.append(line)
+                size += len(line)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if size < self.flush_bytes:
+                    continue
+            # 超时、缓冲已满、flush() 或 close()
+            if batch:
+                self._write_batch(batch)
+                batch = []
+                size = 0
+            deadline = None
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                break
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write_batch(self, lines):
+        try:
+            f = self._open()
+            data = "".join(lines)
+            f.write(data)
+            f.flush()
+            self.stats["lines"] += len(lines)
+            self.stats["batches"] += 1
+            self.stats["bytes"] += len(data)
+            if self.max_bytes and f.tell() >= self.max_bytes:
+                self._rotate()
+        except Exception:
+            # 日志写入失败不能影响调用方
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except Exception:
+                    pass
+                self._file = None
+
+    def _open(self):
+        if self._file is not None:
+            try:
+                # 其他进程轮转后，继续写入新的 app.log
+                if os.stat(self.path).st_ino == os.fstat(self._file.fileno()).st_ino:
+                    return self._file
+            except OSError:
+                pass
+            self._file.close()
+        self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def _rotate(self):
+        """把 app.log 压缩为 app.log.1.gz，旧归档依次后移，超过 backup_count 的删除"""
+        self._file.close()
+        self._file = None
+        # 先改名占住这次轮转，同时轮转的其他进程会得到 FileNotFoundError
+        rotating = self.path.with_name(f"{self.path.name}.{os.getpid()}.rotating")
+        try:
+            os.replace(self.path, rotating)
+        except OSError:
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{i}.gz")
+            if older.exists():
+                os.replace(older, self.path.with_name(f"{self.path.name}.{i + 1}.gz"))
+        archive = self.path.with_name(f"{self.path.name}.1.gz")
+        temp = archive.with_name(archive.name + ".tmp")
+        with open(rotating, "rb") as src, gzip.open(temp, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(temp, archive)
+        os.remove(rotating)
+        self.stats["rotations"] += 1
+
+
+class EventLogWriter(LogWriter):
+    """结构化事件日志 (events.jsonl) 写入器：每条记录一行 JSON，缓冲与轮转同 LogWriter"""
+
+    def _format(self, timestamp, record):
+        ts = datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds")
+        return json.dumps({"ts": ts, **record}, ensure_ascii=False, default=str) + "\n"
+
+
+# 每条事件都包含的字段 (没有时为 null)，便于跨机器聚合
+EVENT_FIELDS = ("duration", "account_id", "db_path", "retry", "bytes")
+
+_log_writer = None
+_event_writer = None
+_log_writer_lock = threading.Lock()
+_debug_to_file = False
+_structured_logging = False
+# 当前操作的日志字段 (例如切换中的 account_id)，见 log_context
+_log_context = contextvars.ContextVar("log_context", default={})
+
+
+def get_log_writer():
+    """获取日志写入器单例 (无法确定日志路径时返回 None)"""
+    global _log_writer
+    if _log_writer is None:
+        with _log_writer_lock:
+            if _log_writer is None:
+                log_file = get_log_file_path()
+                if log_file is None:
+                    return None
+                _log_writer = LogWriter(log_file)
+    return _log_writer
+
+
+def get_event_log_path():
+    """获取结构化事件日志路径"""
+    try:
+        return get_app_data_dir() / "events.jsonl"
+    except Exception:
+        return None
+
+
+def get_event_writer():
+    """获取事件日志写入器单例 (无法确定路径时返回 None)"""
+    global _event_writer
+    if _event_writer is None:
+        with _log_writer_lock:
+            if _event_writer is None:
+                path = get_event_log_path()
+                if path is None:
+                    return None
+                _event_writer = EventLogWriter(path)
+    return _event_writer
+
+
+def set_structured_logging(enabled):
+    """是否同时把每条日志写入 events.jsonl (配置 structured_logging)"""
+    global _structured_logging
+    _structured_logging = bool(enabled)
+
+
+@contextlib.contextmanager
+def log_context(**fields):
+    """在 with 块内 (同一线程/上下文) 的所有日志事件附带这些字段，例如 account_id"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def _log_event(level, message, fields, depth):
+    """写入一条结构化事件；event 默认为调用日志函数的 "模块.函数" """
+    try:
+        frame = sys._getframe(depth + 1)
+        module = frame.f_globals.get("__name__", "?").rsplit(".", 1)[-1]
+        record = {"level": level, "event": None, "module": module}
+        record.update(dict.fromkeys(EVENT_FIELDS))
+        record.update(_log_context.get())
+        record.update(fields)
+        if not record["event"]:
+            record["event"] = f"{module}.{frame.f_code.co_name}"
+        record["msg"] = message
+        record["pid"] = os.getpid()
+        writer = get_event_writer()
+        if writer is not None:
+            writer.write(record)
+    except Exception:
+        pass
+
+
+def set_debug_logging(enabled):
+    """未设置 DEBUG 环境变量时，是否把调试日志写入文件 (配置 enable_debug_logging)"""
+    global _debug_to_file
+    _debug_to_file = bool(enabled)
+
+
 def _log_to_file(message):
-    """写入日志到文件"""
+    """写入日志到文件 (入队，由后台线程写入)"""
     try:
-        log_file = get_log_file_path()
-        if log_file:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(f"[{timestamp}] {message}\n")
-    except:
+        writer = get_log_writer()
+        if writer is not None:
+            writer.write(message)
+    except Exception:
         pass
 
-def _print_with_color(color_code, symbol, message):
-    """带颜色的打印函数，同时写入文件"""
+def _print_with_color(color_code, symbol, message, fields=None):
+    """带颜色的打印函数，同时写入文件 (开启结构化日志时另写一条事件)"""
     formatted_msg = f"{symbol} {message}"
     # 在无控制台模式下，sys.stdout 可能为 None，直接打印会报错
     if sys.stdout:
@@ -38,27 +320,73 @@ def _print_with_color(color_code, symbol, message):
         except:
             pass
     _log_to_file(formatted_msg)
+    if _structured_logging:
+        _log_event(symbol.strip(), message, fields or {}, depth=2)
+
+# 日志函数的关键字参数 (event, duration, account_id, db_path, retry, bytes 等)
+# 只写入结构化事件日志，不影响控制台和 app.log 的内容
 
-def info(message):
+def info(message, **fields):
     """打印信息日志 (绿色)"""
-    _print_with_color("32", "INFO", message)
+    _print_with_color("32", "INFO", message, fields)
 
-def warning(message):
+def warning(message, **fields):
     """打印警告日志 (黄色)"""
-    _print_with_color("33", "WARN", message)
+    _print_with_color("33", "WARN", message, fields)
 
-def error(message):
+def error(message, **fields):
     """打印错误日志 (红色)"""
-    _print_with_color("31", "ERR ", message)
+    _print_with_color("31", "ERR ", message, fields)
 
-def debug(message):
+def debug(message, **fields):
     """打印调试日志 (灰色)"""
     # 只有在设置了DEBUG环境变量时才打印
     if os.environ.get("DEBUG"):
-        _print_with_color("90", "DBUG", message)
-    else:
-        # 在打包应用中，我们也希望记录调试信息到文件，方便排查
+        _print_with_color("90", "DBUG", message, fields)
+    elif _debug_to_file:
+        # 在打包应用中开启 enable_debug_logging 后记录调试信息到文件，方便排查
         _log_to_file(f"DBUG {message}")
+        if _structured_logging:
+            _log_event("DBUG", message, fields, depth=1)
+
+# -------------------------------------------------------------------------
+# 进程间文件锁
+# -------------------------------------------------------------------------
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+@contextlib.contextmanager
+def file_lock(lock_path):
+    """进程间互斥锁 (GUI 与命令行同时运行时保护共享文件)
+
+    锁文件本身不存放数据；同一线程不可嵌套获取同一把锁。
+    """
+    lock_path = Path(lock_path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 重试约 10 秒后放弃，继续等待
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
 
 # -------------------------------------------------------------------------
 # 路径工具
@@ -76,6 +404,10 @@ def get_accounts_file_path():
     """获取账号存储文件路径"""
     return get_app_data_dir() / "antigravity_accounts.json"
 
+def get_instances_dir():
+    """独立实例目录的根目录 (每个账号一个 --user-data-dir)"""
+    return get_app_data_dir() / "instances"
+
 def get_antigravity_db_paths():
     """获取 Antigravity 数据库可能的路径"""
     system = platform.system()
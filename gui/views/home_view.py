@@ -2,14 +2,16 @@ import flet as ft
 import threading
 import time
 from datetime import datetime
-from process_manager import is_process_running, start_antigravity, close_antigravity
-from account_manager import add_account_snapshot, list_accounts_data, switch_account, delete_account
+from process_manager import is_process_running, start_antigravity, close_antigravity, get_process_watcher, get_resource_sampler
+from account_manager import add_account_snapshot, list_accounts_data, get_account_index, switch_account, next_rotation_account, delete_account, list_account_generations
 from db_manager import get_current_account_info
+from config_manager import get_config
 from theme import get_palette
 from icons import AppIcons
 
 RADIUS_CARD = 12
 PADDING_PAGE = 20
+PAGE_SIZE = 50
 
 class HomeView(ft.Container):
     def __init__(self, page: ft.Page):
@@ -52,6 +54,7 @@ class HomeView(ft.Container):
         self.accounts_list = ft.Column(spacing=12, scroll=ft.ScrollMode.HIDDEN)
         self.current_email = None
         self.search_query = ""
+        self.page_limit = PAGE_SIZE
         
         # Search field
         self.search_field = ft.TextField(
@@ -69,13 +72,17 @@ class HomeView(ft.Container):
         
         # Start status monitoring
         self.running = True
+        self.unsubscribe_status = None
+        self.release_sampler = None
 
     def did_mount(self):
         self.running = True
         self.build_ui()
         self.refresh_data()
-        self.monitor_thread = threading.Thread(target=self.monitor_status, daemon=True)
-        self.monitor_thread.start()
+        # Status updates are pushed by the shared process watcher (current state first),
+        # resource usage by the sampler through the same watcher
+        self.unsubscribe_status = get_process_watcher().subscribe(self.on_process_event)
+        self.release_sampler = get_resource_sampler().start()
         
         # 自动备份当前账号
         self.auto_backup()
@@ -90,9 +97,13 @@ class HomeView(ft.Container):
 
     def will_unmount(self):
         self.running = False
-        # Wait for monitor thread to finish
-        if hasattr(self, 'monitor_thread') and self.monitor_thread.is_alive():
-            self.monitor_thread.join(timeout=2.0)
+        if self.unsubscribe_status:
+            self.unsubscribe_status()
+            self.unsubscribe_status = None
+        # The sampler's own watcher subscription would otherwise keep the watcher thread alive
+        if self.release_sampler:
+            self.release_sampler()
+            self.release_sampler = None
 
     def update_theme(self):
         self.palette = get_palette(self.page)
@@ -107,12 +118,15 @@ class HomeView(ft.Container):
         
         # Rebuild UI or refresh data to update list items
         self.refresh_data()
+        if get_process_watcher().running is not None:
+            self.apply_status(get_process_watcher().running)
         self.update()
     
     def on_search_changed(self, e):
         """Handle search query changes"""
         self.search_query = e.control.value.lower().strip()
-        self.refresh_data()
+        self.page_limit = PAGE_SIZE
+        self.refresh_list()
 
     def build_ui(self):
         self.content = ft.Column(
@@ -133,25 +147,45 @@ class HomeView(ft.Container):
                             vertical_alignment=ft.CrossAxisAlignment.CENTER,
                             spacing=8
                         ),
-                        ft.Container(
-                            content=ft.Row(
-                                [
-                                    ft.Icon(AppIcons.add, size=14, color="#FFFFFF"), # Always white on primary
-                                    ft.Text("Backup current", size=13, color="#FFFFFF", weight=ft.FontWeight.W_600)
-                                ],
-                                spacing=4,
-                                alignment=ft.MainAxisAlignment.CENTER
-                            ),
-                            bgcolor=self.palette.primary,
-                            padding=ft.padding.symmetric(horizontal=16, vertical=8),
-                            border_radius=8,
-                            on_click=self.backup_current,
-                            shadow=ft.BoxShadow(
-                                spread_radius=0,
-                                blur_radius=8,
-                                color=ft.Colors.with_opacity(0.4, self.palette.primary),
-                                offset=ft.Offset(0, 2),
-                            )
+                        ft.Row(
+                            [
+                                ft.Container(
+                                    content=ft.Row(
+                                        [
+                                            ft.Icon(ft.Icons.SKIP_NEXT, size=14, color=self.palette.primary),
+                                            ft.Text("Next account", size=13, color=self.palette.primary, weight=ft.FontWeight.W_600)
+                                        ],
+                                        spacing=4,
+                                        alignment=ft.MainAxisAlignment.CENTER
+                                    ),
+                                    bgcolor=self.palette.bg_light_blue,
+                                    padding=ft.padding.symmetric(horizontal=16, vertical=8),
+                                    border_radius=8,
+                                    on_click=self.switch_to_next,
+                                    tooltip="Switch to the least recently used account",
+                                ),
+                                ft.Container(
+                                    content=ft.Row(
+                                        [
+                                            ft.Icon(AppIcons.add, size=14, color="#FFFFFF"), # Always white on primary
+                                            ft.Text("Backup current", size=13, color="#FFFFFF", weight=ft.FontWeight.W_600)
+                                        ],
+                                        spacing=4,
+                                        alignment=ft.MainAxisAlignment.CENTER
+                                    ),
+                                    bgcolor=self.palette.primary,
+                                    padding=ft.padding.symmetric(horizontal=16, vertical=8),
+                                    border_radius=8,
+                                    on_click=self.backup_current,
+                                    shadow=ft.BoxShadow(
+                                        spread_radius=0,
+                                        blur_radius=8,
+                                        color=ft.Colors.with_opacity(0.4, self.palette.primary),
+                                        offset=ft.Offset(0, 2),
+                                    )
+                                )
+                            ],
+                            spacing=8
                         )
                     ],
                     alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
@@ -179,24 +213,19 @@ class HomeView(ft.Container):
         if info and "email" in info:
             self.current_email = info["email"]
             
-        # Refresh accounts list
+        self.refresh_list()
+
+    def refresh_list(self):
+        # Refresh accounts list (only the visible page is built)
         self.accounts_list.controls.clear()
-        accounts = list_accounts_data()
-        
-        # Filter accounts based on search query
-        if self.search_query:
-            accounts = [
-                acc for acc in accounts
-                if self.search_query in acc.get('name', '').lower() or
-                   self.search_query in acc.get('email', '').lower()
-            ]
+        accounts = list_accounts_data(query=self.search_query, limit=self.page_limit)
         
         # Update stats badge
-        total_accounts = len(list_accounts_data())
-        if self.search_query and len(accounts) != total_accounts:
-            self.stats_badge.content.value = f"{len(accounts)}/{total_accounts} Backup"
+        total_accounts = len(get_account_index())
+        if self.search_query and accounts.total != total_accounts:
+            self.stats_badge.content.value = f"{accounts.total}/{total_accounts} Backup"
         else:
-            self.stats_badge.content.value = f"{len(accounts)} Backup"
+            self.stats_badge.content.value = f"{accounts.total} Backup"
         
         if not accounts:
             empty_message = "No matching accounts found." if self.search_query else "No backup records available."
@@ -219,9 +248,24 @@ class HomeView(ft.Container):
             for idx, acc in enumerate(accounts):
                 is_current = (acc.get('email') == self.current_email)
                 self.accounts_list.controls.append(self.create_account_row(acc, is_current))
+            
+            remaining = accounts.total - len(accounts)
+            if remaining > 0:
+                self.accounts_list.controls.append(
+                    ft.Container(
+                        content=ft.Text(f"Show more ({remaining} remaining)", size=13, color=self.palette.primary, weight=ft.FontWeight.W_600),
+                        alignment=ft.alignment.center,
+                        padding=10,
+                        on_click=self.show_more
+                    )
+                )
         
         self.update()
 
+    def show_more(self, e):
+        self.page_limit += PAGE_SIZE
+        self.refresh_list()
+
     def format_last_used(self, iso_str):
         if not iso_str:
             return "从未 - Never"
@@ -313,6 +357,11 @@ class HomeView(ft.Container):
                                         icon=ft.Icons.SWAP_HORIZ,
                                         on_click=lambda e, aid=acc['id']: self.switch_to_account(aid)
                                     ),
+                                    ft.PopupMenuItem(
+                                        text="Restore older version", 
+                                        icon=ft.Icons.HISTORY,
+                                        on_click=lambda e, aid=acc['id']: self.show_generations(aid)
+                                    ),
                                     ft.PopupMenuItem(
                                         text="Export backup", 
                                         icon=ft.Icons.UPLOAD_FILE,
@@ -354,37 +403,51 @@ class HomeView(ft.Container):
             e.control.shadow.offset = ft.Offset(0, 6) if e.data == "true" else ft.Offset(0, 2)
             e.control.update()
 
-    def monitor_status(self):
-        while self.running:
-            is_running = is_process_running()
-            
-            # Update Status Bar
-            content_row = self.status_bar.content
-            icon = content_row.controls[0]
-            text = content_row.controls[1]
-            
-            if is_running:
-                self.status_bar.bgcolor = self.palette.bg_light_green
-                icon.name = AppIcons.check_circle
-                icon.color = "#34C759"
-                text.value = "Antigravity Running in the background"
-                text.color = "#34C759"
-            else:
-                self.status_bar.bgcolor = self.palette.bg_light_red
-                icon.name = AppIcons.pause_circle
-                icon.color = "#FF3B30"
-                text.value = "Antigravity Service has been stopped (click to start)"
-                text.color = "#FF3B30"
-            
-            # Only update if still mounted
-            if self.running and self.page:
-                try:
-                    self.update()
-                except Exception:
-                    # View was unmounted, stop monitoring
-                    break
-            
-            time.sleep(2)
+    def on_process_event(self, event):
+        """Process watcher callback (runs on the watcher thread)"""
+        if event["event"] == "sample":
+            if not event["running"]:
+                return
+            self.apply_status(True, event)
+        elif event["event"] in ("state", "started", "stopped"):
+            self.apply_status(event["running"])
+        else:
+            return
+        
+        # Only update if still mounted
+        if self.running and self.page:
+            try:
+                self.update()
+            except Exception:
+                # View was unmounted, stop listening
+                if self.unsubscribe_status:
+                    self.unsubscribe_status()
+                    self.unsubscribe_status = None
+                if self.release_sampler:
+                    self.release_sampler()
+                    self.release_sampler = None
+
+    def apply_status(self, is_running, sample=None):
+        # Update Status Bar
+        content_row = self.status_bar.content
+        icon = content_row.controls[0]
+        text = content_row.controls[1]
+        
+        if is_running:
+            self.status_bar.bgcolor = self.palette.bg_light_green
+            icon.name = AppIcons.check_circle
+            icon.color = "#34C759"
+            text.value = "Antigravity Running in the background"
+            if sample is not None:
+                text.value += (f"  ·  CPU {sample['cpu_percent']:.0f}%  ·  "
+                               f"{sample['rss_bytes'] / 1024 / 1024:.0f} MB  ·  {sample['threads']} threads")
+            text.color = "#34C759"
+        else:
+            self.status_bar.bgcolor = self.palette.bg_light_red
+            icon.name = AppIcons.pause_circle
+            icon.color = "#FF3B30"
+            text.value = "Antigravity Service has been stopped (click to start)"
+            text.color = "#FF3B30"
 
     def toggle_app_status(self, e):
         if is_process_running():
@@ -407,10 +470,17 @@ class HomeView(ft.Container):
         self.page.open(dlg)
 
     def start_app(self, e):
-        if start_antigravity():
-            pass
-        else:
-            self.show_message("Startup failed", True)
+        config = get_config()
+        if not config.get("wait_for_ready", False):
+            if not start_antigravity():
+                self.show_message("Startup failed", True)
+            return
+        
+        def start_task():
+            # Block (off the UI thread) until Antigravity has opened its database
+            if not start_antigravity(wait_ready=True, ready_timeout=config.get("ready_timeout", 30)):
+                self.show_message("Antigravity did not become ready in time", True)
+        threading.Thread(target=start_task, daemon=True).start()
 
     def stop_app(self, e):
         def close_task():
@@ -457,10 +527,10 @@ class HomeView(ft.Container):
         )
         self.page.open(dlg)
 
-    def switch_to_account(self, account_id):
+    def switch_to_account(self, account_id, generation=0):
         def task():
             try:
-                if switch_account(account_id):
+                if switch_account(account_id, generation=generation):
                     self.refresh_data()
                     # Optional: show success message
                     # self.show_message("切换账号成功")
@@ -474,6 +544,56 @@ class HomeView(ft.Container):
                 self.show_message(f"An error occurred: {str(e)}", True)
         threading.Thread(target=task, daemon=True).start()
 
+    def switch_to_next(self, e):
+        def task():
+            try:
+                account = next_rotation_account()
+                if not account:
+                    self.show_message("No account available for rotation (all excluded or cooling down).", True)
+                elif switch_account(account["id"]):
+                    self.refresh_data()
+                else:
+                    self.show_message("Account switching failed, please check the logs.", True)
+            except Exception as e:
+                import traceback
+                error_msg = f"Rotation error: {str(e)}\n{traceback.format_exc()}"
+                from utils import error
+                error(error_msg)
+                self.show_message(f"An error occurred: {str(e)}", True)
+        threading.Thread(target=task, daemon=True).start()
+
+    def show_generations(self, account_id):
+        """Show the backup versions of an account and restore the selected one"""
+        generations = list_account_generations(account_id)
+        older = [g for g in generations if g["generation"] > 0]
+        if not older:
+            self.show_message("No older versions of this backup are available.")
+            return
+        
+        def restore(generation):
+            self.page.close(dlg)
+            self.switch_to_account(account_id, generation)
+        
+        dlg = ft.AlertDialog(
+            title=ft.Text("Restore older version"),
+            content=ft.Column(
+                [
+                    ft.TextButton(
+                        f"#{g['generation']}  {self.format_last_used(g['backup_time'])}",
+                        icon=ft.Icons.HISTORY,
+                        on_click=lambda e, gen=g["generation"]: restore(gen)
+                    )
+                    for g in older
+                ],
+                tight=True,
+                spacing=4
+            ),
+            actions=[
+                ft.TextButton("取消 - Cancel", on_click=lambda e: self.page.close(dlg))
+            ]
+        )
+        self.page.open(dlg)
+
     def export_account(self, account_id, account_name):
         """Export account backup to file"""
         import platform
@@ -484,7 +604,7 @@ class HomeView(ft.Container):
                 # Generate default filename
                 import time
                 timestamp = time.strftime("%Y%m%d_%H%M%S")
-                default_filename = f"{account_name}_{timestamp}.json"
+                default_filename = f"{account_name}_{timestamp}.agbk"
                 
                 # Use platform-specific file dialog
                 if platform.system() == "Darwin":
@@ -6,7 +6,9 @@ from pathlib import Path
 from theme import get_palette
 from icons import AppIcons
 from config_manager import get_config
-from backup_manager import cleanup_old_backups, cleanup_orphaned_backups, verify_all_backups, get_backup_statistics
+from backup_manager import verify_backups_report, get_backup_statistics
+from backup_maintenance import run_maintenance
+from jobs import run_job
 
 RADIUS_CARD = 12
 PADDING_PAGE = 20
@@ -18,6 +20,7 @@ class SettingsView(ft.Container):
         self.expand = True
         self.padding = PADDING_PAGE
         self.config = get_config()
+        self.current_job = None
         
         # Initialize with current palette
         self.palette = get_palette(page)
@@ -258,6 +261,15 @@ class SettingsView(ft.Container):
                                                 bgcolor=self.palette.bg_light_blue,
                                             )
                                         ),
+                                        ft.ElevatedButton(
+                                            "Export All",
+                                            icon=ft.Icons.ARCHIVE,
+                                            on_click=self.export_all_accounts,
+                                            style=ft.ButtonStyle(
+                                                color=self.palette.text_main,
+                                                bgcolor=self.palette.bg_light_blue,
+                                            )
+                                        ),
                                         ft.ElevatedButton(
                                             "Import",
                                             icon=ft.Icons.DOWNLOAD,
@@ -290,35 +302,134 @@ class SettingsView(ft.Container):
             ),
         )
     
+    def start_job(self, title, target, on_result):
+        """Run target(job) in the background with a live progress dialog"""
+        if self.current_job is not None and self.current_job.state in ("pending", "running"):
+            self.show_message(f"{self.current_job.name} is still running")
+            return
+        
+        progress_bar = ft.ProgressBar(width=360, value=None, color=self.palette.primary)
+        status_text = ft.Text("Starting...", size=12, color=self.palette.text_grey)
+        cancel_button = ft.TextButton("Cancel")
+        dlg = ft.AlertDialog(
+            modal=True,
+            title=ft.Text(title),
+            content=ft.Column([progress_bar, status_text], tight=True, spacing=10),
+            actions=[cancel_button],
+        )
+        
+        def on_progress(progress):
+            progress_bar.value = progress["fraction"]
+            status_text.value = self.format_progress(progress)
+            try:
+                self.page.update()
+            except Exception:
+                pass
+        
+        def on_done(job):
+            self.page.close(dlg)
+            if job.state == "done":
+                on_result(job.result)
+            elif job.state == "cancelled":
+                self.show_message(f"{title} cancelled")
+            else:
+                self.show_message(f"{title} failed: {job.error}")
+        
+        def on_cancel(e):
+            cancel_button.disabled = True
+            status_text.value = "Cancelling..."
+            self.page.update()
+            job.cancel()
+        
+        cancel_button.on_click = on_cancel
+        self.page.open(dlg)
+        job = run_job(title, target, on_progress=on_progress, on_done=on_done)
+        self.current_job = job
+    
+    @staticmethod
+    def format_progress(progress):
+        """Format a job progress snapshot: items, throughput and ETA"""
+        parts = []
+        if progress["total_items"] is not None:
+            parts.append(f"{progress['done_items']} / {progress['total_items']}")
+        if progress["done_bytes"]:
+            parts.append(f"{progress['done_bytes'] / 1024 / 1024:.1f} MB "
+                         f"({progress['bytes_per_second'] / 1024 / 1024:.1f} MB/s)")
+        elif progress["items_per_second"]:
+            parts.append(f"{progress['items_per_second']:.0f}/s")
+        if progress["eta_seconds"] is not None:
+            parts.append(f"ETA {progress['eta_seconds']:.0f}s")
+        return " · ".join(parts) or "Working..."
+    
     def cleanup_old_backups(self, e):
         """Clean up old backups"""
-        import threading
-        
-        def task():
-            deleted, freed = cleanup_old_backups(dry_run=False)
-            cleanup_orphaned_backups()
-            if deleted > 0:
-                self.show_message(f"Cleaned {deleted} old backups, freed {freed / 1024 / 1024:.2f} MB")
+        def on_result(report):
+            deleted = report["expired"] + report["orphaned"]
+            if deleted or report["bytes_freed"]:
+                self.show_message(
+                    f"Cleaned {deleted} old backups and {report['leftovers']} leftover files, "
+                    f"freed {report['bytes_freed'] / 1024 / 1024:.2f} MB\n"
+                    f"Backups now use {report['total_bytes'] / 1024 / 1024:.2f} MB"
+                )
             else:
                 self.show_message("No old backups to clean")
         
-        threading.Thread(target=task, daemon=True).start()
+        self.start_job("Cleaning backups", lambda job: run_maintenance(dry_run=False, job=job), on_result)
     
     def verify_backups(self, e):
         """Verify all backups"""
-        import threading
+        def on_result(report):
+            self.show_message(
+                f"Verification complete: {report['valid']} valid, {report['invalid']} invalid\n"
+                f"{report['verified']} checked, {report['cached']} unchanged "
+                f"in {report['elapsed_seconds'] * 1000:.0f} ms ({report['mb_per_second']:.1f} MB/s)"
+            )
         
-        def task():
-            valid, invalid, _ = verify_all_backups()
-            self.show_message(f"Verification complete: {valid} valid, {invalid} invalid")
+        self.start_job("Verifying backups", lambda job: verify_backups_report(job=job), on_result)
+    
+    def export_all_accounts(self, e):
+        """Export all accounts into one archive"""
+        import time
+        from backup_archive import export_accounts
         
-        threading.Thread(target=task, daemon=True).start()
+        downloads = Path.home() / "Downloads"
+        target_dir = downloads if downloads.is_dir() else Path.home()
+        export_path = target_dir / f"antigravity_accounts_{time.strftime('%Y%m%d_%H%M%S')}.tar.gz"
+        
+        def on_result(report):
+            message = f"Exported {report['exported']} accounts to:\n{export_path}"
+            if report["failed"]:
+                message += f"\n{len(report['failed'])} failed, please check the logs."
+            self.show_message(message)
+        
+        self.start_job("Exporting accounts", lambda job: export_accounts(str(export_path), job=job), on_result)
     
     def import_backup(self, e):
         """Import backup from file"""
         import threading
         import platform
-        from backup_manager import import_backup as do_import
+        from backup_manager import import_backup
+        from backup_archive import import_accounts
+        
+        def do_import(import_path):
+            if import_path.lower().endswith((".tar.gz", ".tgz", ".tar", ".zip")):
+                def on_archive_result(report):
+                    self.show_message(
+                        f"Imported {report['imported']}, updated {report['updated']}, "
+                        f"skipped {report['skipped']}, failed {report['failed']}"
+                    )
+                
+                self.start_job("Importing accounts", lambda job: import_accounts(import_path, job=job),
+                               on_archive_result)
+                return
+            
+            def on_result(ok):
+                if ok:
+                    self.show_message("Backup imported successfully!")
+                else:
+                    self.show_message("Import failed, please check the logs.")
+            
+            self.start_job("Importing backup", lambda job: import_backup(import_path, job=job), on_result)
         
         def task():
             try:
@@ -327,16 +438,12 @@ class SettingsView(ft.Container):
                     # macOS
                     import subprocess
                     result = subprocess.run(
-                        ["osascript", "-e", 'POSIX path of (choose file with prompt "Select Backup File" of type {"json"})'],
+                        ["osascript", "-e", 'POSIX path of (choose file with prompt "Select Backup File" of type {"json", "agbk", "gz", "tgz", "tar", "zip"})'],
                         capture_output=True,
                         text=True
                     )
                     if result.returncode == 0:
-                        import_path = result.stdout.strip()
-                        if do_import(import_path):
-                            self.show_message("Backup imported successfully!")
-                        else:
-                            self.show_message("Import failed, please check the logs.")
+                        do_import(result.stdout.strip())
                 elif platform.system() == "Windows":
                     # Windows - show message to manually select
                     self.show_message("Please place the backup file in Downloads folder and enter the filename:")
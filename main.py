@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 import argparse
+import contextlib
+import json
 import sys
 import os
+import threading
+import time
+from collections import deque
 
 # 将 gui 目录添加到 sys.path，以便内部模块可以相互导入 (例如 account_manager 导入 utils)
 sys.path.append(os.path.join(os.path.dirname(__file__), "gui"))
@@ -12,11 +17,25 @@ try:
     from gui.utils import info, error, warning
     from gui.account_manager import (
         list_accounts_data,
+        get_account_index,
         add_account_snapshot,
         switch_account,
-        delete_account
+        switch_to_next_account,
+        set_rotation_options,
+        list_account_generations,
+        delete_account,
+        launch_account_instances,
+        close_account_instance,
+        list_account_instances,
+        prepare_account_profiles
     )
-    from gui.process_manager import start_antigravity, close_antigravity
+    from gui.process_manager import start_antigravity, close_antigravity, get_process_watcher, ResourceSampler
+    from gui.backup_manager import migrate_backups_to_v2, verify_backups_report
+    from gui.backup_maintenance import run_maintenance
+    from gui.backup_archive import export_accounts, import_accounts
+    from gui.maintenance_scheduler import get_maintenance_scheduler
+    from gui.config_manager import get_config
+    from gui.event_log import iter_events, filter_events, summarize_events, parse_since
 except ImportError as e:
     print(f"Import Error: {e}")
     sys.exit(1)
@@ -33,20 +52,24 @@ def show_menu():
     print("  4. 🗑️  删除备份")
     print("  5. ▶️  启动 Antigravity")
     print("  6. ⏹️  关闭 Antigravity")
+    print("  7. ⏭️  轮换到下一个账号")
     print("  0. 🚪 退出")
     print("-"*50)
 
-def list_accounts():
+def list_accounts(query=None, offset=0, limit=None, sort="last_used"):
     """列出所有账号"""
-    accounts = list_accounts_data()
+    accounts = list_accounts_data(query=query, offset=offset, limit=limit, sort=sort)
     if not accounts:
-        info("暂无存档")
+        info("暂无存档" if not query else f"没有匹配 '{query}' 的存档")
         return []
     else:
         print("\n" + "="*50)
-        info(f"共有 {len(accounts)} 个存档:")
+        if len(accounts) == accounts.total:
+            info(f"共有 {accounts.total} 个存档:")
+        else:
+            info(f"共有 {accounts.total} 个存档，显示第 {offset + 1}-{offset + len(accounts)} 个:")
         print("="*50)
-        for idx, acc in enumerate(accounts, 1):
+        for idx, acc in enumerate(accounts, offset + 1):
             print(f"\n{idx}. {acc['name']}")
             print(f"   📧 邮箱: {acc['email']}")
             print(f"   🆔 ID: {acc['id']}")
@@ -136,7 +159,7 @@ def interactive_mode():
     """交互式菜单模式"""
     while True:
         show_menu()
-        choice = input("请输入选项 (0-6): ").strip()
+        choice = input("请输入选项 (0-7): ").strip()
         
         if choice == "1":
             list_accounts()
@@ -164,6 +187,14 @@ def interactive_mode():
             close_antigravity()
             input("\n按回车键继续...")
             
+        elif choice == "7":
+            print()
+            if switch_to_next_account():
+                info("✅ 切换成功！")
+            else:
+                error("❌ 切换失败！")
+            input("\n按回车键继续...")
+            
         elif choice == "0":
             print("\n👋 再见！")
             sys.exit(0)
@@ -178,7 +209,11 @@ def cli_mode():
     subparsers = parser.add_subparsers(dest="command", help="可用命令")
 
     # List
-    subparsers.add_parser("list", help="列出所有存档")
+    list_parser = subparsers.add_parser("list", help="列出所有存档")
+    list_parser.add_argument("--query", "-q", help="按名称或邮箱搜索")
+    list_parser.add_argument("--offset", type=int, default=0, help="分页起始位置")
+    list_parser.add_argument("--limit", type=int, default=None, help="每页数量")
+    list_parser.add_argument("--sort", default="last_used", choices=["last_used", "created_at", "name", "email"], help="排序方式")
 
     # Add
     add_parser = subparsers.add_parser("add", help="将当前状态保存为新存档")
@@ -187,20 +222,86 @@ def cli_mode():
 
     # Switch
     switch_parser = subparsers.add_parser("switch", help="切换到指定存档")
-    switch_parser.add_argument("--id", "-i", required=True, help="存档 ID")
+    switch_target = switch_parser.add_mutually_exclusive_group(required=True)
+    switch_target.add_argument("--id", "-i", help="存档 ID")
+    switch_target.add_argument("--next", action="store_true", help="自动切换到最久未使用的存档")
+    switch_parser.add_argument("--exclude", "-x", action="append", default=[], help="轮换时排除的存档 ID 或序号 (可重复)")
+    switch_parser.add_argument("--generation", "-g", type=int, default=0, help="恢复的历史版本 (0 = 最新，1 = 上一个版本 ...)")
+    switch_parser.add_argument("--wait", action="store_true", default=None, help="等待 Antigravity 启动就绪 (已打开 state.vscdb) 后再返回")
+    switch_parser.add_argument("--strategy", "-s", choices=["restore", "swap", "instance"], help="切换方式 (默认使用配置 switch_strategy)")
+
+    # History
+    history_parser = subparsers.add_parser("history", help="列出存档的历史版本")
+    history_parser.add_argument("--id", "-i", required=True, help="存档 ID")
+
+    # Rotation
+    rotation_parser = subparsers.add_parser("rotation", help="设置存档的轮换参数")
+    rotation_parser.add_argument("--id", "-i", required=True, help="存档 ID")
+    rotation_parser.add_argument("--weight", "-w", type=float, help="轮换权重 (越大越常被选中)")
+    rotation_group = rotation_parser.add_mutually_exclusive_group()
+    rotation_group.add_argument("--exclude", dest="excluded", action="store_true", default=None, help="排除在自动轮换之外")
+    rotation_group.add_argument("--include", dest="excluded", action="store_false", help="重新加入自动轮换")
 
     # Delete
     del_parser = subparsers.add_parser("delete", help="删除存档")
     del_parser.add_argument("--id", "-i", required=True, help="存档 ID")
     
+    # Backup maintenance
+    subparsers.add_parser("migrate", help="将旧格式 (1.x) 备份原地迁移为 v2 格式")
+    export_parser = subparsers.add_parser("export", help="将多个存档导出为一个归档文件 (tar.gz 或 zip)")
+    export_parser.add_argument("--id", "-i", action="append", dest="ids", default=[], help="要导出的存档 ID 或序号 (可多次指定，默认全部)")
+    export_parser.add_argument("--output", "-o", help="输出文件，'-' 表示标准输出 (默认 antigravity_accounts_<时间>.tar.gz)")
+    export_parser.add_argument("--format", "-f", choices=["tar", "zip"], help="归档格式 (默认根据文件扩展名)")
+    import_parser = subparsers.add_parser("import", help="从归档文件或备份目录批量导入存档 (按邮箱去重，保留最新)")
+    import_parser.add_argument("source", help="归档文件 (tar.gz / zip)、备份目录，或 '-' 从标准输入读取 tar 流")
+    import_parser.add_argument("--workers", "-w", type=int, help="并行线程数 (默认根据 CPU 数量)")
+    maintain_parser = subparsers.add_parser("maintain", help="清理过期/孤立备份、残留临时文件与无引用数据块")
+    maintain_parser.add_argument("--dry-run", action="store_true", help="只报告将清理的内容，不实际删除")
+    daemon_parser = subparsers.add_parser("daemon", help="在后台空闲时定期执行备份维护 (保留策略、清理、增量验证)")
+    daemon_parser.add_argument("--once", action="store_true", help="只在到期时执行一次后退出 (适合 cron)")
+    daemon_parser.add_argument("--force", action="store_true", help="与 --once 一起使用: 忽略执行间隔立即执行")
+    verify_parser = subparsers.add_parser("verify", help="并行验证所有备份 (未变化的文件使用缓存结果)")
+    verify_parser.add_argument("--no-cache", action="store_true", help="忽略缓存，重新验证所有文件")
+    verify_parser.add_argument("--workers", "-w", type=int, help="并行线程数 (默认根据 CPU 数量)")
+
     # Process Control
-    subparsers.add_parser("start", help="启动 Antigravity")
-    subparsers.add_parser("stop", help="关闭 Antigravity")
+    start_parser = subparsers.add_parser("start", help="启动 Antigravity")
+    start_parser.add_argument("--wait", action="store_true", help="等待 Antigravity 启动就绪 (已打开 state.vscdb) 后再返回")
+    start_parser.add_argument("--timeout", type=float, default=None, help="等待就绪的超时时间 (秒，默认使用配置 ready_timeout)")
+    stop_parser = subparsers.add_parser("stop", help="关闭 Antigravity")
+    stop_parser.add_argument("--id", "-i", help="只关闭该存档的独立实例")
+    launch_parser = subparsers.add_parser("launch", help="以独立实例 (--user-data-dir) 启动存档，可同时运行多个账号")
+    launch_parser.add_argument("--id", "-i", action="append", dest="ids", required=True, help="存档 ID 或序号 (可多次指定，并行启动)")
+    launch_parser.add_argument("--wait", action="store_true", default=None, help="等待实例启动就绪 (已打开 state.vscdb) 后再返回")
+    launch_parser.add_argument("--reseed", action="store_true", help="实例未运行时，用备份重新创建实例数据库")
+    subparsers.add_parser("instances", help="列出存档的独立实例")
+    prepare_parser = subparsers.add_parser("prepare", help="为存档预先生成数据库，供 swap 切换方式使用")
+    prepare_parser.add_argument("--id", "-i", action="append", dest="ids", default=[], help="存档 ID 或序号 (可多次指定，默认全部)")
+    watch_parser = subparsers.add_parser("watch", help="监视 Antigravity 运行状态，每个事件输出一行 JSON (NDJSON)")
+    watch_parser.add_argument("--no-state", action="store_true", help="不输出启动时的当前状态，只输出状态变化")
+    top_parser = subparsers.add_parser("top", help="显示 Antigravity 进程树的 CPU、内存、线程与句柄占用")
+    top_parser.add_argument("--interval", "-i", type=float, default=2.0, help="采样间隔 (秒)")
+    top_parser.add_argument("--count", "-n", type=int, default=0, help="采样次数后退出 (0 = 持续运行)")
+    top_parser.add_argument("--json", action="store_true", help="每个样本输出一行 JSON (NDJSON)，details 为各进程明细")
+    events_parser = subparsers.add_parser("events", help="查询结构化事件日志 (需开启配置 structured_logging)")
+    events_parser.add_argument("--event", "-e", help="事件名，支持通配符 (例如 'db_manager.*'、switch)")
+    events_parser.add_argument("--level", "-l", choices=["INFO", "WARN", "ERR", "DBUG"], help="日志级别")
+    events_parser.add_argument("--account", "-a", help="存档 ID 或序号")
+    events_parser.add_argument("--since", "-s", help="起始时间: 相对时长 (30s, 15m, 2h, 7d) 或 ISO 时间")
+    events_parser.add_argument("--min-duration", type=float, help="只显示耗时不少于该秒数的事件")
+    events_parser.add_argument("--archives", action="store_true", help="同时读取已轮转的压缩归档")
+    events_parser.add_argument("--limit", "-n", type=int, default=50, help="最多显示最近的多少条 (0 = 全部)")
+    events_parser.add_argument("--stats", action="store_true", help="按事件汇总次数、耗时分布、重试次数与字节数")
+    events_parser.add_argument("--json", action="store_true", help="输出 JSON (每行一条记录或一个汇总)")
 
     args = parser.parse_args()
 
+    # 加载配置 (同时应用日志相关设置)；日志输出到 stderr，不混入 events/watch 等命令的输出
+    with contextlib.redirect_stdout(sys.stderr):
+        get_config()
+
     if args.command == "list":
-        list_accounts()
+        list_accounts(query=args.query, offset=args.offset, limit=args.limit, sort=args.sort)
 
     elif args.command == "add":
         if add_account_snapshot(args.name, args.email):
@@ -208,17 +309,56 @@ def cli_mode():
         else:
             sys.exit(1)
 
+    elif args.command == "switch" and args.next:
+        exclude = []
+        for item in args.exclude:
+            real_id = resolve_id(item)
+            if not real_id:
+                error(f"无效的 ID 或序号: {item}")
+                sys.exit(1)
+            exclude.append(real_id)
+
+        if switch_to_next_account(exclude=exclude, wait_ready=args.wait, strategy=args.strategy):
+            info("切换成功")
+        else:
+            sys.exit(1)
+
     elif args.command == "switch":
         real_id = resolve_id(args.id)
         if not real_id:
             error(f"无效的 ID 或序号: {args.id}")
             sys.exit(1)
             
-        if switch_account(real_id):
+        if switch_account(real_id, generation=args.generation, wait_ready=args.wait, strategy=args.strategy):
             info("切换成功")
         else:
             sys.exit(1)
 
+    elif args.command == "history":
+        real_id = resolve_id(args.id)
+        if not real_id:
+            error(f"无效的 ID 或序号: {args.id}")
+            sys.exit(1)
+
+        generations = list_account_generations(real_id)
+        if not generations:
+            error("无法读取该存档的备份")
+            sys.exit(1)
+        for item in generations:
+            label = "当前" if item["generation"] == 0 else f"#{item['generation']}"
+            print(f"{label:>4}  ⏰ {item['backup_time']}  ({item['size']} bytes)")
+
+    elif args.command == "rotation":
+        real_id = resolve_id(args.id)
+        if not real_id:
+            error(f"无效的 ID 或序号: {args.id}")
+            sys.exit(1)
+
+        if set_rotation_options(real_id, weight=args.weight, excluded=args.excluded):
+            info("轮换参数已更新")
+        else:
+            sys.exit(1)
+
     elif args.command == "delete":
         real_id = resolve_id(args.id)
         if not real_id:
@@ -230,12 +370,202 @@ def cli_mode():
         else:
             sys.exit(1)
             
+    elif args.command == "migrate":
+        _, failed = migrate_backups_to_v2()
+        if failed:
+            sys.exit(1)
+
+    elif args.command == "export":
+        account_ids = None
+        if args.ids:
+            account_ids = []
+            for item in args.ids:
+                real_id = resolve_id(item)
+                if not real_id:
+                    error(f"无效的 ID 或序号: {item}")
+                    sys.exit(1)
+                account_ids.append(real_id)
+
+        output = args.output
+        if not output:
+            from datetime import datetime
+            suffix = "zip" if args.format == "zip" else "tar.gz"
+            output = f"antigravity_accounts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{suffix}"
+
+        report = export_accounts(output, account_ids=account_ids, fmt=args.format)
+        if report["failed"]:
+            sys.exit(1)
+
+    elif args.command == "import":
+        report = import_accounts(args.source, workers=args.workers)
+        if report["failed"]:
+            sys.exit(1)
+
+    elif args.command == "maintain":
+        try:
+            run_maintenance(dry_run=args.dry_run)
+        except RuntimeError as e:
+            error(str(e))
+            sys.exit(1)
+
+    elif args.command == "daemon":
+        scheduler = get_maintenance_scheduler()
+        if args.once:
+            if scheduler.run_once(force=args.force) is None:
+                info("维护未到期或正在其他进程中执行")
+        else:
+            info(f"维护守护进程已启动 (间隔 {scheduler.interval_seconds / 3600:g} 小时)，按 Ctrl+C 退出")
+            scheduler.run_forever()
+
+    elif args.command == "verify":
+        report = verify_backups_report(use_cache=not args.no_cache, workers=args.workers)
+        if report["invalid"]:
+            sys.exit(1)
+
     elif args.command == "start":
-        start_antigravity()
+        timeout = args.timeout or get_config().get("ready_timeout", 30)
+        if not start_antigravity(wait_ready=args.wait, ready_timeout=timeout):
+            sys.exit(1)
         
+    elif args.command == "stop" and args.id:
+        real_id = resolve_id(args.id)
+        if not real_id:
+            error(f"无效的 ID 或序号: {args.id}")
+            sys.exit(1)
+        if not close_account_instance(real_id):
+            sys.exit(1)
+
     elif args.command == "stop":
         close_antigravity()
 
+    elif args.command == "launch":
+        account_ids = []
+        for item in args.ids:
+            real_id = resolve_id(item)
+            if not real_id:
+                error(f"无效的 ID 或序号: {item}")
+                sys.exit(1)
+            account_ids.append(real_id)
+
+        results = launch_account_instances(account_ids, wait_ready=args.wait, reseed=args.reseed)
+        if not all(results.values()):
+            sys.exit(1)
+
+    elif args.command == "prepare":
+        account_ids = None
+        if args.ids:
+            account_ids = []
+            for item in args.ids:
+                real_id = resolve_id(item)
+                if not real_id:
+                    error(f"无效的 ID 或序号: {item}")
+                    sys.exit(1)
+                account_ids.append(real_id)
+
+        results = prepare_account_profiles(account_ids)
+        info(f"已准备 {sum(results.values())}/{len(results)} 个存档的数据库")
+        if not all(results.values()):
+            sys.exit(1)
+
+    elif args.command == "instances":
+        instances = list_account_instances()
+        if not instances:
+            info("暂无独立实例")
+        for item in instances:
+            status = f"运行中 (PID {item['pids'][0]}, {len(item['pids'])} 个进程)" if item["pids"] else "未运行"
+            print(f"{item['name']} ({item['email']})  {status}")
+            print(f"   📁 {item['user_data_dir']}")
+
+    elif args.command == "watch":
+        out = sys.stdout
+        lock = threading.Lock()
+
+        def emit(event):
+            with lock:
+                out.write(json.dumps(event, ensure_ascii=False) + "\n")
+                out.flush()
+
+        # 日志输出到 stderr，stdout 只包含事件
+        with contextlib.redirect_stdout(sys.stderr):
+            unsubscribe = get_process_watcher().subscribe(emit, replay=not args.no_state)
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                unsubscribe()
+
+    elif args.command == "top":
+        out = sys.stdout
+        sampler = ResourceSampler(interval=args.interval)
+        with contextlib.redirect_stdout(sys.stderr):
+            try:
+                # 第一次采样只建立 CPU 基线
+                sampler.sample()
+                shown = 0
+                while not args.count or shown < args.count:
+                    time.sleep(args.interval)
+                    cpu_start = time.thread_time()
+                    sample = sampler.sample()
+                    cost = time.thread_time() - cpu_start
+                    processes = sorted(sampler.latest_processes(), key=lambda p: p["cpu_percent"], reverse=True)
+                    if args.json:
+                        out.write(json.dumps(dict(sample, details=processes), ensure_ascii=False) + "\n")
+                    else:
+                        if out.isatty():
+                            out.write("\033[H\033[J")
+                        account = sample["account"] or {}
+                        out.write(f"账号: {account.get('name') or '-'} ({account.get('email') or '-'})   "
+                                  f"采样开销 {cost * 1000:.1f} ms ({cost / args.interval * 100:.2f}% CPU)\n")
+                        if not sample["running"]:
+                            out.write("Antigravity 未运行\n")
+                        else:
+                            out.write(f"合计: {sample['processes']} 个进程, CPU {sample['cpu_percent']:.1f}%, "
+                                      f"内存 {sample['rss_bytes'] / 1024 / 1024:.1f} MB, "
+                                      f"线程 {sample['threads']}, 句柄 {sample['handles']}\n\n")
+                            out.write(f"{'PID':>7} {'CPU%':>6} {'RSS (MB)':>9} {'线程':>5} {'句柄':>5}  名称\n")
+                            for p in processes:
+                                out.write(f"{p['pid']:>7} {p['cpu_percent']:>6.1f} {p['rss_bytes'] / 1024 / 1024:>9.1f} "
+                                          f"{p['threads']:>5} {p['handles']:>5}  {p['name']}\n")
+                    out.flush()
+                    shown += 1
+            except KeyboardInterrupt:
+                pass
+
+    elif args.command == "events":
+        account_id = None
+        if args.account:
+            account_id = resolve_id(args.account) or args.account
+        try:
+            since = parse_since(args.since) if args.since else None
+        except ValueError:
+            error(f"无效的时间: {args.since}")
+            sys.exit(1)
+
+        events = filter_events(iter_events(archives=args.archives), event=args.event, level=args.level,
+                               account_id=account_id, since=since, min_duration=args.min_duration)
+        if args.stats:
+            summary = summarize_events(events)
+            if args.json:
+                for item in summary:
+                    print(json.dumps(item, ensure_ascii=False))
+            else:
+                def ms(seconds):
+                    return "-" if seconds is None else f"{seconds * 1000:.1f}"
+
+                print(f"{'事件':<36} {'次数':>6} {'错误':>5} {'平均(ms)':>9} {'p50(ms)':>9} {'p95(ms)':>9} {'最大(ms)':>9} {'重试':>5} {'字节':>10}")
+                for item in summary:
+                    print(f"{item['event']:<36} {item['count']:>6} {item['errors']:>5} {ms(item['avg_seconds']):>9} "
+                          f"{ms(item['p50_seconds']):>9} {ms(item['p95_seconds']):>9} {ms(item['max_seconds']):>9} {item['retries']:>5} {item['bytes']:>10}")
+        else:
+            records = deque(events, maxlen=args.limit or None)
+            for record in records:
+                if args.json:
+                    print(json.dumps(record, ensure_ascii=False))
+                    continue
+                duration = f" {record['duration'] * 1000:.1f}ms" if isinstance(record.get("duration"), (int, float)) else ""
+                print(f"{record.get('ts')} {record.get('level', ''):<4} {record.get('event')}{duration}  {record.get('msg')}")
+
     else:
         # 没有参数时，进入交互式模式
         interactive_mode()
@@ -250,18 +580,17 @@ def main():
 
 def resolve_id(input_id):
     """解析 ID，支持 UUID 或 序号"""
-    accounts = list_accounts_data()
-    
     # 1. 尝试作为序号处理
     if input_id.isdigit():
         idx = int(input_id)
-        if 1 <= idx <= len(accounts):
-            return accounts[idx-1]['id']
+        if idx >= 1:
+            page = list_accounts_data(offset=idx-1, limit=1)
+            if page:
+                return page[0]['id']
             
     # 2. 尝试作为 UUID 匹配
-    for acc in accounts:
-        if acc['id'] == input_id:
-            return input_id
+    if input_id in get_account_index().accounts:
+        return input_id
             
     return None
 
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Isolated Instance Tests
+Launches a stub Antigravity through the antigravity_executable setting and checks
+that the instance is seeded from the account backup, found by list_instances(),
+left alone by the default-instance checks and closed again
+
+The stub is a shell script named "antigravity": its process name matches like the
+real launcher script, it holds the instance's state.vscdb open (which is how
+wait_until_ready detects readiness) and idles until terminated.
+
+Usage (Linux only):
+    python -m unittest discover tests
+"""
+import os
+import platform
+import shutil
+import sqlite3
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "gui"))
+
+STUB_SCRIPT = """#!/bin/sh
+for arg in "$@"; do
+    case "$arg" in
+        --user-data-dir=*) dir="${arg#--user-data-dir=}" ;;
+    esac
+done
+exec 3<"$dir/User/globalStorage/state.vscdb"
+trap 'exit 0' TERM INT
+while :; do sleep 0.1; done
+"""
+
+_home = None
+_old_home = None
+
+
+def setUpModule():
+    global _home, _old_home
+    if platform.system() != "Linux":
+        raise unittest.SkipTest("The stub executable is a Linux shell script")
+    # Every data path is derived from the home directory
+    _home = tempfile.mkdtemp(prefix="agm-instances-")
+    _old_home = os.environ.get("HOME")
+    os.environ["HOME"] = _home
+
+
+def tearDownModule():
+    if _old_home is not None:
+        os.environ["HOME"] = _old_home
+    shutil.rmtree(_home, ignore_errors=True)
+
+
+def _read_auth(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT value FROM ItemTable WHERE key = 'antigravityAuthStatus'").fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+
+class InstanceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from account_manager import get_app_data_dir, save_accounts
+        from config_manager import get_config
+        from db_manager import update_backup
+
+        stub = os.path.join(_home, "bin", "antigravity")
+        os.makedirs(os.path.dirname(stub))
+        with open(stub, "w") as f:
+            f.write(STUB_SCRIPT)
+        os.chmod(stub, os.stat(stub).st_mode | stat.S_IXUSR)
+        get_config().update({"antigravity_executable": stub, "ready_timeout": 10})
+
+        backups_dir = get_app_data_dir() / "backups"
+        backups_dir.mkdir(exist_ok=True)
+        cls.account_id = "3b4e1f0c-2d6a-4c8e-9f10-1a2b3c4d5e6f"
+        backup_file = str(backups_dir / f"{cls.account_id}.json")
+        # Two versions: generation 1 holds "token-old", the current backup "token-new"
+        for token in ("token-old", "token-new"):
+            data = {"account_email": "stub@example.com", "backup_time": token,
+                    "antigravityAuthStatus": token}
+            assert update_backup(data, backup_file, generations=2)
+        save_accounts({cls.account_id: {
+            "id": cls.account_id, "name": "stub", "email": "stub@example.com",
+            "backup_file": backup_file, "created_at": "2024-01-01T00:00:00",
+            "last_used": "2024-01-01T00:00:00",
+        }})
+
+    def tearDown(self):
+        from account_manager import close_account_instance, get_instance_dir
+        close_account_instance(self.account_id)
+        # Each test seeds its own instance database
+        shutil.rmtree(get_instance_dir(self.account_id), ignore_errors=True)
+
+    def _instance(self):
+        from account_manager import get_instance_dir
+        from process_manager import instance_db_path, list_instances
+
+        instance_dir = str(get_instance_dir(self.account_id))
+        return list_instances().get(instance_dir, []), str(instance_db_path(instance_dir))
+
+    def test_launch_list_close(self):
+        from account_manager import close_account_instance, launch_account_instance
+
+        self.assertTrue(launch_account_instance(self.account_id, wait_ready=True))
+        pids, db_path = self._instance()
+        self.assertEqual(len(pids), 1)
+        self.assertEqual(_read_auth(db_path), "token-new")
+
+        self.assertTrue(close_account_instance(self.account_id))
+        pids, _ = self._instance()
+        self.assertEqual(pids, [])
+
+    def test_default_instance_operations_skip_instances(self):
+        from account_manager import launch_account_instance
+        from process_manager import close_antigravity, get_process_tracker, is_process_running
+
+        self.assertTrue(launch_account_instance(self.account_id, wait_ready=True))
+        get_process_tracker().refresh()
+        # The running instance is not the default Antigravity, and stopping that leaves it alone
+        self.assertFalse(is_process_running())
+        self.assertTrue(close_antigravity(timeout=2))
+        pids, _ = self._instance()
+        self.assertEqual(len(pids), 1)
+
+    def test_generation_reseeds_existing_instance(self):
+        from account_manager import close_account_instance, launch_account_instance
+
+        self.assertTrue(launch_account_instance(self.account_id, wait_ready=True))
+        # A running instance keeps its own database
+        self.assertFalse(launch_account_instance(self.account_id, generation=1))
+        self.assertTrue(close_account_instance(self.account_id))
+
+        self.assertTrue(launch_account_instance(self.account_id, generation=1, wait_ready=True))
+        _, db_path = self._instance()
+        self.assertEqual(_read_auth(db_path), "token-old")
+
+
+if __name__ == "__main__":
+    unittest.main()